@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+USER_KEY = 'auth:user:{}'
+# Bumped by invalidate_users(): entries cached under an older stamp are ignored
+USERS_STAMP_KEY = 'auth:users:stamp'
+# The only user fields cached: what authentication and the permission checks read. The
+# password hash and the personal details stay in the database; a cached user loads them,
+# like any deferred field, if a view reads them.
+CACHED_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+
+class LocalUserCache:
+    """
+    Bounded LRU of users (their CACHED_FIELDS values) with a short TTL, in front of the
+    shared cache. The TTL bounds how long another process's change to a user can go
+    unnoticed here.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user):
+        with self.lock:
+            self.entries[user_id] = (user, time.monotonic() + getattr(settings, 'AUTH_USER_CACHE_LOCAL_TTL', 5))
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000):
+                self.entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_users = LocalUserCache()
+
+
+def get_cache():
+    return caches[getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')]
+
+
+def invalidate_user(user_id):
+    """
+    Drop a user from this process's LRU and from the shared cache, now and again
+    on commit, so a copy read by a concurrent request before the commit is dropped too.
+    """
+    def delete():
+        local_users.delete(str(user_id))
+        get_cache().delete(USER_KEY.format(user_id))
+    delete()
+    transaction.on_commit(delete)
+
+
+def invalidate_users():
+    """
+    Drop every cached user. For changes that send no post_save signal, which
+    invalidate_user() relies on: User.objects.filter(...).update(is_active=False)
+    must be followed by this call, or the users stay authenticated until
+    AUTH_USER_CACHE_TTL.
+    """
+    def bump():
+        local_users.clear()
+        get_cache().set(USERS_STAMP_KEY, time.time_ns(), timeout=None)
+    bump()
+    transaction.on_commit(bump)
+
+
+def _cached_attnames():
+    # In the model's field order, which Model.from_db expects the values in
+    return [field.attname for field in get_user_model()._meta.concrete_fields if field.name in CACHED_FIELDS]
+
+
+def cached_values(user):
+    return tuple(getattr(user, name) for name in _cached_attnames())
+
+
+def cached_user(values):
+    """
+    A user from its cached_values(), the other fields deferred: saving it only
+    writes the cached fields, so it never blanks the password.
+    """
+    model = get_user_model()
+    return model.from_db(model._default_manager.db, _cached_attnames(), values)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that loads the token's user from the local LRU, then the
+    shared cache, and only then from the database, instead of on every request.
+    Entries are dropped when the user is saved or deleted (including password
+    changes and deactivation); bulk updates must call invalidate_users().
+    AUTH_USER_CACHE=False turns the cache off.
+    """
+
+    def get_user(self, validated_token):
+        if not getattr(settings, 'AUTH_USER_CACHE', True):
+            return super().get_user(validated_token)
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        values = local_users.get(user_id)
+        if values is None:
+            # One round trip: the entry is only valid under the current stamp
+            cache = get_cache()
+            found = cache.get_many([USER_KEY.format(user_id), USERS_STAMP_KEY])
+            stamp = found.get(USERS_STAMP_KEY)
+            if stamp is None: # Never set, or evicted: entries stamped before are not trusted
+                stamp = time.time_ns()
+                if not cache.add(USERS_STAMP_KEY, stamp, timeout=None):
+                    stamp = cache.get(USERS_STAMP_KEY)
+            entry = found.get(USER_KEY.format(user_id))
+            if entry is not None and entry[0] == stamp:
+                values = entry[1]
+            else:
+                user = super().get_user(validated_token) # Also rejects unknown and inactive users
+                values = cached_values(user)
+                cache.set(USER_KEY.format(user_id), (stamp, values), timeout=getattr(settings, 'AUTH_USER_CACHE_TTL', 300))
+            local_users.set(user_id, values)
+        # A new instance each time, so that a view changing request.user never changes the cache
+        user = cached_user(values)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
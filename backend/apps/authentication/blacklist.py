@@ -0,0 +1,204 @@
+import hashlib
+import math
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.core import metrics
+from apps.core.pagination import estimate_count
+
+GENERATION_KEY = 'auth:blacklist-generation'
+
+
+class BloomFilter:
+    """
+    Approximate set: `key in filter` is always True for added keys, and True for
+    other keys with probability about `error_rate` while at most `capacity` keys are added.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def expected_error_rate(self):
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class BlacklistFilter:
+    """
+    Per-process Bloom filter of the blacklisted token ids, so that checking a token
+    that is not blacklisted (almost all of them) needs no database query.
+
+    It is kept in sync incrementally: blacklisting bumps a generation in the shared
+    cache, and a check that sees a new generation first loads the rows blacklisted
+    since AUTH_BLACKLIST_FILTER_SYNC_MARGIN seconds before the last sync, so that a
+    row committed late, or stamped by a server whose clock is behind, is not missed.
+    Ids re-read within that margin are not added twice. It is rebuilt from scratch
+    every AUTH_BLACKLIST_FILTER_REBUILD seconds, dropping pruned tokens, or when it
+    holds more ids than it was sized for.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.filter = None
+            self.generation = None
+            self.synced_since = None
+            self.recent = {} # jti: blacklisted_at of the ids added since synced_since
+            self.built_at = 0
+            self.stats = Counter()
+
+    def might_contain(self, jti):
+        self.sync()
+        return jti in self.filter
+
+    def add(self, jti):
+        with self.lock:
+            if self.filter is not None and jti not in self.recent:
+                self.filter.add(jti)
+                self.recent[jti] = timezone.now()
+
+    def sync(self):
+        generation = _generation()
+        with self.lock:
+            expired = time.monotonic() - self.built_at > getattr(settings, 'AUTH_BLACKLIST_FILTER_REBUILD', 3600)
+            if self.filter is None or expired or self.filter.count > self.filter.capacity:
+                self._rebuild()
+            elif generation != self.generation:
+                self._load(BlacklistedToken.objects.filter(blacklisted_at__gte=self.synced_since))
+            self.generation = generation
+
+    def _rebuild(self):
+        count = BlacklistedToken.objects.count()
+        self.filter = BloomFilter(
+            capacity=max(getattr(settings, 'AUTH_BLACKLIST_FILTER_CAPACITY', 100000), count * 2),
+            error_rate=getattr(settings, 'AUTH_BLACKLIST_FILTER_ERROR_RATE', 0.01),
+        )
+        self.recent = {}
+        self._load(BlacklistedToken.objects.all())
+        self.built_at = time.monotonic()
+        self.stats['rebuilds'] += 1
+
+    def _load(self, queryset):
+        # Taken before reading: the next sync re-reads from a margin before it
+        since = timezone.now() - timedelta(seconds=getattr(settings, 'AUTH_BLACKLIST_FILTER_SYNC_MARGIN', 60))
+        for jti, blacklisted_at in queryset.values_list('token__jti', 'blacklisted_at').iterator(chunk_size=10000):
+            if jti not in self.recent:
+                self.filter.add(jti)
+                self.recent[jti] = blacklisted_at
+        self.recent = {jti: blacklisted_at for jti, blacklisted_at in self.recent.items() if blacklisted_at >= since}
+        self.synced_since = since
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def as_dict(self):
+        with self.lock:
+            stats = dict(self.stats)
+            bloom = self.filter
+        negatives, false_positives = stats.get('negatives', 0), stats.get('false_positives', 0)
+        not_blacklisted = negatives + false_positives
+        return {
+            **stats,
+            'false_positive_rate': false_positives / not_blacklisted if not_blacklisted else None,
+            'entries': bloom.count if bloom else 0,
+            'bits': bloom.size if bloom else 0,
+            'expected_false_positive_rate': bloom.expected_error_rate() if bloom else None,
+        }
+
+
+blacklist_filter = BlacklistFilter()
+
+
+class FilteredRefreshToken(RefreshToken):
+    """
+    Refresh token whose blacklist check asks the Bloom filter first, and the
+    database only when the filter cannot rule the token out.
+    """
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if not blacklist_filter.might_contain(jti):
+            blacklist_filter.count('negatives')
+            return
+        try:
+            super().check_blacklist()
+        except TokenError:
+            blacklist_filter.count('blacklisted')
+            raise
+        blacklist_filter.count('false_positives')
+
+
+def table_sizes():
+    return {
+        'outstanding_tokens': estimate_count(OutstandingToken.objects.all()),
+        'blacklisted_tokens': estimate_count(BlacklistedToken.objects.all()),
+    }
+
+
+def _generation():
+    cache = _get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    _get_cache().set(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def _get_cache():
+    return caches[getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')]
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def token_blacklisted(sender, instance, created, **kwargs):
+    if created:
+        blacklist_filter.add(instance.token.jti)
+        transaction.on_commit(bump_generation)
+
+
+@metrics.collector
+def _metrics():
+    stats = blacklist_filter.as_dict()
+    return [
+        *((f'auth_blacklist_filter_{name}_total', 'counter', f'Blacklist filter {name.replace("_", " ")}.', stats[name])
+          for name in sorted(blacklist_filter.stats)),
+        ('auth_blacklist_filter_entries', 'gauge', 'Token ids in the blacklist filter.', stats['entries']),
+    ]
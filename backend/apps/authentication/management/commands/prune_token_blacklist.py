@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from apps.authentication.blacklist import table_sizes
+
+
+class Command(BaseCommand):
+    help = ("Delete expired refresh tokens, and their blacklist entries, in small batches so that no "
+            "transaction holds locks for long. Meant to run periodically (e.g. daily from cron).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.05, help='Seconds to sleep between batches.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Before: {table_sizes()}')
+        now = timezone.now()
+        pruned = blacklisted = 0
+        while True:
+            with transaction.atomic():
+                # Tokens expire in creation order, so walking the primary key finds
+                # the expired ones first without needing an index on expires_at
+                ids = list(
+                    OutstandingToken.objects.filter(expires_at__lte=now)
+                    .order_by('id').values_list('id', flat=True)[:options['batch_size']]
+                )
+                if not ids:
+                    break
+                blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+                pruned += OutstandingToken.objects.filter(id__in=ids).delete()[1].get(OutstandingToken._meta.label, 0)
+            time.sleep(options['pause'])
+        self.stdout.write(f'Pruned {pruned} expired tokens, {blacklisted} of them blacklisted')
+        self.stdout.write(f'After: {table_sizes()}')
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+# Indexes for apps.authentication.search on PostgreSQL, over the lower-cased columns
+# the search compares: text_pattern_ops B-trees for `LIKE 'abc%'` prefix matches
+# whatever the database collation, and pg_trgm GIN indexes for `LIKE '%abc%'`.
+SEARCH_FIELDS = ('username', 'first_name', 'last_name')
+
+CREATE_INDEXES = "CREATE EXTENSION IF NOT EXISTS pg_trgm;\n" + "".join(
+    f"CREATE INDEX auth_user_{name}_prefix_idx ON auth_user (lower({name}) text_pattern_ops);\n"
+    f"CREATE INDEX auth_user_{name}_trgm_idx ON auth_user USING gin (lower({name}) gin_trgm_ops);\n"
+    for name in SEARCH_FIELDS
+)
+
+DROP_INDEXES = "".join(
+    f"DROP INDEX IF EXISTS auth_user_{name}_prefix_idx;\n"
+    f"DROP INDEX IF EXISTS auth_user_{name}_trgm_idx;\n"
+    for name in SEARCH_FIELDS
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEXES)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEXES)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
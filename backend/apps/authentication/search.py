@@ -0,0 +1,109 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.authentication.authentication import get_cache
+
+User = get_user_model()
+
+GENERATION_KEY = 'auth:user-search-generation'
+RESULT_KEY = 'auth:user-search:{generation}:{limit}:{query}'
+SEARCH_FIELDS = ('username', 'first_name', 'last_name')
+# Substring matches need at least one trigram to use the PostgreSQL trigram indexes;
+# shorter queries only match prefixes
+MIN_SUBSTRING_LENGTH = 3
+
+
+def search_users(query, limit):
+    """
+    Users whose username, first name or last name starts with `query`, then, for
+    queries of MIN_SUBSTRING_LENGTH characters or more, those where it appears
+    anywhere; case-insensitive, at most `limit` users, each group ordered by username.
+
+    Results are cached per query, and a query whose previous prefix (one character
+    shorter) returned fewer than `limit` users is answered from that result.
+    """
+    query = query.strip().lower()
+    if not query:
+        return []
+    cache = get_cache()
+    generation = _generation()
+    key = _result_key(generation, limit, query)
+    users = cache.get(key)
+    if users is None:
+        previous = cache.get(_result_key(generation, limit, query[:-1])) if len(query) > 1 else None
+        if previous is not None and len(previous) < limit and _same_kind(query[:-1], query):
+            users = _narrow(previous, query)
+        else:
+            users = _query(query, limit)
+        cache.set(key, users, timeout=getattr(settings, 'USER_SEARCH_CACHE_TIMEOUT', 300))
+    return users
+
+
+def _query(query, limit):
+    queryset = User.objects.alias(**{f'{name}_lower': Lower(name) for name in SEARCH_FIELDS}).order_by('username')
+    prefix = Q()
+    for name in SEARCH_FIELDS:
+        prefix |= Q(**{f'{name}_lower__startswith': query})
+    users = list(queryset.filter(prefix).values(*_values())[:limit])
+    if len(users) < limit and len(query) >= MIN_SUBSTRING_LENGTH:
+        substring = Q()
+        for name in SEARCH_FIELDS:
+            substring |= Q(**{f'{name}_lower__contains': query})
+        users += queryset.filter(substring).exclude(prefix).values(*_values())[:limit - len(users)]
+    return users
+
+
+def _narrow(users, query):
+    # Every match of a longer query matches its prefix as well, and keeps its rank group
+    prefix = [user for user in users if any(user[name].lower().startswith(query) for name in SEARCH_FIELDS)]
+    if len(query) < MIN_SUBSTRING_LENGTH:
+        return prefix
+    substring = [user for user in users if user not in prefix and any(query in user[name].lower() for name in SEARCH_FIELDS)]
+    return prefix + substring
+
+
+def _same_kind(previous, query):
+    # A prefix-only result cannot answer a query that also matches substrings
+    return len(previous) >= MIN_SUBSTRING_LENGTH or len(query) < MIN_SUBSTRING_LENGTH
+
+
+def _result_key(generation, limit, query):
+    return RESULT_KEY.format(generation=generation, limit=limit, query=hashlib.md5(query.encode()).hexdigest())
+
+
+def _values():
+    return ('id', *SEARCH_FIELDS)
+
+
+def _generation():
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex[:16], timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def invalidate():
+    """
+    Make all cached search results stale, now and again on commit.
+    """
+    def bump():
+        get_cache().set(GENERATION_KEY, uuid.uuid4().hex[:16], timeout=None)
+    bump()
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) & set(SEARCH_FIELDS):
+        invalidate()
@@ -2,6 +2,9 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+
+from apps.authentication.blacklist import FilteredRefreshToken
 
 User = get_user_model()
 
@@ -48,3 +51,10 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["id", "username", "first_name", "last_name"]
+
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    TokenRefreshSerializer checking the blacklist through the Bloom filter
+    """
+    token_class = FilteredRefreshToken
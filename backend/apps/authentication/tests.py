@@ -1,8 +1,19 @@
 import pytest
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
+from datetime import timedelta
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from apps.authentication.authentication import USER_KEY, cached_values, get_cache, invalidate_users, local_users
+from apps.authentication.blacklist import BloomFilter, blacklist_filter, bump_generation
+from apps.authentication.views import user_list
+from apps.core.models import Task
+from apps.core.query_budget import query_budget
 User = get_user_model()
 
 
@@ -34,4 +45,179 @@ def test_register():
         "username": "newuser_testuser",
         "password": "newpass123"
     })
-    assert res.status_code == 200
\ No newline at end of file
+    assert res.status_code == 200
+@pytest.mark.django_db
+def test_async_user_list_matches_sync():
+    user = User.objects.create_user(username="asyncuser", password="pass1234", first_name="Zoé")
+    User.objects.create_user(username="other", password="pass1234")
+    access = str(RefreshToken.for_user(user).access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    expected = client.get("/api/auth/users/")
+    response = async_to_sync(user_list)(RequestFactory().get("/api/auth/users/", HTTP_AUTHORIZATION=f"Bearer {access}"))
+    assert (response.status_code, response.content) == (expected.status_code, expected.content)
+
+@pytest.mark.django_db
+def test_authenticated_user_is_cached(settings):
+    user = User.objects.create_user(username="cached", password="pass1234")
+    task = Task.objects.create(title="Cached auth", created_by=user)
+    access = str(RefreshToken.for_user(user).access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    assert client.get(f"/api/tasks/{task.id}/").status_code == 200
+    # Warm: the user comes from the cache and the task from the response cache
+    with query_budget(0):
+        assert client.get(f"/api/tasks/{task.id}/").status_code == 200
+    local_users.clear() # Another process: the shared cache still answers
+    with query_budget(0):
+        assert client.get(f"/api/tasks/{task.id}/").status_code == 200
+
+    user.is_active = False
+    user.save()
+    assert client.get(f"/api/tasks/{task.id}/").status_code == 401
+    user.is_active = True
+    user.save()
+    assert client.get(f"/api/tasks/{task.id}/").status_code == 200
+    entry = get_cache().get(USER_KEY.format(user.id))
+    assert user.password not in str(entry) and entry[1] == cached_values(user)
+
+    # Bulk updates send no signal: invalidate_users() drops every cached user
+    User.objects.filter(pk=user.pk).update(is_active=False)
+    invalidate_users()
+    assert client.get(f"/api/tasks/{task.id}/").status_code == 401
+    User.objects.filter(pk=user.pk).update(is_active=True)
+    invalidate_users()
+    assert client.get(f"/api/tasks/{task.id}/").status_code == 200
+
+    user.delete()
+    assert client.get(f"/api/tasks/{task.id}/").status_code == 401
+
+    settings.AUTH_USER_CACHE = False
+    other = User.objects.create_user(username="uncached", password="pass1234")
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(other).access_token}")
+    client.get("/api/auth/users/")
+    with query_budget(2): # The user, then the list
+        assert client.get("/api/auth/users/").status_code == 200
+
+def test_bloom_filter():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"added-{i}")
+    assert all(f"added-{i}" in bloom for i in range(1000))
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+@pytest.mark.django_db
+def test_logout_blacklists_refresh_token():
+    user = User.objects.create_user(username="logout", password="pass1234")
+    refresh = RefreshToken.for_user(user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+    res = client.post("/api/auth/token/refresh/", data={"refresh": str(refresh)})
+    assert res.status_code == 200
+    # Not blacklisted: the filter answers without querying the blacklist
+    with query_budget(0):
+        assert client.post("/api/auth/token/refresh/", data={"refresh": str(refresh)}).status_code == 200
+
+    assert client.post("/api/auth/logout/", data={"refresh": str(refresh)}).status_code == 200
+    assert client.post("/api/auth/token/refresh/", data={"refresh": str(refresh)}).status_code == 401
+
+    # Another process learns about it from the generation bump
+    other = RefreshToken.for_user(user)
+    blacklist_filter.reset()
+    assert client.post("/api/auth/token/refresh/", data={"refresh": str(other)}).status_code == 200
+    BlacklistedToken.objects.bulk_create([BlacklistedToken(token=OutstandingToken.objects.get(jti=other["jti"]))])
+    bump_generation()
+    assert client.post("/api/auth/token/refresh/", data={"refresh": str(other)}).status_code == 401
+
+    stats = blacklist_filter.as_dict()
+    assert (stats["negatives"], stats["blacklisted"], stats.get("false_positives", 0)) == (1, 1, 0)
+    assert client.get("/api/auth/token/blacklist/stats/").status_code == 403
+    user.is_staff = True
+    user.save()
+    res = client.get("/api/auth/token/blacklist/stats/")
+    assert res.status_code == 200
+    assert res.data["tables"] == {"outstanding_tokens": 2, "blacklisted_tokens": 2}
+
+@pytest.mark.django_db
+def test_blacklist_filter_picks_up_late_commits():
+    user = User.objects.create_user(username="late", password="pass1234")
+    tokens = [RefreshToken.for_user(user) for _ in range(3)]
+    tokens[0].blacklist()
+    blacklist_filter.reset()
+    assert not blacklist_filter.might_contain(tokens[1]["jti"])
+
+    # Blacklisted by a transaction that committed after the sync: it is in the
+    # filter at the next sync, and the rows read again are not counted twice
+    BlacklistedToken.objects.bulk_create([BlacklistedToken(token=OutstandingToken.objects.get(jti=tokens[1]["jti"]))])
+    BlacklistedToken.objects.filter(token__jti=tokens[1]["jti"]).update(blacklisted_at=timezone.now() - timedelta(seconds=30))
+    for _ in range(2):
+        bump_generation()
+        assert blacklist_filter.might_contain(tokens[1]["jti"])
+        assert blacklist_filter.as_dict()["entries"] == 2
+    assert not blacklist_filter.might_contain(tokens[2]["jti"])
+
+@pytest.mark.django_db
+def test_prune_token_blacklist():
+    user = User.objects.create_user(username="prune", password="pass1234")
+    tokens = [RefreshToken.for_user(user) for _ in range(5)]
+    for token in tokens[:2]:
+        token.blacklist()
+    expired = [token["jti"] for token in (tokens[0], tokens[2], tokens[3])]
+    OutstandingToken.objects.filter(jti__in=expired).update(expires_at=timezone.now() - timedelta(days=1))
+
+    call_command("prune_token_blacklist", batch_size=2, pause=0, stdout=open("/dev/null", "w"))
+    assert set(OutstandingToken.objects.values_list("jti", flat=True)) == {tokens[1]["jti"], tokens[4]["jti"]}
+    assert list(BlacklistedToken.objects.values_list("token__jti", flat=True)) == [tokens[1]["jti"]]
+
+@pytest.mark.django_db
+def test_user_search():
+    user = User.objects.create_user(username="searcher", password="pass1234")
+    User.objects.create_user(username="Jane_Smith", first_name="Jane", last_name="Smith", password="pass1234")
+    User.objects.create_user(username="John_Doe", first_name="John", last_name="Doe", password="pass1234")
+    User.objects.create_user(username="Ann_Johnson", first_name="Ann", last_name="Johnson", password="pass1234")
+    client = APIClient()
+    client.force_authenticate(user)
+
+    def search(q, **params):
+        res = client.get("/api/auth/users/search/", {"q": q, **params})
+        assert res.status_code == 200
+        return [found["username"] for found in res.data]
+
+    # Prefix matches of any name first, then substring matches from 3 characters
+    assert search("j") == ["Ann_Johnson", "Jane_Smith", "John_Doe"]
+    assert search("doe") == ["John_Doe"]
+    assert search("mi") == []
+    assert search("MIT") == ["Jane_Smith"]
+    assert search("an", limit=1) == ["Ann_Johnson"]
+    assert search("ane") == ["Jane_Smith"]
+    assert search("") == []
+    assert client.get("/api/auth/users/search/", {"q": "j", "limit": "x"}).status_code == 400
+
+    # Cached, and narrowed from the shorter query's result without querying
+    with query_budget(0):
+        assert search("j") == ["Ann_Johnson", "Jane_Smith", "John_Doe"]
+        assert search("jo") == ["Ann_Johnson", "John_Doe"]
+    assert search("joh") == ["Ann_Johnson", "John_Doe"] # Also matches substrings: not narrowed from "jo"
+    with query_budget(0):
+        assert search("john") == ["Ann_Johnson", "John_Doe"]
+    User.objects.create_user(username="Johanna", password="pass1234")
+    assert search("joh") == ["Ann_Johnson", "Johanna", "John_Doe"]
+
+@pytest.mark.django_db
+def test_user_list_cursor_pagination():
+    user = User.objects.create_user(username="a_user", password="pass1234")
+    for name in ("b_user", "c_user"):
+        User.objects.create_user(username=name, password="pass1234")
+    client = APIClient()
+    client.force_authenticate(user)
+
+    assert len(client.get("/api/auth/users/").data) == 3
+    page = client.get("/api/auth/users/", {"pagination": "cursor", "page_size": 2}).data
+    assert [found["username"] for found in page["results"]] == ["a_user", "b_user"]
+    page = client.get(page["next"]).data
+    assert [found["username"] for found in page["results"]] == ["c_user"]
+    assert page["next"] is None
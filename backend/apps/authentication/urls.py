@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from apps.authentication import views
@@ -10,9 +11,12 @@ urlpatterns = [
     path('register/', views.UserRegistrationView.as_view(), name='user-register'),
     path('login/', views.UserLoginView.as_view(), name='user-login'),
     path('logout/', views.UserLogoutView.as_view(), name='user-logout'),
+    path('token/refresh/', views.TokenRefreshView.as_view(), name='token-refresh'),
+    path('token/blacklist/stats/', views.TokenBlacklistStatsView.as_view(), name='token-blacklist-stats'),
 
     # User management endpoints
-    path('users/', views.UserViewSet.as_view(), name='user-list'),
+    path('users/search/', views.UserSearchView.as_view(), name='user-search'),
+    path('users/', views.user_list if settings.TASK_ASYNC_READS else views.UserViewSet.as_view(), name='user-list'),
     # Include router URLs
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,12 +1,20 @@
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth import get_user_model
+from apps.authentication.search import search_users
+from apps.core.pagination import UserCursorPagination
+from apps.core.replicas import ReplicaReadsMixin
+from apps.core.views.asynchronous import async_read
+from rest_framework_simplejwt import views as jwt_views
+from apps.authentication.blacklist import FilteredRefreshToken, blacklist_filter, table_sizes
 from apps.authentication.serializers import (
     UserRegistrationSerializer, 
     UserLoginSerializer, 
-    UserSerializer
+    UserSerializer,
+    FilteredTokenRefreshSerializer,
 )
 
 User = get_user_model()
@@ -38,19 +46,14 @@ class UserLoginView(generics.GenericAPIView):
     permission_classes = [permissions.AllowAny]
     
     def post(self, request, *args, **kwargs):
-        print(request.data)
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        print(serializer.validated_data)
-        
         username = serializer.validated_data['username']
         password = serializer.validated_data['password']
         
         user = authenticate(request, username=username, password=password)
 
-        print(user)
-        
         if user is not None:
             refresh = RefreshToken.for_user(user)
             return Response({
@@ -72,16 +75,64 @@ class UserLogoutView(generics.GenericAPIView):
     def post(self, request, *args, **kwargs):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = FilteredRefreshToken(refresh_token)
             token.blacklist()
             return Response({'message': 'Logout successful'})
         except Exception as e:
             return Response({'error': 'Invalid token'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserViewSet(generics.ListAPIView):
+class TokenRefreshView(jwt_views.TokenRefreshView):
+    """
+    Access token refresh endpoint, checking the blacklist through the Bloom filter
+    """
+    serializer_class = FilteredTokenRefreshSerializer
+
+
+class TokenBlacklistStatsView(generics.GenericAPIView):
+    """
+    Blacklist filter metrics of this process, and blacklist table sizes
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({'filter': blacklist_filter.as_dict(), 'tables': table_sizes()})
+
+
+class UserViewSet(ReplicaReadsMixin, generics.ListAPIView):
     """
-    ViewSet for listing users
+    ViewSet for listing users, all at once or, with ?pagination=cursor, by pages of username
     """
     queryset = User.objects.all()
-    serializer_class = UserSerializer
\ No newline at end of file
+    serializer_class = UserSerializer
+    replica_actions = ('get',)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = UserCursorPagination() if self.request.query_params.get('pagination') == 'cursor' else None
+        return self._paginator
+
+
+class UserSearchView(generics.GenericAPIView):
+    """
+    Typeahead search of users for assignee pickers: ?q=<text>&limit=<at most USER_SEARCH_MAX_LIMIT>
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get('limit', settings.USER_SEARCH_LIMIT))
+        except ValueError:
+            return Response('limit must be an integer', status=status.HTTP_400_BAD_REQUEST)
+        limit = min(max(limit, 1), settings.USER_SEARCH_MAX_LIMIT)
+        return Response(search_users(request.query_params.get('q', ''), limit))
+
+
+@async_read(UserViewSet.as_view(), allow='GET, HEAD, OPTIONS')
+async def user_list(request):
+    """
+    Async version of UserViewSet, served under ASGI when TASK_ASYNC_READS is on.
+    """
+    if request.GET.get('pagination') == 'cursor':
+        return None
+    return UserSerializer([user async for user in User.objects.all()], many=True).data
@@ -0,0 +1,98 @@
+"""
+Archive tier: closed and deleted tasks that have not changed for a while are moved,
+with their history and comments, from the live tables to ArchivedTask,
+ArchivedTaskHistory and ArchivedTaskComment, and moved back by restore_task().
+
+Rows are copied with INSERT ... SELECT and deleted in the same transaction, one
+batch of tasks per transaction, so archiving can be stopped and resumed at any
+point. Task reads fall back to the archive (TaskViewSet.get_object); lists,
+counters and the delta-sync endpoint only ever see the live table.
+"""
+from collections import Counter
+
+from django.db import connections, transaction
+from django.db.models import Q
+
+from apps.core import cache as response_cache
+from apps.core import events
+from apps.core.models import (
+    ArchivedTask, ArchivedTaskComment, ArchivedTaskHistory, Task, TaskComment, TaskCounter, TaskHistory,
+)
+
+# (live model, archive model, column holding the task id)
+TABLES = [
+    (Task, ArchivedTask, 'id'),
+    (TaskHistory, ArchivedTaskHistory, 'task_id'),
+    (TaskComment, ArchivedTaskComment, 'task_id'),
+]
+
+
+def archivable(before):
+    """
+    Tasks that are closed or deleted and have not changed since `before`.
+    """
+    return Q(status__in=[Task.Status.CLOSED, Task.Status.DELETED], updated_at__lt=before)
+
+
+def archive_batch(before, batch_size=500):
+    """
+    Archive up to `batch_size` archivable tasks in one transaction; returns how many.
+    Tasks locked by a concurrent change are skipped, and left for the next run.
+    """
+    with transaction.atomic():
+        rows = list(
+            Task.objects.select_for_update(skip_locked=True).filter(archivable(before))
+            .order_by('updated_at', 'id').values_list('id', 'assigned_to_id', 'status', 'priority')[:batch_size]
+        )
+        if not rows:
+            return 0
+        task_ids = [row[0] for row in rows]
+        # Parents first on the way in, children first on the way out
+        for live, archive, column in TABLES:
+            _copy(live, archive, column, task_ids)
+        for live, archive, column in reversed(TABLES):
+            live.objects.filter(**{f'{column}__in': task_ids}).delete()
+        deltas = Counter()
+        for _, assignee_id, status, priority in rows:
+            deltas[(assignee_id or 0, status, priority)] -= 1
+        TaskCounter.adjust(deltas)
+        response_cache.invalidate(task_ids)
+        events.publish([events.task_event('task.archived', task_id, [assignee_id]) for task_id, assignee_id, _, _ in rows])
+    return len(rows)
+
+
+def restore_task(task_id):
+    """
+    Move an archived task back to the live tables; returns the Task, or None if
+    `task_id` is not archived.
+    """
+    with transaction.atomic():
+        if not ArchivedTask.objects.select_for_update().filter(pk=task_id).exists():
+            return None
+        for live, archive, column in TABLES:
+            _copy(archive, live, column, [task_id])
+        for live, archive, column in reversed(TABLES):
+            archive.objects.filter(**{column: task_id}).delete()
+        task = Task.objects.select_related('created_by', 'assigned_to', 'assigned_by', 'closed_by', 'deleted_by').get(pk=task_id)
+        TaskCounter.adjust({task.counter_key(): 1})
+        response_cache.invalidate([task_id])
+        events.publish([events.task_event('task.restored', task_id, [task.assigned_to_id], status=task.status, version=task.version)])
+    return task
+
+
+def _copy(source, target, column, task_ids):
+    """
+    INSERT INTO target (...) SELECT ... FROM source WHERE column IN task_ids, over the
+    columns both tables have (the archive adds archived_at, which defaults to now).
+    """
+    connection = connections[source.objects.db]
+    quote = connection.ops.quote_name
+    target_columns = {field.column for field in target._meta.concrete_fields}
+    columns = ', '.join(quote(field.column) for field in source._meta.concrete_fields if field.column in target_columns)
+    placeholders = ', '.join(['%s'] * len(task_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(target._meta.db_table)} ({columns}) '
+            f'SELECT {columns} FROM {quote(source._meta.db_table)} WHERE {quote(column)} IN ({placeholders})',
+            task_ids,
+        )
@@ -0,0 +1,108 @@
+import hashlib
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from apps.core import metrics
+
+# Versions are random tokens rather than counters: bumping many tasks is a single
+# set_many(), and a version lost to eviction is replaced by a fresh token instead
+# of restarting at a value that may still have responses cached under it.
+LIST_GENERATION_KEY = 'tasks:list-generation'
+TASK_VERSION_KEY = 'tasks:version:{}'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'TASK_CACHE_ALIAS', 'default')]
+
+
+def is_enabled():
+    return getattr(settings, 'TASK_RESPONSE_CACHE', True)
+
+
+def response_key(request, action, version):
+    # Pagination links are absolute URLs, so the host is part of the key
+    url_hash = hashlib.md5(f"{request.get_host()}?{request.META.get('QUERY_STRING', '')}".encode()).hexdigest()
+    return f'tasks:response:{action}:{version}:{url_hash}'
+
+
+def list_generation():
+    return _get_version(LIST_GENERATION_KEY)
+
+
+def task_version(task_id):
+    # As an int, like invalidate() gets it: "01" from a URL is the same task as 1
+    return _get_version(TASK_VERSION_KEY.format(int(task_id)))
+
+
+def invalidate(task_ids=(), lists=True):
+    """
+    Make the cached responses of the given tasks, and of the task lists, stale.
+
+    Versions are bumped right away, so later reads in the same transaction miss,
+    and again once the transaction commits, so that responses a concurrent request
+    built from pre-commit data in between are dropped as well.
+    """
+    keys = [TASK_VERSION_KEY.format(task_id) for task_id in task_ids]
+    if lists:
+        keys.append(LIST_GENERATION_KEY)
+
+    def bump():
+        get_cache().set_many({key: _new_version() for key in keys}, timeout=None)
+    bump()
+    transaction.on_commit(bump)
+
+
+def get_response(key):
+    data = get_cache().get(key)
+    _count('hits' if data is not None else 'misses')
+    return data
+
+
+def set_response(key, data):
+    get_cache().set(key, data, timeout=getattr(settings, 'TASK_CACHE_TIMEOUT', 300))
+
+
+def stats():
+    """
+    Hit and miss counts of this process since it started.
+    """
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else None}
+
+
+def _get_version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _new_version():
+    return uuid.uuid4().hex[:16]
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+@metrics.collector
+def _metrics():
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    return [
+        ('task_response_cache_hits_total', 'counter', 'Task responses served from the cache.', hits),
+        ('task_response_cache_misses_total', 'counter', 'Task responses built because they were not cached.', misses),
+    ]
@@ -0,0 +1,72 @@
+import base64
+
+from django.db import connections
+
+from apps.core.models import Task
+from apps.core.pagination import keyset_condition
+
+MAX_CHANGES = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def current_seq(using='default'):
+    """
+    Lowest change_seq a change that is not visible yet can still get: on PostgreSQL
+    the xmin of the current snapshot, since change_seq is the writing transaction's
+    id (migration 0007); elsewhere (single writer) the next value of the counter.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT txid_snapshot_xmin(txid_current_snapshot())')
+        else:
+            cursor.execute('SELECT COALESCE(MAX(change_seq), 0) + 1 FROM core_task')
+        return cursor.fetchone()[0]
+
+
+def encode_cursor(seq, task_id=0):
+    return base64.urlsafe_b64encode(f'{seq}.{task_id}'.encode()).decode()
+
+
+def decode_cursor(token):
+    try:
+        seq, task_id = base64.urlsafe_b64decode(token.encode()).decode().split('.')
+        return int(seq), int(task_id)
+    except Exception:
+        raise InvalidCursor('Invalid cursor')
+
+
+def changes_since(token, queryset=None, limit=MAX_CHANGES):
+    """
+    Tasks created or changed (including soft deletes) after the cursor, in change
+    order, with the cursor to send next time and whether more changes are waiting.
+
+    The returned cursor never moves past a transaction that has not committed yet,
+    so changes committed out of order are not missed. A task can be returned twice
+    when it changed while a long transaction was running; clients apply changes
+    as upserts. has_more is False when the cursor is held back that way, as asking
+    again before the transaction ends would only return the same changes.
+    """
+    if queryset is None:
+        queryset = Task.objects.all()
+    position = decode_cursor(token)
+    # Taken before reading the changes: whatever this read does not see is still >= safe_seq
+    safe_seq = current_seq(queryset.db)
+    tasks = list(
+        queryset.filter(keyset_condition(queryset, ['change_seq', 'id'], position))
+        .order_by('change_seq', 'id')[:limit + 1]
+    )
+    has_more = len(tasks) > limit
+    tasks = tasks[:limit]
+    if has_more and (tasks[-1].change_seq, tasks[-1].id) >= (safe_seq, 0):
+        # The page reaches past a transaction still running: the cursor stops before it,
+        # and the client must wait for it to finish instead of reading the same page again
+        position, has_more = max(position, (safe_seq, 0)), False
+    elif has_more:
+        position = (tasks[-1].change_seq, tasks[-1].id)
+    else:
+        position = max(position, (safe_seq, 0))
+    return tasks, encode_cursor(*position), has_more
@@ -0,0 +1,108 @@
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+
+from apps.core import cache as response_cache
+from apps.core.models import Task, TaskComment, TaskCounter
+
+
+def count_tasks(tasks):
+    """
+    Counter deltas for newly inserted tasks (bulk_create, COPY).
+    """
+    return Counter(task.counter_key() for task in tasks)
+
+
+def actual_counts():
+    rows = Task.objects.values_list('assigned_to', 'status', 'priority').annotate(total=Count('id')).order_by()
+    return {(assignee_id or 0, status, priority): total for assignee_id, status, priority, total in rows}
+
+
+def stored_counts():
+    rows = TaskCounter.objects.exclude(count=0).values_list('assignee_id', 'status', 'priority', 'count')
+    return {(assignee_id, status, priority): count for assignee_id, status, priority, count in rows}
+
+
+def wrong_counters():
+    """
+    {key: (stored, actual)} for every counter that does not match the Task table.
+    """
+    actual, stored = actual_counts(), stored_counts()
+    return {
+        key: (stored.get(key, 0), actual.get(key, 0))
+        for key in actual.keys() | stored.keys() if actual.get(key, 0) != stored.get(key, 0)
+    }
+
+
+@transaction.atomic
+def rebuild_counters():
+    """
+    Recompute every counter from the Task table. The counter table is locked first,
+    so transactions that change tasks wait for the rebuild instead of being lost.
+    Returns the counters that were wrong, as wrong_counters() does.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {TaskCounter._meta.db_table} IN EXCLUSIVE MODE')
+    wrong = wrong_counters()
+    actual = actual_counts()
+    TaskCounter.objects.all().delete()
+    TaskCounter.objects.bulk_create(
+        TaskCounter(assignee_id=assignee_id, status=status, priority=priority, count=count)
+        for (assignee_id, status, priority), count in actual.items()
+    )
+    return wrong
+
+
+def summary(assignee_id=None):
+    """
+    Dashboard totals read from the counter table, whose size depends on the number
+    of users and not on the number of tasks.
+    """
+    counters = TaskCounter.objects.exclude(count=0)
+    if assignee_id is not None:
+        counters = counters.filter(assignee_id=assignee_id)
+    return {
+        'by_status': list(counters.values('status').annotate(count=Sum('count')).order_by('status')),
+        'by_priority': list(counters.values('priority').annotate(count=Sum('count')).order_by('priority')),
+        'by_assignee': list(
+            counters.exclude(assignee_id=0).values('assignee_id', 'status').annotate(count=Sum('count')).order_by('assignee_id', 'status')
+        ),
+    }
+
+
+def repair_comment_counts(batch_size=1000, verify=False):
+    """
+    Recompute Task.comment_count and last_comment_at from the comments, by batches
+    of tasks. Each batch locks its tasks first, so comments added meanwhile wait
+    for it, and writes the wrong rows with one bulk update. With verify=True
+    nothing is locked or written. Returns {task_id: (stored, actual)}.
+    """
+    wrong = {}
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            tasks = Task.objects.filter(id__gt=last_id).order_by('id')
+            if not verify:
+                tasks = tasks.select_for_update()
+            rows = list(tasks.values_list('id', 'comment_count', 'last_comment_at')[:batch_size])
+            if not rows:
+                return wrong
+            last_id = rows[-1][0]
+            actual = {
+                task_id: (count, last_comment_at)
+                for task_id, count, last_comment_at in TaskComment.objects.filter(task_id__gte=rows[0][0], task_id__lte=last_id)
+                .values('task_id').annotate(count=Count('id'), last=Max('commented_at')).values_list('task_id', 'count', 'last')
+            }
+            batch = {
+                task_id: ((count, last_comment_at), actual.get(task_id, (0, None)))
+                for task_id, count, last_comment_at in rows if (count, last_comment_at) != actual.get(task_id, (0, None))
+            }
+            if batch and not verify:
+                Task.objects.bulk_update(
+                    [Task(id=task_id, comment_count=count, last_comment_at=last) for task_id, (_, (count, last)) in batch.items()],
+                    ['comment_count', 'last_comment_at'],
+                )
+                response_cache.invalidate(list(batch))
+            wrong.update(batch)
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Sent instead of the buffered events when a subscriber falls too far behind: the
+# client reloads what it shows (e.g. from /api/tasks/changes/) and keeps listening.
+RESYNC_FRAME = 'event: resync\ndata: {}\n\n'
+KEEPALIVE_FRAME = ': keepalive\n\n'
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'TASK_EVENT_BROKER', 'apps.core.events.InProcessBroker'))()
+        return _broker
+
+
+def task_channel(task_id):
+    return f'task:{task_id}'
+
+
+def assignee_channel(user_id):
+    return f'assignee:{user_id}'
+
+
+def task_event(event_type, task_id, assignee_ids=(), **data):
+    """
+    An event for the subscribers of the task and of its assignees (old and new
+    ones for a reassignment), as (channels, SSE frame).
+    """
+    channels = [task_channel(task_id)] + [assignee_channel(user_id) for user_id in set(assignee_ids) if user_id]
+    payload = json.dumps({'type': event_type, 'task': task_id, **data}, separators=(',', ':'))
+    return channels, f'event: {event_type}\ndata: {payload}\n\n'
+
+
+def change_event(task_id, previous_key, key, created=False, **data):
+    """
+    Event for a task change, from its counter keys (assignee, status, priority)
+    before and after the change. A key is None when unknown, or after a removal.
+    """
+    from apps.core.models import Task
+    if created:
+        event_type = 'task.created'
+    elif key is None:
+        event_type = 'task.deleted'
+    elif previous_key is not None and key[:2] != previous_key[:2]:
+        event_type = {
+            Task.Status.OPEN: 'task.unassigned',
+            Task.Status.ASSIGNED: 'task.assigned',
+            Task.Status.CLOSED: 'task.closed',
+            Task.Status.DELETED: 'task.deleted',
+        }[key[1]]
+    else:
+        event_type = 'task.updated'
+    if key is not None:
+        data = {'status': key[1], 'assigned_to': key[0] or None, **data}
+    return task_event(event_type, task_id, [k[0] for k in (previous_key, key) if k], **data)
+
+
+def import_events(counts):
+    """
+    One event per assignee for tasks inserted in bulk, from {counter key: count}.
+    """
+    per_assignee = defaultdict(int)
+    for (assignee_id, _, _), count in counts.items():
+        per_assignee[assignee_id] += count
+    events = []
+    for assignee_id, count in per_assignee.items():
+        if assignee_id:
+            payload = json.dumps({'type': 'tasks.imported', 'assigned_to': assignee_id, 'count': count}, separators=(',', ':'))
+            events.append(([assignee_channel(assignee_id)], f'event: tasks.imported\ndata: {payload}\n\n'))
+    return events
+
+
+def publish(events):
+    """
+    Publish events once the current transaction commits, so subscribers never
+    hear about changes that are rolled back or not visible yet.
+    """
+    if events:
+        transaction.on_commit(lambda: _publish(events))
+
+
+def _publish(events):
+    try:
+        get_broker().publish(events)
+    except Exception:
+        # Push is best effort: clients fall back on /api/tasks/changes/
+        logger.exception('Could not publish %d task events', len(events))
+
+
+class Subscription:
+    """
+    Bounded buffer of SSE frames for one client, owned by the event loop that
+    created it. When the buffer is full the pending frames are replaced by a
+    single resync frame, so a slow client never makes the server hold more than
+    `buffer_size` frames for it nor slows down the publishers.
+    """
+
+    def __init__(self, broker, channels, buffer_size):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(buffer_size)
+        self.dropped = 0
+
+    def deliver(self, frame):
+        # Runs on self.loop
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_FRAME)
+
+    async def get(self, timeout=None):
+        """
+        Next frame, or None if nothing arrived within `timeout` seconds.
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Fan-out between the threads and event loops of one process. Enough for tests
+    and single-process servers; with several processes use RedisBroker.
+    """
+
+    def __init__(self):
+        self.buffer_size = getattr(settings, 'TASK_EVENT_BUFFER', 100)
+        self.subscriptions = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, channels):
+        """
+        Must be called from the event loop that will read the subscription.
+        """
+        subscription = Subscription(self, channels, self.buffer_size)
+        with self.lock:
+            for channel in channels:
+                self.subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscribers = self.subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscriptions[channel]
+
+    def publish(self, events):
+        self.dispatch(events)
+
+    def dispatch(self, events):
+        # One call_soon_threadsafe per event loop, not per subscriber
+        deliveries = defaultdict(list)
+        with self.lock:
+            for channels, frame in events:
+                subscribers = set()
+                for channel in channels:
+                    subscribers.update(self.subscriptions.get(channel, ()))
+                for subscription in subscribers:
+                    deliveries[subscription.loop].append((subscription, frame))
+        for loop, batch in deliveries.items():
+            try:
+                loop.call_soon_threadsafe(_deliver_all, batch)
+            except RuntimeError: # Loop closed, its subscriptions are going away
+                pass
+
+
+def _deliver_all(batch):
+    for subscription, frame in batch:
+        subscription.deliver(frame)
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Events go through one Redis pub/sub channel. Each process keeps a single
+    subscriber connection per event loop and fans events out to its own clients,
+    so the number of clients does not change the number of Redis connections.
+    """
+    redis_channel = 'tasks:events'
+    reconnect_delay = 1
+
+    def __init__(self):
+        import redis
+        super().__init__()
+        self.url = settings.TASK_EVENT_REDIS_URL
+        self.client = redis.Redis.from_url(self.url)
+        self.readers = {}
+
+    def subscribe(self, channels):
+        loop = asyncio.get_running_loop()
+        if loop not in self.readers or self.readers[loop].done():
+            self.readers[loop] = loop.create_task(self.read())
+        return super().subscribe(channels)
+
+    def publish(self, events):
+        pipeline = self.client.pipeline(transaction=False)
+        for channels, frame in events:
+            pipeline.publish(self.redis_channel, json.dumps([channels, frame]))
+        pipeline.execute()
+
+    async def read(self):
+        import redis.asyncio
+        while True:
+            try:
+                client = redis.asyncio.Redis.from_url(self.url)
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.redis_channel)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self.dispatch([json.loads(message['data'])])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Task event subscriber lost its Redis connection')
+                await asyncio.sleep(self.reconnect_delay)
@@ -0,0 +1,141 @@
+import csv
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from apps.core.models import Task, TaskHistory, TaskComment
+
+User = get_user_model()
+
+FORMATS = ('csv', 'ndjson')
+
+# Exported columns per resource. Columns listed in user_columns hold user ids
+# in the database and are written as usernames.
+RESOURCES = {
+    'tasks': {
+        'model': Task,
+        'columns': ['id', 'title', 'description', 'status', 'priority', 'created_at', 'updated_at',
+                    'assigned_at', 'closed_at', 'deleted_at', 'created_by', 'assigned_to',
+                    'assigned_by', 'closed_by', 'deleted_by'],
+        'user_columns': ['created_by', 'assigned_to', 'assigned_by', 'closed_by', 'deleted_by'],
+    },
+    'history': {
+        'model': TaskHistory,
+        'columns': ['id', 'task', 'changed_at', 'changed_by', 'assigned_to', 'previous_status', 'new_status'],
+        'user_columns': ['changed_by', 'assigned_to'],
+    },
+    'comments': {
+        'model': TaskComment,
+        'columns': ['id', 'task', 'commented_at', 'commented_by', 'comment'],
+        'user_columns': ['commented_by'],
+    },
+}
+
+
+def export_rows(resource, format, queryset=None, chunk_size=2000):
+    """
+    Generate the export of a resource as text chunks, for a StreamingHttpResponse
+    or a file. Rows are read through a server-side cursor and usernames are resolved
+    once per chunk, so memory use does not depend on the number of rows.
+
+    All rows come from one snapshot: the read runs in a single REPEATABLE READ
+    transaction on PostgreSQL (SQLite transactions are already serializable).
+    """
+    spec = RESOURCES[resource]
+    if queryset is None:
+        queryset = spec['model'].objects.all()
+    columns = spec['columns']
+    user_indexes = [columns.index(column) for column in spec['user_columns']]
+    encode = _csv_encoder() if format == 'csv' else _ndjson_encoder(columns)
+
+    # SET TRANSACTION must be the first statement of the transaction. Inside an outer
+    # atomic block (e.g. in tests) the snapshot is the outer transaction's.
+    outer_transaction = connection.in_atomic_block
+    with transaction.atomic():
+        if connection.vendor == 'postgresql' and not outer_transaction:
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        if format == 'csv':
+            yield encode(columns)
+        usernames = UsernameResolver()
+        rows = queryset.order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size)
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield _encode_chunk(chunk, user_indexes, usernames, encode)
+                chunk = []
+        if chunk:
+            yield _encode_chunk(chunk, user_indexes, usernames, encode)
+
+
+async def async_chunks(chunks):
+    """
+    Async iterator over the chunks of export_rows, for a StreamingHttpResponse
+    served under ASGI, which would otherwise read a sync iterator to the end before
+    sending anything. Each chunk is produced in the request's sync thread, so the
+    export's transaction stays on the connection that thread opened it on.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # Also when the client disconnects: ends the transaction
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+class UsernameResolver:
+    """
+    Map user ids to usernames with one query per batch of unknown ids.
+    """
+
+    def __init__(self):
+        self.usernames = {None: None}
+
+    def resolve(self, ids):
+        missing = set(ids) - self.usernames.keys()
+        if missing:
+            self.usernames.update(User.objects.filter(pk__in=missing).values_list('pk', 'username'))
+        return self.usernames
+
+
+def _encode_chunk(chunk, user_indexes, usernames, encode):
+    names = usernames.resolve(row[index] for row in chunk for index in user_indexes)
+    lines = []
+    for row in chunk:
+        row = list(row)
+        for index in user_indexes:
+            row[index] = names.get(row[index])
+        lines.append(encode(row))
+    return ''.join(lines)
+
+
+def _csv_encoder():
+    line = _Line()
+    writer = csv.writer(line)
+
+    def encode(row):
+        writer.writerow(row)
+        return line.value
+    return encode
+
+
+def _ndjson_encoder(columns):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+    def encode(row):
+        return encoder.encode(dict(zip(columns, row))) + '\n'
+    return encode
+
+
+class _Line:
+    """
+    File-like object that keeps the last line written by csv.writer.
+    """
+    value = ''
+
+    def write(self, value):
+        self.value = value
@@ -0,0 +1,76 @@
+from django.db import connections
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+from django_filters import rest_framework as filters
+
+from apps.core.models import Task, TaskHistory
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
+
+class TaskFilterSet(filters.FilterSet):
+    """
+    Filters for the task list:
+
+        ?status=1  ?status__in=1,2  ?priority=0  ?priority__in=0,1
+        ?assigned_to=<user id>  ?unassigned=true  ?created_by=<user id>
+        ?created_at_after=...&created_at_before=...  (same for updated_at and closed_at)
+        ?q=<full-text search over title and description>
+    """
+    # Number filters rather than the generated choice filters, whose form fields do not
+    # work with the pinned django-filter on Django 5.
+    status = filters.NumberFilter()
+    status__in = NumberInFilter(field_name='status')
+    priority = filters.NumberFilter()
+    priority__in = NumberInFilter(field_name='priority')
+    # Plain id filters: a ModelChoiceFilter would run an extra query to validate the user
+    assigned_to = filters.NumberFilter(field_name='assigned_to_id')
+    unassigned = filters.BooleanFilter(field_name='assigned_to', lookup_expr='isnull')
+    created_by = filters.NumberFilter(field_name='created_by_id')
+    created_at = filters.IsoDateTimeFromToRangeFilter()
+    updated_at = filters.IsoDateTimeFromToRangeFilter()
+    closed_at = filters.IsoDateTimeFromToRangeFilter()
+    q = filters.CharFilter(method='search')
+
+    class Meta:
+        model = Task
+        fields = []
+
+    def search(self, queryset, name, value):
+        """
+        On PostgreSQL, match against the `search_vector` column (generated from title
+        and description, GIN indexed, see migration 0004). Elsewhere, fall back to
+        requiring every word in the title or the description.
+        """
+        value = value.strip()
+        if not value:
+            return queryset
+        if connections[queryset.db].vendor == 'postgresql':
+            return queryset.filter(RawSQL(
+                "core_task.search_vector @@ websearch_to_tsquery('english', %s)",
+                [value],
+                output_field=BooleanField(),
+            ))
+        for word in value.split():
+            queryset = queryset.filter(Q(title__icontains=word) | Q(description__icontains=word))
+        return queryset
+
+
+class TaskHistoryFilterSet(filters.FilterSet):
+    """
+    Filters for the cross-task history:
+
+        ?changed_by=<user id>  ?task=<task id>  ?assigned_to=<user id>  ?new_status=2
+        ?changed_at_after=...&changed_at_before=...
+    """
+    changed_by = filters.NumberFilter(field_name='changed_by_id')
+    task = filters.NumberFilter(field_name='task_id')
+    assigned_to = filters.NumberFilter(field_name='assigned_to_id')
+    new_status = filters.NumberFilter()
+    changed_at = filters.IsoDateTimeFromToRangeFilter()
+
+    class Meta:
+        model = TaskHistory
+        fields = []
@@ -0,0 +1,180 @@
+import csv
+import json
+import re
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.core import cache as response_cache
+from apps.core import events
+from apps.core.counters import count_tasks
+from apps.core.models import Task, TaskCounter
+
+User = get_user_model()
+
+FORMATS = ('ndjson', 'csv')
+MAX_REPORTED_ERRORS = 100
+PRIORITIES = frozenset(Task.Priority.values)
+STATUSES = frozenset(Task.Status.values)
+TITLE_MAX_LENGTH = Task._meta.get_field('title').max_length
+# What bytes that are not UTF-8 decode to with the surrogateescape error handler
+UNDECODABLE = re.compile('[\udc80-\udcff]')
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS: # Keep memory bounded on very dirty files
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def as_dict(self):
+        return {'created': self.created, 'failed': self.failed, 'errors': self.errors}
+
+
+def iter_rows(lines, format):
+    """
+    Lazily parse an iterable of byte lines (an open file, an HTTP request body)
+    into dicts, one per task. Rows that cannot be parsed, or are not valid UTF-8, are
+    yielded as None.
+    """
+    if format == 'ndjson':
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+    elif format == 'csv':
+        # Invalid UTF-8 is kept as surrogates, so that only the rows holding it fail
+        for row in csv.DictReader(line.decode('utf-8', 'surrogateescape') for line in lines):
+            undecodable = any(isinstance(value, str) and UNDECODABLE.search(value) for value in row.values())
+            yield None if undecodable else row
+    else:
+        raise ValueError(f"Unknown format {format!r}, expected one of {', '.join(FORMATS)}")
+
+
+def import_tasks(rows, created_by, batch_size=5000):
+    """
+    Validate and insert tasks chunk by chunk, so memory use depends on the batch size
+    and not on the size of the file. Each chunk is inserted in its own transaction.
+
+    Row fields: title (required), description, priority, status and assigned_to (user id).
+    """
+    result = ImportResult()
+    rows = enumerate(rows, start=1)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            return result
+        tasks = _validate_chunk(chunk, created_by, result)
+        with transaction.atomic():
+            _insert_tasks(tasks)
+            counts = count_tasks(tasks)
+            TaskCounter.adjust(counts)
+            response_cache.invalidate()
+            events.publish(events.import_events(counts))
+        result.created += len(tasks)
+
+
+def _validate_chunk(chunk, created_by, result):
+    assignee_ids = set()
+    for _, row in chunk:
+        if row and row.get('assigned_to') not in (None, ''):
+            assignee_ids.add(str(row['assigned_to']))
+    existing_ids = {
+        str(pk) for pk in User.objects.filter(pk__in=[i for i in assignee_ids if i.isdigit()]).values_list('pk', flat=True)
+    }
+    tasks = []
+    now = timezone.now()
+    for row_number, row in chunk:
+        if row is None:
+            result.add_error(row_number, {'non_field_errors': ['Invalid row']})
+            continue
+        task, errors = _build_task(row, created_by, existing_ids, now)
+        if errors:
+            result.add_error(row_number, errors)
+        else:
+            tasks.append(task)
+    return tasks
+
+
+def _build_task(row, created_by, existing_user_ids, now):
+    errors = {}
+    title = str(row.get('title') or '').strip()
+    if not title:
+        errors['title'] = ['Title is required.']
+    elif len(title) > TITLE_MAX_LENGTH:
+        errors['title'] = [f'Ensure this field has no more than {TITLE_MAX_LENGTH} characters.']
+
+    priority = _choice(row, 'priority', PRIORITIES, Task.Priority.MINOR, errors)
+
+    assigned_to_id = row.get('assigned_to')
+    if assigned_to_id in (None, ''):
+        assigned_to_id = None
+    elif str(assigned_to_id) not in existing_user_ids:
+        errors['assigned_to'] = [f'Invalid pk "{assigned_to_id}" - object does not exist.']
+    else:
+        assigned_to_id = int(assigned_to_id)
+
+    default_status = Task.Status.ASSIGNED if assigned_to_id else Task.Status.OPEN
+    status = _choice(row, 'status', STATUSES, default_status, errors)
+    if status == Task.Status.ASSIGNED and not assigned_to_id and 'assigned_to' not in errors:
+        errors['assigned_to'] = ['This field is required for assigned tasks.']
+    if errors:
+        return None, errors
+    return Task(
+        title=title,
+        description=str(row.get('description') or ''),
+        priority=priority,
+        status=status,
+        created_by=created_by,
+        assigned_to_id=assigned_to_id,
+        assigned_by=created_by if assigned_to_id else None,
+        assigned_at=now if assigned_to_id else None,
+    ), None
+
+
+def _choice(row, name, choices, default, errors):
+    value = row.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        value = None
+    if value not in choices:
+        errors[name] = [f'"{row.get(name)}" is not a valid choice.']
+    return value
+
+
+def _insert_tasks(tasks):
+    if not tasks:
+        return
+    if connection.vendor == 'postgresql':
+        _copy_tasks(tasks)
+    else:
+        Task.objects.bulk_create(tasks)
+
+
+def _copy_tasks(tasks):
+    """
+    Insert with PostgreSQL COPY, several times faster than a multi-row INSERT.
+    Values are prepared by the model fields exactly as bulk_create() would do.
+    """
+    fields = [field for field in Task._meta.concrete_fields if not field.primary_key]
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    sql = f'COPY {connection.ops.quote_name(Task._meta.db_table)} ({columns}) FROM STDIN'
+    with connection.cursor() as cursor:
+        with cursor.cursor.copy(sql) as copy:
+            for task in tasks:
+                copy.write_row([field.get_db_prep_save(field.pre_save(task, True), connection) for field in fields])
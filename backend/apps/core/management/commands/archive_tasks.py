@@ -0,0 +1,34 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.core.archive import archive_batch, restore_task
+
+
+class Command(BaseCommand):
+    help = ("Move closed and deleted tasks that have not changed for --older-than days, with their history "
+            "and comments, to the archive tables, one batch per transaction. Safe to stop and run again. "
+            "--restore <id> moves archived tasks back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=90, help='Days since the last change (default 90).')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.05, help='Seconds to sleep between batches.')
+        parser.add_argument('--restore', type=int, action='append', metavar='ID', help='Restore a task, can be repeated.')
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            missing = [task_id for task_id in options['restore'] if restore_task(task_id) is None]
+            if missing:
+                raise CommandError(f'Not archived: {", ".join(map(str, missing))}')
+            self.stdout.write(f"Restored {len(options['restore'])} tasks")
+            return
+        before = timezone.now() - timedelta(days=options['older_than'])
+        total = 0
+        while archived := archive_batch(before, options['batch_size']):
+            total += archived
+            self.stdout.write(f'Archived {total} tasks')
+            time.sleep(options['pause'])
+        self.stdout.write(f'Done: {total} tasks archived')
@@ -0,0 +1,232 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone as dt_timezone
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.core import archive
+from apps.core import changes as task_changes
+from apps.core.counters import count_tasks
+from apps.core.management.commands.loadtest_reads import percentile
+from apps.core.models import Task, TaskCounter
+
+User = get_user_model()
+
+PASSWORD = 'benchmark-pass-1234'
+
+
+class Command(BaseCommand):
+    help = ("Benchmark every TaskViewSet action and the auth endpoints in-process against the current "
+            "database (e.g. after seed_tasks): latency, SQL query count and peak allocations per endpoint. "
+            "Everything the benchmark writes is rolled back. With --baseline, fails when an endpoint "
+            "regresses past the stored results.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Measured requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per endpoint first.')
+        parser.add_argument('--only', action='append', help='Endpoint to run, can be repeated (default: all).')
+        parser.add_argument('--cache', action='store_true', help='Keep the response cache on (off by default).')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare against.')
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results to --baseline instead of comparing.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative increase of p50 latency and peak allocations (default: 0.25).')
+        parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                            help='Latency increases smaller than this are never regressions (timer noise).')
+
+    def handle(self, *args, **options):
+        if options['save_baseline'] and not options['baseline']:
+            raise CommandError('--save-baseline needs --baseline.')
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be positive.')
+        if not Task.objects.exists():
+            raise CommandError('No tasks to benchmark, run seed_tasks first.')
+        runs = options['warmup'] + options['repeat'] + 1 # The last run measures allocations
+        # APIClient requests come from the 'testserver' host
+        overrides = override_settings(TASK_RESPONSE_CACHE=options['cache'], ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
+        with overrides, transaction.atomic():
+            endpoints = Endpoints(runs)
+            names = options['only'] or list(endpoints.all)
+            unknown = set(names) - set(endpoints.all)
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}. Known: {', '.join(endpoints.all)}")
+            results = {}
+            for name in names:
+                results[name] = self.measure(endpoints, name, options['warmup'], options['repeat'])
+                self.stdout.write(
+                    f"{name:<22} {results[name]['status']}  p50 {results[name]['p50_ms']:8.2f} ms  "
+                    f"p95 {results[name]['p95_ms']:8.2f} ms  {results[name]['queries']:3d} queries  "
+                    f"{results[name]['alloc_peak_kb']:9.1f} KiB peak"
+                )
+            transaction.set_rollback(True)
+
+        report = {
+            'meta': {
+                'date': datetime.now(dt_timezone.utc).isoformat(),
+                'database': connection.vendor,
+                'tasks': Task.objects.count(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'repeat': options['repeat'],
+                'cache': options['cache'],
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+        if options['baseline']:
+            if options['save_baseline']:
+                with open(options['baseline'], 'w') as file:
+                    json.dump(report, file, indent=2)
+                self.stdout.write(f"Baseline written to {options['baseline']}")
+            else:
+                with open(options['baseline']) as file:
+                    baseline = json.load(file)
+                regressions = compare(baseline['results'], results, options['tolerance'], options['min_delta_ms'])
+                for line in regressions:
+                    self.stderr.write(line)
+                if regressions:
+                    raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}')
+                self.stdout.write(f"No regression against {options['baseline']}")
+
+    def measure(self, endpoints, name, warmup, repeat):
+        latencies, queries, statuses = [], 0, set()
+        for run in range(warmup + repeat):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = endpoints.request(name, run)
+                elapsed = time.perf_counter() - start
+            statuses.add(response.status_code)
+            if run >= warmup:
+                latencies.append(elapsed)
+                queries = max(queries, len(captured))
+        tracemalloc.start()
+        try:
+            endpoints.request(name, warmup + repeat)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        if len(statuses) != 1 or max(statuses) >= 400:
+            raise CommandError(f'{name}: unexpected response statuses {sorted(statuses)}')
+        latencies.sort()
+        return {
+            'status': response.status_code,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+            'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+            'queries': queries,
+            'alloc_peak_kb': round(peak / 1024, 1),
+        }
+
+
+def compare(baseline, results, tolerance, min_delta_ms):
+    """
+    Lines describing each result worse than its baseline: any extra query, or a
+    p50 latency or peak allocation more than `tolerance` above it.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            regressions.append(f"{name}: {result['queries']} queries, baseline {base['queries']}")
+        if result['p50_ms'] > base['p50_ms'] * (1 + tolerance) and result['p50_ms'] - base['p50_ms'] > min_delta_ms:
+            regressions.append(f"{name}: p50 {result['p50_ms']:.2f} ms, baseline {base['p50_ms']:.2f} ms")
+        if result['alloc_peak_kb'] > base['alloc_peak_kb'] * (1 + tolerance):
+            regressions.append(f"{name}: {result['alloc_peak_kb']:.1f} KiB peak, baseline {base['alloc_peak_kb']:.1f} KiB")
+    return regressions
+
+
+class Endpoints:
+    """
+    The benchmarked requests, by name. Writes get fresh tasks for every run, created
+    up front so that their setup is not measured.
+    """
+
+    def __init__(self, runs):
+        self.user = User.objects.create_user(username='benchmark_user', password=PASSWORD, is_staff=True)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        # The task with the longest history and comments (seed_tasks makes some), and a light assignee
+        self.hot_task = Task.objects.order_by('-comment_count', 'id').values_list('id', flat=True).first()
+        self.light_user = User.objects.order_by('-id').exclude(pk=self.user.pk).values_list('id', flat=True).first() or self.user.pk
+        self.since = task_changes.encode_cursor(max(task_changes.current_seq() - 200, 0))
+        self.tokens = {name: [str(RefreshToken.for_user(self.user)) for _ in range(runs)] for name in ('refresh', 'logout')}
+        self.open = self.tasks(runs * 4)
+        assigned = {'status': Task.Status.ASSIGNED, 'assigned_to': self.user}
+        self.assigned = self.tasks(runs * 2, **assigned)
+        self.bulk = {
+            name: [self.tasks(50, **fields) for _ in range(runs)]
+            for name, fields in (('assign', {}), ('unassign', assigned), ('close', assigned), ('delete', {}))
+        }
+        self.archived = self.tasks(runs, status=Task.Status.CLOSED)
+        Task.objects.filter(pk__in=self.archived).update(updated_at=datetime(2000, 1, 1, tzinfo=dt_timezone.utc))
+        archive.archive_batch(datetime(2000, 1, 2, tzinfo=dt_timezone.utc), batch_size=runs)
+        get, post, patch = self.client.get, self.client.post, self.client.patch
+        self.all = {
+            'list': lambda i: get('/api/tasks/?pagination=cursor'),
+            'list_filtered': lambda i: get(f'/api/tasks/?assigned_to={self.light_user}&status=2'),
+            'retrieve': lambda i: get(f'/api/tasks/{self.hot_task}/'),
+            'history': lambda i: get(f'/api/tasks/{self.hot_task}/history/'),
+            'history_compact': lambda i: get(f'/api/tasks/{self.hot_task}/history/?compact=true'),
+            'history_index': lambda i: get(f'/api/tasks/history/?changed_by={self.light_user}'),
+            'comments': lambda i: get(f'/api/tasks/{self.hot_task}/comments/'),
+            'overview': lambda i: get(f'/api/tasks/{self.hot_task}/overview/'),
+            'changes': lambda i: get(f'/api/tasks/changes/?since={self.since}'),
+            'stats': lambda i: get('/api/tasks/stats/'),
+            'cache_stats': lambda i: get('/api/tasks/cache_stats/'),
+            'export': lambda i: self.stream(get(f'/api/tasks/export/?assigned_to={self.light_user}')),
+            'create': lambda i: post('/api/tasks/', {'title': f'Benchmark {i}', 'priority': 2}, format='json'),
+            'update': lambda i: self.client.put(f'/api/tasks/{self.open[i]}/', {'title': f'Updated {i}', 'description': 'Benchmark', 'priority': 1}, format='json'),
+            'assign': lambda i: patch(f'/api/tasks/{self.open[runs + i]}/assign/', {'assigned_to': self.user.pk}, format='json'),
+            'unassign': lambda i: patch(f'/api/tasks/{self.assigned[i]}/unassign/'),
+            'close': lambda i: patch(f'/api/tasks/{self.assigned[runs + i]}/close/'),
+            'delete_task': lambda i: patch(f'/api/tasks/{self.open[2 * runs + i]}/delete_task/'),
+            'destroy': lambda i: self.client.delete(f'/api/tasks/{self.open[3 * runs + i]}/'),
+            'restore': lambda i: post(f'/api/tasks/{self.archived[i]}/restore/'),
+            'comment': lambda i: post(f'/api/tasks/{self.hot_task}/comment/', {'comment': f'Benchmark {i}'}, format='json'),
+            'bulk_assign': lambda i: patch('/api/tasks/bulk_assign/', {'ids': self.bulk['assign'][i], 'assigned_to': self.user.pk}, format='json'),
+            'bulk_close': lambda i: patch('/api/tasks/bulk_close/', {'ids': self.bulk['close'][i]}, format='json'),
+            'bulk_unassign': lambda i: patch('/api/tasks/bulk_unassign/', {'ids': self.bulk['unassign'][i]}, format='json'),
+            'bulk_delete': lambda i: patch('/api/tasks/bulk_delete/', {'ids': self.bulk['delete'][i]}, format='json'),
+            'import': lambda i: self.client.generic('POST', '/api/tasks/import/', '\n'.join(
+                json.dumps({'title': f'Imported {i}.{n}', 'priority': n % 5}) for n in range(100)
+            ), content_type='application/x-ndjson'),
+            'auth_register': lambda i: post('/api/auth/register/', {
+                'first_name': 'Bench', 'last_name': f'Register{i}', 'password': PASSWORD, 'password_confirm': PASSWORD,
+            }, format='json'),
+            'auth_login': lambda i: post('/api/auth/login/', {'username': self.user.username, 'password': PASSWORD}, format='json'),
+            'auth_refresh': lambda i: post('/api/auth/token/refresh/', {'refresh': self.tokens['refresh'][i]}, format='json'),
+            'auth_logout': lambda i: post('/api/auth/logout/', {'refresh': self.tokens['logout'][i]}, format='json'),
+            'auth_users': lambda i: get('/api/auth/users/?pagination=cursor'),
+            'auth_user_search': lambda i: get('/api/auth/users/search/?q=seed_user_1'),
+            'auth_blacklist_stats': lambda i: get('/api/auth/token/blacklist/stats/'),
+        }
+
+    def request(self, name, run):
+        return self.all[name](run)
+
+    def tasks(self, count, **fields):
+        tasks = Task.objects.bulk_create(
+            Task(title=f'Benchmark fixture {n}', created_by=self.user, **fields) for n in range(count)
+        )
+        TaskCounter.adjust(count_tasks(tasks))
+        return [task.pk for task in tasks]
+
+    @staticmethod
+    def stream(response):
+        for _ in response.streaming_content: # Time the whole export, not just its first chunk
+            pass
+        return response
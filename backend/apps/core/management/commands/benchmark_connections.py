@@ -0,0 +1,108 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.core.management.commands.loadtest_reads import percentile
+
+User = get_user_model()
+
+# name: (CONN_MAX_AGE, pool options), see the DATABASES settings
+MODES = {
+    'per-request': (0, None),
+    'persistent': (60, None),
+    'pool': (0, {'min_size': 1, 'max_size': 2}),
+}
+
+
+class Command(BaseCommand):
+    help = ("Show the connection setup that reusing database connections removes from each request: "
+            "time in-process requests with a new connection per request (CONN_MAX_AGE=0), persistent "
+            "connections and, on PostgreSQL, the psycopg pool, and report their latency and the time "
+            "spent getting a connection (opening one, or taking it from the pool).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per mode.')
+        parser.add_argument('--path', default='/api/tasks/stats/', help='Endpoint requested.')
+        parser.add_argument('--mode', choices=MODES, action='append', help='Mode to run, can be repeated (default: all).')
+
+    def handle(self, *args, **options):
+        connection = connections['default']
+        user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('At least one user is required.')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        modes = options['mode'] or [mode for mode in MODES if mode != 'pool' or connection.vendor == 'postgresql']
+        if 'pool' in modes and connection.vendor != 'postgresql':
+            raise CommandError('The pool mode needs PostgreSQL.')
+
+        saved = {key: connection.settings_dict.get(key) for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS', 'OPTIONS')}
+        opened = []
+        get_new_connection = connection.get_new_connection
+
+        def timed_get_new_connection(conn_params):
+            start = time.perf_counter()
+            try:
+                return get_new_connection(conn_params)
+            finally:
+                opened.append(time.perf_counter() - start)
+
+        connection.get_new_connection = timed_get_new_connection
+        # The test client comes from the 'testserver' host; cached responses would skip the database
+        overrides = override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], TASK_RESPONSE_CACHE=False)
+        try:
+            with overrides:
+                for mode in modes:
+                    self.configure(connection, mode, saved['OPTIONS'])
+                    request(client, options['path']) # Warm up: the first connection is opened in every mode
+                    opened.clear()
+                    latencies = []
+                    for _ in range(options['requests']):
+                        start = time.perf_counter()
+                        response = request(client, options['path'])
+                        latencies.append(time.perf_counter() - start)
+                        if response.status_code != 200:
+                            raise CommandError(f"{options['path']} returned {response.status_code}")
+                    latencies.sort()
+                    self.stdout.write(
+                        f"{mode:<12} p50 {percentile(latencies, 50) * 1000:7.2f} ms  p99 {percentile(latencies, 99) * 1000:7.2f} ms  "
+                        f"mean {statistics.mean(latencies) * 1000:7.2f} ms  connects {len(opened):4d}  "
+                        f"connection setup {sum(opened) / len(latencies) * 1000:6.3f} ms/request"
+                    )
+        finally:
+            del connection.get_new_connection
+            close(connection)
+            connection.settings_dict.update(saved)
+
+    @staticmethod
+    def configure(connection, mode, options):
+        conn_max_age, pool = MODES[mode]
+        close(connection)
+        connection.settings_dict.update(
+            CONN_MAX_AGE=conn_max_age,
+            CONN_HEALTH_CHECKS=True,
+            OPTIONS={**{key: value for key, value in options.items() if key != 'pool'}, **({'pool': pool} if pool else {})},
+        )
+
+
+def request(client, path):
+    # What the server handlers do on request_started and request_finished, which the
+    # test client leaves out: connections are closed or kept depending on CONN_MAX_AGE
+    close_old_connections()
+    try:
+        return client.get(path)
+    finally:
+        close_old_connections()
+
+
+def close(connection):
+    connection.close()
+    if hasattr(connection, 'close_pool'): # PostgreSQL
+        connection.close_pool()
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from apps.core.models import Task
+from apps.core.renderers import FastJSONRenderer, orjson
+from apps.core.serializers import rows
+from apps.core.serializers.task import TasksListSerializer
+
+
+class Command(BaseCommand):
+    help = ("Compare the cost of turning a page of tasks into the list response: TasksListSerializer and "
+            "JSONRenderer, against the .values() rows and FastJSONRenderer the list endpoint uses. "
+            "The rows are read from the database once; only serialization and rendering are timed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500, help='Page size (default: 500).')
+        parser.add_argument('--repeat', type=int, default=50, help='Times each page is serialized.')
+
+    def handle(self, *args, **options):
+        queryset = Task.objects.order_by('id')[:options['rows']]
+        tasks = list(queryset.select_related('assigned_to'))
+        values = list(rows.values(queryset, rows.TASK_LIST_COLUMNS))
+        if not tasks:
+            raise CommandError('No tasks to serialize, create some first (e.g. explain_task_queries --seed).')
+        if orjson is None:
+            self.stdout.write('orjson is not installed: FastJSONRenderer falls back to JSONRenderer.')
+
+        def serializer():
+            return JSONRenderer().render(TasksListSerializer(tasks, many=True).data)
+
+        def fast():
+            return FastJSONRenderer().render(rows.serialize(values, rows.TASK_LIST_COLUMNS))
+
+        if serializer() != fast():
+            raise CommandError('The two paths do not render the same bytes.')
+        results = {}
+        for name, render in (('serializer', serializer), ('rows', fast)):
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                render()
+            elapsed = time.perf_counter() - start
+            results[name] = len(tasks) * options['repeat'] / elapsed
+            self.stdout.write(f"{name:<10} {results[name]:12.0f} rows/s  ({elapsed / options['repeat'] * 1000:.2f} ms per {len(tasks)}-row page)")
+        self.stdout.write(f"speedup    {results['rows'] / results['serializer']:.1f}x")
@@ -0,0 +1,99 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+
+from apps.core.models import Task
+from apps.core.transitions import LOCK, OPTIMISTIC, TransitionError, transition_task
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Hammer a few hot tasks with concurrent assign/unassign transitions and report throughput, "
+            "time spent waiting on row locks and compare-and-swap conflicts. Meant for a scratch PostgreSQL "
+            "database: SQLite serializes all writers, so the modes cannot be compared there.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=[LOCK, OPTIMISTIC], action='append',
+                            help='Transition mode to benchmark, can be repeated (default: both).')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--tasks', type=int, default=4, help='Number of hot tasks shared by all threads.')
+        parser.add_argument('--ops', type=int, default=200, help='Transitions per thread.')
+
+    def handle(self, *args, **options):
+        users = list(User.objects.order_by('pk')[:10])
+        if not users:
+            raise CommandError('At least one user is required.')
+        for mode in options['mode'] or [LOCK, OPTIMISTIC]:
+            task_ids = [
+                Task.objects.create(title=f'benchmark {mode} {i}', created_by=users[0]).pk
+                for i in range(options['tasks'])
+            ]
+            try:
+                result = self.run(mode, task_ids, users, options['threads'], options['ops'])
+            finally:
+                for task in Task.objects.filter(pk__in=task_ids):
+                    task.delete() # Model delete keeps the dashboard counters right
+            self.stdout.write(
+                f"{mode:<10} {result['done'] / result['elapsed']:8.1f} transitions/s  "
+                f"done {result['done']}  rejected {result['rejected']}  failed {result['failed']}  "
+                f"lock wait {result['lock_wait']:.3f}s  CAS conflicts {result['conflicts']}"
+            )
+
+    def run(self, mode, task_ids, users, threads, ops):
+        totals = Counter()
+        totals_lock = threading.Lock()
+
+        def worker():
+            stats = Counter()
+            try:
+                with connection.execute_wrapper(self.measure(stats)):
+                    for _ in range(ops):
+                        task_id = random.choice(task_ids)
+                        if random.random() < 0.8:
+                            new_status, assigned_to = Task.Status.ASSIGNED, random.choice(users)
+                        else:
+                            new_status, assigned_to = Task.Status.OPEN, None
+                        try:
+                            transition_task(task_id, new_status, users[0], assigned_to=assigned_to, mode=mode)
+                            stats['done'] += 1
+                        except TransitionError as error:
+                            stats['failed' if error.status_code == 409 else 'rejected'] += 1
+                        except DatabaseError: # Deadlocks, lock timeouts
+                            stats['failed'] += 1
+            finally:
+                connection.close() # Each thread has its own connection
+            with totals_lock:
+                totals.update(stats)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        result = {'done': 0, 'rejected': 0, 'failed': 0, 'conflicts': 0, 'lock_wait': 0.0}
+        result.update(totals)
+        result['elapsed'] = time.perf_counter() - start
+        return result
+
+    @staticmethod
+    def measure(stats):
+        """
+        Execute wrapper timing SELECT ... FOR UPDATE queries (lock waits) and counting
+        version compare-and-swap UPDATEs that matched no row (conflicts).
+        """
+        def wrapper(execute, sql, params, many, context):
+            start = time.perf_counter()
+            result = execute(sql, params, many, context)
+            if 'FOR UPDATE' in sql:
+                stats['lock_wait'] += time.perf_counter() - start
+            elif sql.startswith('UPDATE') and '"version" =' in sql.split('WHERE', 1)[-1] and context['cursor'].rowcount == 0:
+                stats['conflicts'] += 1
+            return result
+        return wrapper
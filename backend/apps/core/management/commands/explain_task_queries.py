@@ -0,0 +1,103 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+
+from apps.core.counters import count_tasks
+from apps.core.filters import TaskFilterSet
+from apps.core.models import Task, TaskHistory, TaskComment, TaskCounter
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Run EXPLAIN on the canonical task queries and check that the planner uses the expected indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Insert this many synthetic tasks first (e.g. 1000000). Only use on a scratch database.')
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'], options['batch_size'])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        user_id = User.objects.values_list('id', flat=True).first()
+        task_id = Task.objects.values_list('id', flat=True).first()
+        if user_id is None or task_id is None:
+            raise CommandError('No data to explain, run with --seed first.')
+
+        failures = []
+        for name, queryset, index in self.canonical_queries(user_id, task_id):
+            plan = queryset.explain()
+            used = index in plan
+            if not used:
+                failures.append(name)
+            self.stdout.write(f"{'OK  ' if used else 'FAIL'} {name} -> {index}")
+            if options['verbosity'] > 1:
+                self.stdout.write(plan)
+        if failures:
+            raise CommandError(f"Expected index not used for: {', '.join(failures)}")
+
+    def canonical_queries(self, user_id, task_id):
+        live = Task.objects.exclude(status=Task.Status.DELETED)
+        queries = [
+            ('tasks by status and priority',
+             Task.objects.filter(status=Task.Status.OPEN, priority=Task.Priority.CRITICAL),
+             'task_status_priority_idx'),
+            ('my open work',
+             Task.objects.filter(assigned_to_id=user_id, status=Task.Status.ASSIGNED),
+             'task_assignee_status_idx'),
+            ('newest live tasks', live.order_by('-created_at')[:50], 'task_live_created_idx'),
+            ('recently updated live tasks', live.order_by('-updated_at')[:50], 'task_live_updated_idx'),
+            ('tasks by priority (cursor)',
+             Task.objects.order_by('priority', 'created_at', 'id')[:50],
+             'task_priority_created_idx'),
+            ('recently updated tasks (cursor)',
+             Task.objects.order_by('-updated_at', '-id')[:50],
+             'task_updated_id_idx'),
+            ('task history',
+             TaskHistory.objects.filter(task_id=task_id).order_by('changed_at'),
+             'taskhistory_task_changed_idx'),
+            ('task comments',
+             TaskComment.objects.filter(task_id=task_id).order_by('commented_at'),
+             'taskcomment_task_comment_idx'),
+        ]
+        if connection.vendor == 'postgresql':
+            queries.append(('full-text search', TaskFilterSet().search(Task.objects.all(), 'q', '424242'), 'task_search_vector_idx'))
+        return queries
+
+    def seed(self, total, batch_size):
+        rng = random.Random(42)
+        users = list(User.objects.all()[:50])
+        if not users:
+            users = User.objects.bulk_create(User(username=f'explain_user_{i}') for i in range(50))
+        for start in range(0, total, batch_size):
+            tasks = []
+            for i in range(start, min(start + batch_size, total)):
+                task_status = rng.choices(Task.Status.values, weights=[30, 30, 30, 10])[0]
+                assignee = rng.choice(users) if task_status != Task.Status.OPEN else None
+                tasks.append(Task(
+                    title=f'Task {i}',
+                    created_by=rng.choice(users),
+                    assigned_to=assignee,
+                    status=task_status,
+                    priority=rng.choice(Task.Priority.values),
+                ))
+            with transaction.atomic():
+                Task.objects.bulk_create(tasks)
+                TaskCounter.adjust(count_tasks(tasks))
+            self.stdout.write(f'Seeded {min(start + batch_size, total)}/{total} tasks')
+        task = Task.objects.latest('id')
+        TaskHistory.objects.bulk_create(
+            TaskHistory(task=task, changed_by=users[0], previous_status=Task.Status.OPEN, new_status=Task.Status.ASSIGNED)
+            for _ in range(100)
+        )
+        comments = TaskComment.objects.bulk_create(
+            TaskComment(task=task, commented_by=users[0], comment='Seed comment') for _ in range(100)
+        )
+        Task.objects.filter(pk=task.pk).update(comment_count=F('comment_count') + len(comments), last_comment_at=comments[-1].commented_at)
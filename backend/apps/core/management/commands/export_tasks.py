@@ -0,0 +1,25 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from apps.core.exporters import FORMATS, RESOURCES, export_rows
+
+
+class Command(BaseCommand):
+    help = "Export tasks, task history or task comments as CSV or NDJSON from one consistent snapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resource', choices=list(RESOURCES), default='tasks')
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--output', help='File to write, defaults to stdout.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunks = export_rows(options['resource'], options['format'], chunk_size=options['chunk_size'])
+        if not options['output']:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            return
+        with open(options['output'], 'w', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
@@ -0,0 +1,35 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.importers import FORMATS, import_tasks, iter_rows
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Import tasks from an NDJSON or CSV file, streamed and inserted in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help='Username recorded as the creator of the tasks.')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']!r} does not exist")
+        format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'ndjson')
+
+        started = time.monotonic()
+        with open(options['path'], 'rb') as lines:
+            result = import_tasks(iter_rows(lines, format), created_by=user, batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+
+        for error in result.errors:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        rate = result.created / elapsed if elapsed else 0
+        self.stdout.write(f'Imported {result.created} tasks ({result.failed} failed) in {elapsed:.1f}s, {rate:.0f} tasks/s')
@@ -0,0 +1,109 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Load test the task read endpoints of running servers with many concurrent keep-alive clients, "
+            "and report requests/s and p50/p99 latency per server. Compare a WSGI server with an ASGI one "
+            "serving TASK_ASYNC_READS=1, e.g. --target wsgi=http://localhost:8000 --target asgi=http://localhost:8001")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, help='name=base URL, can be repeated.')
+        parser.add_argument('--path', action='append',
+                            help='Path to request, can be repeated (default: the task list, a task and its history).')
+        parser.add_argument('--user', required=True, help='Username the requests are authenticated as.')
+        parser.add_argument('--concurrency', type=int, default=500)
+        parser.add_argument('--duration', type=float, default=30, help='Seconds per target.')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"No user {options['user']!r}")
+        token = str(RefreshToken.for_user(user).access_token)
+        paths = options['path'] or ['/api/tasks/', '/api/tasks/1/', '/api/tasks/1/history/']
+        for target in options['target']:
+            name, _, url = target.partition('=')
+            if not url:
+                raise CommandError(f'Invalid --target {target!r}, expected name=URL')
+            result = asyncio.run(load(url, paths, token, options['concurrency'], options['duration']))
+            latencies = sorted(result['latencies'])
+            if not latencies:
+                raise CommandError(f"{name}: no successful request ({result['errors']} errors)")
+            self.stdout.write(
+                f"{name:<8} {len(latencies) / result['elapsed']:8.1f} req/s  "
+                f"p50 {percentile(latencies, 50) * 1000:7.1f} ms  p99 {percentile(latencies, 99) * 1000:7.1f} ms  "
+                f"mean {statistics.mean(latencies) * 1000:7.1f} ms  errors {result['errors']}"
+            )
+
+
+def percentile(ordered, percent):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+async def load(url, paths, token, concurrency, duration):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    deadline = time.perf_counter() + duration
+    result = {'latencies': [], 'errors': 0}
+
+    async def client(offset):
+        connection = None
+        sent = offset
+        while time.perf_counter() < deadline:
+            path = parts.path.rstrip('/') + paths[sent % len(paths)]
+            sent += 1
+            start = time.perf_counter()
+            try:
+                if connection is None:
+                    connection = await asyncio.open_connection(host, port)
+                status = await get(*connection, host, path, token)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                result['errors'] += 1
+                connection = None
+                await asyncio.sleep(0.1)
+                continue
+            if status == 200:
+                result['latencies'].append(time.perf_counter() - start)
+            else:
+                result['errors'] += 1
+        if connection is not None:
+            connection[1].close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    result['elapsed'] = time.perf_counter() - start
+    return result
+
+
+async def get(reader, writer, host, path, token):
+    """
+    One keep-alive HTTP/1.1 GET; returns the status once the body is read.
+    """
+    writer.write(
+        f'GET {path} HTTP/1.1\r\nHost: {host}\r\nAuthorization: Bearer {token}\r\n'
+        f'Accept: application/json\r\nConnection: keep-alive\r\n\r\n'.encode()
+    )
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {name.strip().lower(): value.strip() for name, _, value in (line.partition(':') for line in lines[1:] if line)}
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        raise ValueError('Response without length') # Server closes the connection
+    return status
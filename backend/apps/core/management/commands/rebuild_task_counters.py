@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.counters import rebuild_counters, wrong_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the dashboard task counters from the Task table, or only check them with --verify."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Report wrong counters without changing them.')
+
+    def handle(self, *args, **options):
+        wrong = wrong_counters() if options['verify'] else rebuild_counters()
+        for key, (stored, actual) in sorted(wrong.items()):
+            self.stdout.write(f'(assignee, status, priority) {key}: stored {stored}, actual {actual}')
+        if options['verify'] and wrong:
+            raise CommandError(f'{len(wrong)} wrong counters')
+        self.stdout.write(f"{len(wrong)} wrong counters{'' if options['verify'] else ', rebuilt'}")
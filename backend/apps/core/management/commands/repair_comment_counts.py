@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.counters import repair_comment_counts
+
+
+class Command(BaseCommand):
+    help = ("Recompute the comment count and last comment date of every task from its comments, "
+            "or only check them with --verify.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Report wrong counts without changing them.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        wrong = repair_comment_counts(options['batch_size'], verify=options['verify'])
+        for task_id, (stored, actual) in sorted(wrong.items()):
+            self.stdout.write(f'Task {task_id}: stored {stored[0]} comments (last {stored[1]}), actual {actual[0]} (last {actual[1]})')
+        if options['verify'] and wrong:
+            raise CommandError(f'{len(wrong)} wrong comment counts')
+        self.stdout.write(f"{len(wrong)} wrong comment counts{'' if options['verify'] else ', repaired'}")
@@ -0,0 +1,71 @@
+import signal
+import threading
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from apps.core.outbox import DELIVERED, FAILED, RETRIED, retry_failed, run_worker
+
+
+class Command(BaseCommand):
+    help = ("Deliver the task events of the outbox to the OUTBOX_HANDLERS (apps.core.outbox), in batches "
+            "claimed with SKIP LOCKED, retrying failed events with backoff. Runs until stopped (SIGINT or "
+            "SIGTERM finish the current batches); start it several times, or with --workers, to deliver "
+            "in parallel.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Worker threads, each with its own connection.')
+        parser.add_argument('--batch-size', type=int, default=100, help='Events claimed at a time by each worker.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when no event is due.')
+        parser.add_argument('--once', action='store_true', help='Exit when no event is due instead of waiting.')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Make the events that ran out of attempts due again, then exit.')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            self.stdout.write(f'{retry_failed()} failed events will be retried')
+            return
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be positive.')
+        stop = threading.Event()
+        previous = {signum: signal.signal(signum, lambda *_: stop.set()) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            totals = self.run(stop, options)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(f'Done: {self.summary(totals)}')
+
+    def run(self, stop, options):
+        lock = threading.Lock()
+
+        def report(outcomes):
+            if options['verbosity'] > 1:
+                with lock:
+                    self.stdout.write(self.summary(outcomes))
+
+        worker_options = {
+            'batch_size': options['batch_size'], 'poll_interval': options['poll_interval'],
+            'until_empty': options['once'], 'report': report,
+        }
+        if options['workers'] == 1:
+            return run_worker(stop, **worker_options)
+        results = []
+
+        def work():
+            try:
+                results.append(run_worker(stop, **worker_options))
+            finally:
+                connections.close_all() # The thread's own connections
+
+        threads = [threading.Thread(target=work, name=f'outbox-worker-{i}') for i in range(options['workers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(results, Counter())
+
+    @staticmethod
+    def summary(outcomes):
+        return ', '.join(f'{outcomes[outcome]} {outcome}' for outcome in (DELIVERED, RETRIED, FAILED))
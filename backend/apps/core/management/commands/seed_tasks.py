@@ -0,0 +1,168 @@
+import contextlib
+import itertools
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from apps.core import cache as response_cache
+from apps.core.counters import count_tasks
+from apps.core.models import Task, TaskComment, TaskCounter, TaskHistory
+
+User = get_user_model()
+
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+# Most tasks are done or in progress, few are deleted
+STATUS_WEIGHTS = {Task.Status.OPEN: 20, Task.Status.ASSIGNED: 25, Task.Status.CLOSED: 45, Task.Status.DELETED: 10}
+PRIORITY_WEIGHTS = {Task.Priority.CRITICAL: 3, Task.Priority.HIGH: 12, Task.Priority.MEDIUM: 40, Task.Priority.LOW: 30, Task.Priority.MINOR: 15}
+WORDS = ('login', 'export', 'report', 'cache', 'invoice', 'search', 'upload', 'profile', 'billing', 'dashboard',
+         'timeout', 'crash', 'layout', 'email', 'sync', 'permission', 'import', 'filter', 'mobile', 'api')
+VERBS = ('Fix', 'Add', 'Improve', 'Investigate', 'Remove', 'Update', 'Refactor', 'Document')
+FIRST_NAMES = ('Ana', 'Ben', 'Chloe', 'David', 'Emma', 'Farid', 'Grace', 'Hugo', 'Ines', 'Jon', 'Kim', 'Leo')
+LAST_NAMES = ('Smith', 'Garcia', 'Nguyen', 'Muller', 'Rossi', 'Kowalski', 'Silva', 'Sato', 'Dubois', 'Okafor')
+
+
+class Command(BaseCommand):
+    help = ("Insert a deterministic synthetic dataset for benchmarks: users, tasks over every status and "
+            "priority with skewed assignees, and their history and comments, with bulk inserts. The same "
+            "--seed on an empty database gives the same data. Only use on a scratch database.")
+
+    def add_arguments(self, parser):
+        size = parser.add_mutually_exclusive_group(required=True)
+        size.add_argument('--size', choices=SIZES, help='Number of tasks: 10k, 1m or 10m.')
+        size.add_argument('--tasks', type=int, help='Exact number of tasks.')
+        parser.add_argument('--users', type=int, help='Number of users (default: one per 500 tasks, at least 50).')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Tasks inserted per transaction.')
+        parser.add_argument('--deep-every', type=int, default=1000,
+                            help='Every Nth task gets a long history and comment thread (0 for none).')
+        parser.add_argument('--deep-length', type=int, default=200)
+        parser.add_argument('--days', type=int, default=365, help='Tasks are created over this many past days.')
+        parser.add_argument('--password', default='seed-pass-1234', help='Password of the generated users.')
+
+    def handle(self, *args, **options):
+        total = options['tasks'] if options['tasks'] is not None else SIZES[options['size']]
+        if total < 1 or options['batch_size'] < 1:
+            raise CommandError('--tasks and --batch-size must be positive.')
+        rng = random.Random(options['seed'])
+        users = self.users(options['users'] or max(50, total // 500), options['password'])
+        # Zipf-like: the first users get most of the work
+        assignee_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(users))))
+        now = timezone.now()
+        start_time = now - timedelta(days=options['days'])
+        step = (now - start_time) / total
+        with explicit_timestamps():
+            for start in range(0, total, options['batch_size']):
+                tasks, history, comments = [], [], []
+                for i in range(start, min(start + options['batch_size'], total)):
+                    deep = options['deep_every'] and i % options['deep_every'] == options['deep_every'] - 1
+                    task, entries, thread = self.task(
+                        rng, i, users, assignee_weights, start_time + step * i, now,
+                        options['deep_length'] if deep else None,
+                    )
+                    tasks.append(task)
+                    history += entries
+                    comments += thread
+                with transaction.atomic():
+                    Task.objects.bulk_create(tasks) # Sets the pks the history and comments refer to
+                    for row in itertools.chain(history, comments):
+                        row.task_id = row.task.pk
+                    TaskHistory.objects.bulk_create(history, batch_size=options['batch_size'])
+                    TaskComment.objects.bulk_create(comments, batch_size=options['batch_size'])
+                    TaskCounter.adjust(count_tasks(tasks))
+                self.stdout.write(f'Seeded {start + len(tasks)}/{total} tasks ({len(history)} history entries, {len(comments)} comments)')
+        response_cache.invalidate()
+
+    def users(self, count, password):
+        names = [f'seed_user_{i}' for i in range(count)]
+        existing = {user.username: user for user in User.objects.filter(username__startswith='seed_user_')}
+        password = make_password(password) # Hashed once: hashing is deliberately slow
+        User.objects.bulk_create(
+            User(username=name, password=password, email=f'{name}@example.com',
+                 first_name=FIRST_NAMES[i % len(FIRST_NAMES)], last_name=LAST_NAMES[i // len(FIRST_NAMES) % len(LAST_NAMES)])
+            for i, name in enumerate(names) if name not in existing
+        )
+        existing = {user.username: user for user in User.objects.filter(username__startswith='seed_user_')}
+        return [existing[name] for name in names]
+
+    def task(self, rng, i, users, assignee_weights, created_at, now, deep_length):
+        """
+        An unsaved task, with the history entries that lead to its status and its comments.
+        """
+        final_status = rng.choices(list(STATUS_WEIGHTS), weights=list(STATUS_WEIGHTS.values()))[0]
+        creator = rng.choice(users)
+        task = Task(
+            title=f'{rng.choice(VERBS)} {rng.choice(WORDS)} {rng.choice(WORDS)} #{i}',
+            description=' '.join(rng.choices(WORDS, k=rng.randint(0, 40))),
+            priority=rng.choices(list(PRIORITY_WEIGHTS), weights=list(PRIORITY_WEIGHTS.values()))[0],
+            created_by=creator, created_at=created_at,
+        )
+        # Assign/unassign cycles before the final transition: mostly none or one, deep_length for hot tasks
+        cycles = deep_length // 2 if deep_length else min(int(rng.expovariate(1.2)), 10)
+        if final_status in (Task.Status.ASSIGNED, Task.Status.CLOSED):
+            cycles += 1
+        moment = created_at
+        age = max(now - created_at, timedelta(seconds=1))
+        entries = []
+
+        def record(new_status, assigned_to=None):
+            nonlocal moment
+            moment += (now - moment) * rng.random() * 0.5 if deep_length is None else age / (deep_length * 2)
+            entries.append(TaskHistory(
+                task=task, changed_by=rng.choice(users), changed_at=moment,
+                previous_status=task.status, new_status=new_status, assigned_to=assigned_to,
+            ))
+            task.status = new_status
+
+        for cycle in range(cycles):
+            assignee = rng.choices(users, cum_weights=assignee_weights)[0]
+            record(Task.Status.ASSIGNED, assignee)
+            task.assigned_to, task.assigned_by, task.assigned_at = assignee, entries[-1].changed_by, moment
+            if cycle < cycles - 1 or final_status == Task.Status.OPEN:
+                record(Task.Status.OPEN)
+                task.assigned_to = task.assigned_by = task.assigned_at = None
+        if final_status == Task.Status.CLOSED:
+            record(Task.Status.CLOSED)
+            task.closed_by, task.closed_at = entries[-1].changed_by, moment
+        elif final_status == Task.Status.DELETED:
+            record(Task.Status.DELETED)
+            task.deleted_by, task.deleted_at = entries[-1].changed_by, moment
+
+        count = deep_length or min(int(rng.paretovariate(1.2)) - 1, 50)
+        thread = []
+        for _ in range(count):
+            moment_at = created_at + (now - created_at) * rng.random()
+            thread.append(TaskComment(
+                task=task, commented_by=rng.choice(users), commented_at=moment_at,
+                comment=' '.join(rng.choices(WORDS, k=rng.randint(3, 30))),
+            ))
+        thread.sort(key=lambda comment: comment.commented_at)
+        task.comment_count = len(thread)
+        task.last_comment_at = thread[-1].commented_at if thread else None
+        task.updated_at = max([created_at, moment, *([task.last_comment_at] if thread else [])])
+        task.version = 1 + len(entries)
+        return task, entries, thread
+
+
+@contextlib.contextmanager
+def explicit_timestamps():
+    """
+    Let bulk_create keep the timestamps set on the objects, which auto_now and
+    auto_now_add fields would replace with the current time.
+    """
+    fields = [
+        Task._meta.get_field('created_at'), Task._meta.get_field('updated_at'),
+        TaskHistory._meta.get_field('changed_at'), TaskComment._meta.get_field('commented_at'),
+    ]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
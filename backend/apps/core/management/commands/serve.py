@@ -0,0 +1,29 @@
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from tasks_managment import serving
+
+
+class Command(BaseCommand):
+    help = ("Run the server SERVER_MODE selects: runserver (dev), or gunicorn with threaded workers (wsgi) "
+            "or uvicorn workers (asgi), sized from the CPU count, see gunicorn.conf.py. The task event "
+            "stream (tasks/events/) needs asgi. Under asgi Django reads a streaming response with a sync "
+            "iterator to the end before sending it, so streaming views must give it an async iterator "
+            "there, as the export does.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=serving.MODES, help='Overrides SERVER_MODE.')
+        parser.add_argument('--port', default=os.getenv('PORT', '8000'))
+
+    def handle(self, *args, **options):
+        mode = options['mode'] or settings.SERVER_MODE
+        if mode == 'dev':
+            call_command('runserver', f"0.0.0.0:{options['port']}")
+            return
+        self.stdout.write(f'Starting gunicorn ({mode}): {serving.workers(mode)} workers x {serving.threads(mode)} threads')
+        # gunicorn.conf.py reads the mode from the environment, in the new process image
+        os.environ.update(SERVER_MODE=mode, PORT=str(options['port']))
+        os.execvp('gunicorn', ['gunicorn', '--config', str(settings.BASE_DIR / 'gunicorn.conf.py')])
@@ -0,0 +1,309 @@
+"""
+Per-endpoint request metrics, served in the Prometheus text format at /metrics.
+
+MetricsMiddleware records for every request its view (URL name) and viewset action:
+the status, the latency in a histogram, the SQL queries run and their time, the
+time spent rendering JSON and the response size. Each thread adds to its own
+shard, so recording takes no lock; /metrics sums the shards. The shards of threads
+that have exited are merged into one, so that servers starting a thread per request
+do not keep one per thread. Metrics are per process: with several server workers,
+each is scraped (or summed) separately.
+
+Requests slower than SLOW_REQUEST_THRESHOLD_MS are logged with their SQL, and the
+EXPLAIN of their slowest SELECTs, for a sample of SLOW_REQUEST_SAMPLE_RATE requests.
+"""
+import bisect
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Shard entry layout: totals, then one count per bucket (not cumulative)
+COUNT, SECONDS, QUERIES, SQL_SECONDS, RENDER_SECONDS, BYTES = range(6)
+FIRST_BUCKET = 6
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+_local = threading.local()
+_shards = {} # Thread: its shard
+_retired = {} # Shards of the threads that have exited, summed
+_shards_lock = threading.Lock()
+_collectors = []
+
+
+def is_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+class RequestStats:
+    """
+    What the current request spent, filled by the SQL wrapper and the renderer.
+    `captured` holds (alias, sql, params, many, seconds) when the request is sampled for the slow log.
+    """
+    __slots__ = ('queries', 'sql_seconds', 'render_seconds', 'captured')
+
+    def __init__(self, capture):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.captured = [] if capture else None
+
+
+def add_render_time(seconds):
+    stats = _current.get()
+    if stats is not None:
+        stats.render_seconds += seconds
+
+
+def collector(function):
+    """
+    Register a function returning extra (name, type, help, value) samples for /metrics.
+    """
+    _collectors.append(function)
+    return function
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if is_enabled() and _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def _time_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.queries += 1
+        stats.sql_seconds += elapsed
+        if stats.captured is not None:
+            stats.captured.append((context['connection'].alias, sql, params, many, elapsed))
+
+
+class MetricsMiddleware:
+    """
+    Records the metrics of every request; first in MIDDLEWARE, so that the latency
+    covers the other middleware too. Works under WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        seconds = time.perf_counter() - start
+        if self.finish(request, response, stats, seconds):
+            log_slow_request(request, stats, seconds)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        seconds = time.perf_counter() - start
+        if self.finish(request, response, stats, seconds):
+            await sync_to_async(log_slow_request)(request, stats, seconds)
+        return response
+
+    @staticmethod
+    def start():
+        sample_rate = getattr(settings, 'SLOW_REQUEST_SAMPLE_RATE', 1.0)
+        capture = bool(getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 0)) and random.random() < sample_rate
+        stats = RequestStats(capture)
+        return stats, _current.set(stats), time.perf_counter()
+
+    @staticmethod
+    def finish(request, response, stats, seconds):
+        """
+        Add the request to this thread's shard; True if it goes to the slow-request log.
+        """
+        view, action = request_labels(request)
+        key = (view, action, request.method, response.status_code)
+        shard = getattr(_local, 'shard', None)
+        if shard is None:
+            shard = _local.shard = {}
+            with _shards_lock:
+                _retire_exited_threads()
+                _shards[threading.current_thread()] = shard
+        entry = shard.get(key)
+        if entry is None:
+            entry = shard[key] = [0, 0.0, 0, 0.0, 0.0, 0] + [0] * len(BUCKETS)
+        entry[COUNT] += 1
+        entry[SECONDS] += seconds
+        entry[QUERIES] += stats.queries
+        entry[SQL_SECONDS] += stats.sql_seconds
+        entry[RENDER_SECONDS] += stats.render_seconds
+        entry[BYTES] += 0 if response.streaming else len(response.content)
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        if bucket < len(BUCKETS):
+            entry[FIRST_BUCKET + bucket] += 1
+        threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 0)
+        return stats.captured is not None and seconds * 1000 >= threshold
+
+
+def request_labels(request):
+    """
+    (URL name, viewset action) of the view that served `request`.
+    """
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched', ''
+    actions = getattr(match.func, 'actions', None) or {}
+    return match.view_name, actions.get(request.method.lower(), '')
+
+
+def log_slow_request(request, stats, seconds):
+    view, action = request_labels(request)
+    lines = [
+        f'Slow request: {request.method} {request.get_full_path()} ({view} {action}) {seconds * 1000:.1f} ms, '
+        f'{stats.queries} queries in {stats.sql_seconds * 1000:.1f} ms, render {stats.render_seconds * 1000:.1f} ms'
+    ]
+    # Without their parameters, which hold whatever the request wrote (password hashes, token ids, emails)
+    for alias, sql, params, many, elapsed in stats.captured:
+        lines.append(f'  {elapsed * 1000:8.2f} ms  {sql}{"  (executemany)" if many else ""}')
+    slowest = sorted(
+        (query for query in stats.captured if not query[3] and query[1].lstrip().upper().startswith('SELECT')),
+        key=lambda query: query[4], reverse=True,
+    )
+    for alias, sql, params, many, elapsed in slowest[:getattr(settings, 'SLOW_REQUEST_EXPLAIN', 3)]:
+        lines.append(f'  EXPLAIN ({elapsed * 1000:.2f} ms) {sql}  {params}')
+        lines.extend(f'    {line}' for line in explain(alias, sql, params))
+    logger.warning('\n'.join(lines))
+
+
+def explain(alias, sql, params):
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+    except DatabaseError as error:
+        return [f'EXPLAIN failed: {error}']
+
+
+def snapshot():
+    """
+    {(view, action, method, status): entry} summed over the shards of all threads.
+    """
+    with _shards_lock:
+        _retire_exited_threads()
+        shards = list(_shards.values())
+        totals = {key: list(entry) for key, entry in _retired.items()}
+    for shard in shards:
+        _add(totals, shard)
+    return totals
+
+
+def reset():
+    with _shards_lock:
+        for shard in _shards.values():
+            shard.clear()
+        _retired.clear()
+
+
+def _retire_exited_threads():
+    # Called with _shards_lock held. A thread that has exited no longer writes to its shard
+    for thread in [thread for thread in _shards if not thread.is_alive()]:
+        _add(_retired, _shards.pop(thread))
+
+
+def _add(totals, shard):
+    for key, entry in list(shard.items()):
+        total = totals.setdefault(key, [0] * len(entry))
+        for i, value in enumerate(entry):
+            total[i] += value
+
+
+def render():
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    totals = snapshot()
+    by_endpoint = {}
+    for (view, action, method, status), entry in totals.items():
+        total = by_endpoint.setdefault((view, action, method), [0] * len(entry))
+        for i, value in enumerate(entry):
+            total[i] += value
+
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    family('http_requests_total', 'counter', 'Requests by view, action, method and status.')
+    for (view, action, method, status), entry in sorted(totals.items()):
+        lines.append(f'http_requests_total{_labels(view=view, action=action, method=method, status=status)} {entry[COUNT]}')
+
+    family('http_request_duration_seconds', 'histogram', 'Request latency, from the first middleware.')
+    for (view, action, method), entry in sorted(by_endpoint.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, entry[FIRST_BUCKET:]):
+            cumulative += count
+            lines.append(f'http_request_duration_seconds_bucket{_labels(view=view, action=action, method=method, le=bound)} {cumulative}')
+        lines.append(f'http_request_duration_seconds_bucket{_labels(view=view, action=action, method=method, le="+Inf")} {entry[COUNT]}')
+        lines.append(f'http_request_duration_seconds_sum{_labels(view=view, action=action, method=method)} {entry[SECONDS]}')
+        lines.append(f'http_request_duration_seconds_count{_labels(view=view, action=action, method=method)} {entry[COUNT]}')
+
+    for name, index, help_text in (
+        ('http_sql_queries_total', QUERIES, 'SQL queries run by requests.'),
+        ('http_sql_duration_seconds_total', SQL_SECONDS, 'Time requests spent in SQL queries.'),
+        ('http_render_duration_seconds_total', RENDER_SECONDS, 'Time requests spent serializing responses to JSON.'),
+        ('http_response_bytes_total', BYTES, 'Response body bytes (streamed responses are not counted).'),
+    ):
+        family(name, 'counter', help_text)
+        for (view, action, method), entry in sorted(by_endpoint.items()):
+            lines.append(f'{name}{_labels(view=view, action=action, method=method)} {entry[index]}')
+
+    for function in _collectors:
+        for name, kind, help_text, value in function():
+            family(name, kind, help_text)
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def metrics_view(request):
+    """
+    GET /metrics. With METRICS_TOKEN set, requires "Authorization: Bearer <METRICS_TOKEN>";
+    outside the dev server mode, it must be set.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token and getattr(settings, 'SERVER_MODE', 'dev') != 'dev':
+        return HttpResponse('Set METRICS_TOKEN to serve the metrics', status=403)
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse('Invalid metrics token', status=401)
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
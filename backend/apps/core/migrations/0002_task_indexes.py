@@ -0,0 +1,43 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'priority'], name='task_status_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assigned_to', 'status'], name='task_assignee_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('status', 4), _negated=True), fields=['-created_at'], name='task_live_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('status', 4), _negated=True), fields=['-updated_at'], name='task_live_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('status', 4), _negated=True), fields=['priority', 'created_at', 'id'], name='task_live_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskcomment',
+            index=models.Index(fields=['task', 'commented_at'], name='taskcomment_task_comment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskhistory',
+            index=models.Index(fields=['task', 'changed_at'], name='taskhistory_task_changed_idx'),
+        ),
+    ]
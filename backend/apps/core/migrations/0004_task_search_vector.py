@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+# The search vector only exists on PostgreSQL: a generated column is kept up to date by
+# the database itself, including for bulk_create() and queryset.update(). It is not
+# declared on the Task model so that regular task queries never load it.
+CREATE_SEARCH_VECTOR = """
+ALTER TABLE core_task ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'B')
+) STORED;
+CREATE INDEX task_search_vector_idx ON core_task USING gin (search_vector);
+"""
+
+DROP_SEARCH_VECTOR = """
+DROP INDEX IF EXISTS task_search_vector_idx;
+ALTER TABLE core_task DROP COLUMN IF EXISTS search_vector;
+"""
+
+
+def create_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH_VECTOR)
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_VECTOR)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_task_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_vector, drop_search_vector),
+    ]
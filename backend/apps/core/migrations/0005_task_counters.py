@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    Task = apps.get_model('core', 'Task')
+    TaskCounter = apps.get_model('core', 'TaskCounter')
+    rows = Task.objects.values_list('assigned_to', 'status', 'priority').annotate(total=Count('id')).order_by()
+    TaskCounter.objects.bulk_create(
+        TaskCounter(assignee_id=assignee_id or 0, status=status, priority=priority, count=total)
+        for assignee_id, status, priority, total in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_task_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('assignee_id', models.BigIntegerField(default=0)),
+                ('status', models.IntegerField(choices=[(1, 'Open'), (2, 'Assigned'), (3, 'Closed'), (4, 'Deleted')])),
+                ('priority', models.IntegerField(choices=[(0, 'Critical'), (1, 'High'), (2, 'Medium'), (3, 'Low'), (4, 'Minor')])),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('assignee_id', 'status', 'priority'), name='taskcounter_key_unique')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
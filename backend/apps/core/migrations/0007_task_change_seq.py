@@ -0,0 +1,78 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# change_seq is written by the database so that no write path can forget it
+# (queryset.update(), bulk_create(), COPY, raw SQL). See apps.core.changes.
+#
+# PostgreSQL: the id of the writing transaction. Transactions commit in any order,
+# but one that is not visible yet always has an id >= the xmin of the reader's
+# snapshot, which is what the delta-sync cursor is built from.
+CREATE_POSTGRESQL_TRIGGER = """
+CREATE FUNCTION core_task_set_change_seq() RETURNS trigger AS $$
+BEGIN
+    NEW.change_seq := txid_current();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER core_task_change_seq BEFORE INSERT OR UPDATE ON core_task
+    FOR EACH ROW EXECUTE FUNCTION core_task_set_change_seq();
+"""
+
+DROP_POSTGRESQL_TRIGGER = """
+DROP TRIGGER IF EXISTS core_task_change_seq ON core_task;
+DROP FUNCTION IF EXISTS core_task_set_change_seq();
+"""
+
+# SQLite has a single writer at a time, so a counter taken inside the write is
+# already in commit order.
+SQLITE_NEXT_SEQ = "UPDATE core_task SET change_seq = (SELECT COALESCE(MAX(change_seq), 0) + 1 FROM core_task) WHERE id = NEW.id;"
+
+CREATE_SQLITE_TRIGGERS = [
+    f"CREATE TRIGGER core_task_change_seq_insert AFTER INSERT ON core_task BEGIN {SQLITE_NEXT_SEQ} END;",
+    f"CREATE TRIGGER core_task_change_seq_update AFTER UPDATE ON core_task BEGIN {SQLITE_NEXT_SEQ} END;",
+]
+
+DROP_SQLITE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS core_task_change_seq_insert;",
+    "DROP TRIGGER IF EXISTS core_task_change_seq_update;",
+]
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_POSTGRESQL_TRIGGER)
+    elif schema_editor.connection.vendor == 'sqlite':
+        for sql in CREATE_SQLITE_TRIGGERS:
+            schema_editor.execute(sql)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_POSTGRESQL_TRIGGER)
+    elif schema_editor.connection.vendor == 'sqlite':
+        for sql in DROP_SQLITE_TRIGGERS:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_task_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['change_seq', 'id'], name='task_change_seq_idx'),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_task_change_seq'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='taskhistory',
+            index=models.Index(fields=['changed_by', 'changed_at', 'id'], name='taskhistory_user_changed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskhistory',
+            index=models.Index(fields=['changed_at', 'id'], name='taskhistory_changed_idx'),
+        ),
+    ]
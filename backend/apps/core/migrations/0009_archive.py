@@ -0,0 +1,68 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:38
+
+import django.db.models.deletion
+import django.db.models.functions.datetime
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_taskhistory_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTask',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('assigned_at', models.DateTimeField(blank=True, null=True)),
+                ('closed_at', models.DateTimeField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.IntegerField(choices=[(1, 'Open'), (2, 'Assigned'), (3, 'Closed'), (4, 'Deleted')])),
+                ('priority', models.IntegerField(choices=[(0, 'Critical'), (1, 'High'), (2, 'Medium'), (3, 'Low'), (4, 'Minor')])),
+                ('version', models.PositiveIntegerField()),
+                ('change_seq', models.BigIntegerField(editable=False)),
+                ('archived_at', models.DateTimeField(db_default=django.db.models.functions.datetime.Now())),
+                ('assigned_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('assigned_to', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('closed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('deleted_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedTaskComment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('commented_at', models.DateTimeField()),
+                ('comment', models.TextField()),
+                ('commented_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='core.archivedtask')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['task', 'commented_at'], name='archivedcomment_task_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedTaskHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('changed_at', models.DateTimeField()),
+                ('previous_status', models.IntegerField(choices=[(1, 'Open'), (2, 'Assigned'), (3, 'Closed'), (4, 'Deleted')])),
+                ('new_status', models.IntegerField(choices=[(1, 'Open'), (2, 'Assigned'), (3, 'Closed'), (4, 'Deleted')])),
+                ('assigned_to', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('changed_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history', to='core.archivedtask')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['task', 'changed_at'], name='archivedhistory_task_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:40
+
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+
+change_seq_migration = import_module('apps.core.migrations.0007_task_change_seq')
+
+BACKFILL = """
+UPDATE {table} SET
+    comment_count = (SELECT COUNT(*) FROM {comments} WHERE {comments}.task_id = {table}.id),
+    last_comment_at = (SELECT MAX(commented_at) FROM {comments} WHERE {comments}.task_id = {table}.id)
+WHERE EXISTS (SELECT 1 FROM {comments} WHERE {comments}.task_id = {table}.id)
+"""
+
+
+def recreate_sqlite_triggers(apps, schema_editor):
+    # Adding a NOT NULL column makes SQLite rebuild core_task, which drops its triggers
+    if schema_editor.connection.vendor == 'sqlite':
+        change_seq_migration.drop_triggers(apps, schema_editor)
+        change_seq_migration.create_triggers(apps, schema_editor)
+
+
+def backfill_comment_counts(apps, schema_editor):
+    schema_editor.execute(BACKFILL.format(table='core_task', comments='core_taskcomment'))
+    schema_editor.execute(BACKFILL.format(table='core_archivedtask', comments='core_archivedtaskcomment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Reversed last, after removing the columns rebuilt the table once more
+        migrations.RunPython(migrations.RunPython.noop, recreate_sqlite_triggers),
+        migrations.AddField(
+            model_name='archivedtask',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='archivedtask',
+            name='last_comment_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='last_comment_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['comment_count', 'id'], name='task_comment_count_idx'),
+        ),
+        migrations.RunPython(recreate_sqlite_triggers, migrations.RunPython.noop),
+        migrations.RunPython(backfill_comment_counts, migrations.RunPython.noop),
+    ]
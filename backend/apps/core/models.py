@@ -1,4 +1,16 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce, Greatest, Now
+from django.utils import timezone
+
+from apps.core import cache as response_cache
+from apps.core import events
+
+COMMENT_FIELDS = ('comment_count', 'last_comment_at')
+# Fields of the TaskCounter key of a task, in the order of Task.counter_key()
+COUNTER_FIELDS = ('assigned_to', 'status', 'priority')
+COUNTER_ATTNAMES = ('assigned_to_id', 'status', 'priority')
+
 
 class Task(models.Model):
 
@@ -29,16 +41,121 @@ class Task(models.Model):
     deleted_by = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='tasks_deleted', null=True, blank=True)
     status = models.IntegerField(choices=Status.choices, default=Status.OPEN)
     priority = models.IntegerField(choices=Priority.choices, default=Priority.MINOR)
+    # Incremented by every change, used for optimistic concurrency (ETag / If-Match)
+    version = models.PositiveIntegerField(default=1)
+    # Set by a database trigger on every insert and update, whatever the code path
+    # (migration 0007), and read by the delta-sync endpoint (apps.core.changes)
+    change_seq = models.BigIntegerField(default=0, editable=False)
+    # Kept up to date by TaskComment in the transaction that adds or removes a comment
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    last_comment_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        # status=4 is Status.DELETED: soft-deleted rows are left out of the partial indexes
+        # because almost every read path excludes them.
+        indexes = [
+            models.Index(fields=['status', 'priority'], name='task_status_priority_idx'),
+            models.Index(fields=['assigned_to', 'status'], name='task_assignee_status_idx'),
+            models.Index(fields=['-created_at'], name='task_live_created_idx', condition=~models.Q(status=4)),
+            models.Index(fields=['-updated_at'], name='task_live_updated_idx', condition=~models.Q(status=4)),
+            # Keyset pagination tuples (apps.core.pagination.TaskCursorPagination)
+            models.Index(fields=['priority', 'created_at', 'id'], name='task_priority_created_idx'),
+            models.Index(fields=['updated_at', 'id'], name='task_updated_id_idx'),
+            models.Index(fields=['change_seq', 'id'], name='task_change_seq_idx'),
+            models.Index(fields=['comment_count', 'id'], name='task_comment_count_idx'),
+        ]
+
+    def counter_key(self):
+        """
+        Key of the TaskCounter row this task is counted in, None if not fully loaded.
+        """
+        if self.get_deferred_fields() & {'assigned_to_id', 'status', 'priority'}:
+            return None
+        return (self.assigned_to_id or 0, self.status, self.priority)
 
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        with transaction.atomic(savepoint=False):
+            if created:
+                previous_key = None
+            else:
+                # The version and counter key are taken from the row, locked until the write:
+                # this instance may have been loaded before a concurrent change
+                self.version, previous_key = self._locked_state()
+                self.version += 1
+                if kwargs.get('update_fields') is not None:
+                    kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+                else:
+                    # Not the comment fields: writing back the values loaded with the task
+                    # would undo a comment added since
+                    kwargs['update_fields'] = [
+                        field.name for field in self._meta.concrete_fields
+                        if not field.primary_key and field.name not in COMMENT_FIELDS
+                    ]
+            super().save(*args, **kwargs)
+            if previous_key is None:
+                key = self.counter_key()
+            else:
+                # The fields not written keep the row's values
+                written = set(kwargs['update_fields'])
+                assigned_to_id, task_status, priority = (
+                    getattr(self, attname) if {name, attname} & written else value
+                    for name, attname, value in zip(COUNTER_FIELDS, COUNTER_ATTNAMES, previous_key)
+                )
+                key = (assigned_to_id or 0, task_status, priority)
+            if key != previous_key:
+                TaskCounter.adjust({key: 1, previous_key: -1})
+            response_cache.invalidate([self.pk])
+            events.publish([events.change_event(self.pk, previous_key, key, created=created, version=self.version)])
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            task_id = self.pk
+            _, key = self._locked_state()
+            result = super().delete(*args, **kwargs)
+            TaskCounter.adjust({key: -1})
+            response_cache.invalidate([task_id])
+            events.publish([events.change_event(task_id, key, None)])
+        return result
+
+    def _locked_state(self):
+        """
+        (version, counter key) of the task's row, locked for the rest of the transaction.
+        """
+        row = Task.objects.select_for_update().filter(pk=self.pk).values_list('version', *COUNTER_ATTNAMES).first()
+        if row is None:
+            return self.version, None
+        version, assigned_to_id, task_status, priority = row
+        return version, (assigned_to_id or 0, task_status, priority)
+
+    def transition_error(self, new_status):
+        """
+        Return why the task cannot move to `new_status`, or None if the transition is allowed.
+        """
+        if new_status == Task.Status.ASSIGNED and self.status in [Task.Status.CLOSED, Task.Status.DELETED]:
+            return 'Cannot assign a closed or deleted task'
+        if new_status == Task.Status.OPEN and self.status != Task.Status.ASSIGNED:
+            return 'Only assigned tasks can be unassigned'
+        if new_status == Task.Status.CLOSED and self.status != Task.Status.ASSIGNED:
+            return 'Only assigned tasks can be closed'
+        if new_status == Task.Status.DELETED and self.status == Task.Status.DELETED:
+            return 'Task is already deleted'
+        return None
 
     def history_record(self, changed_by, previous_status, new_status, assigned_to=None):
-        TaskHistory.objects.create(
+        """
+        Record a transition in the history, and its event in the outbox (OutboxEvent).
+        Must run in the transaction that changes the task.
+        """
+        entry = TaskHistory.objects.create(
             task=self,
             changed_by=changed_by,
             previous_status=previous_status,
             new_status=new_status,
             assigned_to=assigned_to
         )
+        OutboxEvent.objects.create(**OutboxEvent.for_history(entry))
+        return entry
 
 
 
@@ -50,8 +167,188 @@ class TaskHistory(models.Model):
     previous_status = models.IntegerField(choices=Task.Status.choices)
     new_status = models.IntegerField(choices=Task.Status.choices)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['task', 'changed_at'], name='taskhistory_task_changed_idx'),
+            # Cross-task history pages, by user or overall (TaskViewSet.history_index)
+            models.Index(fields=['changed_by', 'changed_at', 'id'], name='taskhistory_user_changed_idx'),
+            models.Index(fields=['changed_at', 'id'], name='taskhistory_changed_idx'),
+        ]
+
+class OutboxEvent(models.Model):
+    """
+    A task transition waiting for its side effects (notifications, webhooks, search
+    or cache updates), written in the transaction of the transition, so it exists if
+    and only if the transition committed. `manage.py run_outbox_worker` delivers it
+    to the OUTBOX_HANDLERS (apps.core.outbox) and deletes it, or retries it later.
+    """
+    # Same names as the task event stream (apps.core.events)
+    EVENT_TYPES = {
+        Task.Status.OPEN: 'task.unassigned',
+        Task.Status.ASSIGNED: 'task.assigned',
+        Task.Status.CLOSED: 'task.closed',
+        Task.Status.DELETED: 'task.deleted',
+    }
+
+    event_type = models.CharField(max_length=50)
+    # No foreign key: tasks can be archived before their events are delivered
+    task_id = models.BigIntegerField()
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Claimed by a worker until then; pushed back by leases and retries
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Set when the handlers failed OUTBOX_MAX_ATTEMPTS times; kept for `run_outbox_worker --retry-failed`
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['available_at', 'id'], name='outbox_pending_idx', condition=models.Q(failed_at=None)),
+        ]
+
+    @classmethod
+    def for_history(cls, entry):
+        """
+        Field values of the event of a TaskHistory entry.
+        """
+        return {
+            'event_type': cls.EVENT_TYPES[entry.new_status],
+            'task_id': entry.task_id,
+            'payload': {
+                'history': entry.pk,
+                'changed_by': entry.changed_by_id,
+                'previous_status': entry.previous_status,
+                'new_status': entry.new_status,
+                'assigned_to': entry.assigned_to_id,
+            },
+        }
+
+
 class TaskComment(models.Model):
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='comments')
     commented_at = models.DateTimeField(auto_now_add=True)
     commented_by = models.ForeignKey('auth.User', on_delete=models.CASCADE)
-    comment = models.TextField()
\ No newline at end of file
+    comment = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['task', 'commented_at'], name='taskcomment_task_comment_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if created:
+                # Greatest: a comment committed after this one can have an earlier commented_at
+                Task.objects.filter(pk=self.task_id).update(
+                    comment_count=models.F('comment_count') + 1,
+                    last_comment_at=Greatest(Coalesce('last_comment_at', Value(self.commented_at)), Value(self.commented_at)),
+                )
+        response_cache.invalidate([self.task_id]) # The lists show the comment count
+        events.publish([events.task_event('task.commented', self.task_id, [self.task.assigned_to_id], comment=self.pk)])
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            result = super().delete(*args, **kwargs)
+            Task.objects.filter(pk=self.task_id).update(
+                comment_count=models.F('comment_count') - 1,
+                last_comment_at=models.Subquery(
+                    TaskComment.objects.filter(task_id=self.task_id).order_by('-commented_at').values('commented_at')[:1]
+                ),
+            )
+            response_cache.invalidate([self.task_id])
+        return result
+
+
+class ArchivedTask(models.Model):
+    """
+    A closed or deleted task moved out of core_task by apps.core.archive, with the
+    same id and columns, so that the live table and its indexes only hold the tasks
+    that are still worked on. Read-only: it is restored to Task to be changed.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    assigned_at = models.DateTimeField(null=True, blank=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='+')
+    assigned_to = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    assigned_by = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    closed_by = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    deleted_by = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    status = models.IntegerField(choices=Task.Status.choices)
+    priority = models.IntegerField(choices=Task.Priority.choices)
+    version = models.PositiveIntegerField()
+    change_seq = models.BigIntegerField(editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    last_comment_at = models.DateTimeField(null=True, blank=True, editable=False)
+    archived_at = models.DateTimeField(db_default=Now())
+
+
+class ArchivedTaskHistory(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    task = models.ForeignKey(ArchivedTask, on_delete=models.CASCADE, related_name='history')
+    changed_at = models.DateTimeField()
+    changed_by = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='+')
+    assigned_to = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    previous_status = models.IntegerField(choices=Task.Status.choices)
+    new_status = models.IntegerField(choices=Task.Status.choices)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['task', 'changed_at'], name='archivedhistory_task_idx'),
+        ]
+
+
+class ArchivedTaskComment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    task = models.ForeignKey(ArchivedTask, on_delete=models.CASCADE, related_name='comments')
+    commented_at = models.DateTimeField()
+    commented_by = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='+')
+    comment = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['task', 'commented_at'], name='archivedcomment_task_idx'),
+        ]
+
+
+class TaskCounter(models.Model):
+    """
+    Number of tasks per (assignee, status, priority), kept up to date in the same
+    transaction as the task changes (see apps.core.counters). assignee_id is 0 for
+    unassigned tasks, which keeps the unique key free of NULLs.
+    """
+    assignee_id = models.BigIntegerField(default=0)
+    status = models.IntegerField(choices=Task.Status.choices)
+    priority = models.IntegerField(choices=Task.Priority.choices)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['assignee_id', 'status', 'priority'], name='taskcounter_key_unique'),
+        ]
+
+    @classmethod
+    def adjust(cls, deltas):
+        """
+        Add `deltas` ({(assignee_id, status, priority): n}) to the counters. Must run in
+        the transaction that changes the tasks. Rows are updated with `count = count + n`
+        in a fixed key order, so concurrent transitions neither lose updates nor deadlock
+        on the counter rows. None keys (tasks not loaded in full) are ignored.
+        """
+        for key, delta in sorted((key, delta) for key, delta in deltas.items() if key is not None and delta):
+            assignee_id, status, priority = key
+            counter = cls.objects.filter(assignee_id=assignee_id, status=status, priority=priority)
+            if counter.update(count=models.F('count') + delta):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(assignee_id=assignee_id, status=status, priority=priority, count=delta)
+            except IntegrityError: # Created by a concurrent transaction in the meantime
+                counter.update(count=models.F('count') + delta)
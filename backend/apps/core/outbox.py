@@ -0,0 +1,193 @@
+"""
+Delivery of the transactional outbox (OutboxEvent), written with every task
+transition, by `manage.py run_outbox_worker`.
+
+Workers claim batches of due events with SELECT ... FOR UPDATE SKIP LOCKED and
+lease them for OUTBOX_LEASE_SECONDS, so any number of workers, threads or
+processes, share the table without waiting on each other or taking the same
+event. The lease, held in available_at, is renewed for the rest of the batch
+whenever half of it has gone by. Each event goes to the handlers OUTBOX_HANDLERS
+lists for its type (and for '*'). Delivered events are deleted; an event whose
+handler raises is retried with exponential backoff, and kept as failed after
+OUTBOX_MAX_ATTEMPTS. A worker that dies, or stalls past its lease, leaves its
+events to be claimed again: its deletes and updates then only apply to the events
+whose lease it still holds.
+
+Delivery is at least once, and events of a task are not ordered across workers:
+handlers must be idempotent, and can order a task's events by payload['history'].
+"""
+import json
+import logging
+import random
+import time
+import urllib.request
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.core.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+DELIVERED, RETRIED, FAILED = 'delivered', 'retried', 'failed'
+
+
+def handlers_for(event_type):
+    paths = getattr(settings, 'OUTBOX_HANDLERS', {})
+    return [import_string(path) for path in [*paths.get(event_type, ()), *paths.get('*', ())]]
+
+
+def claim(batch_size):
+    """
+    Lock the next due events, skipping those other workers hold, and lease them.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(failed_at=None, available_at__lte=now)
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        if events:
+            lease_until = now + _lease()
+            # Counted when claimed, so an event that kills its worker still runs out of attempts
+            OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                available_at=lease_until, attempts=F('attempts') + 1,
+            )
+    for event in events:
+        event.attempts += 1
+        event.available_at = lease_until
+    return events
+
+
+def renew(events):
+    """
+    Extend the lease of claimed events (all leased until the same time); returns
+    those still held, without the ones another worker claimed after their lease expired.
+    """
+    if not events:
+        return events
+    lease_until = timezone.now() + _lease()
+    ids = [event.pk for event in events]
+    OutboxEvent.objects.filter(pk__in=ids, available_at=events[0].available_at).update(available_at=lease_until)
+    held = set(OutboxEvent.objects.filter(pk__in=ids, available_at=lease_until).values_list('pk', flat=True))
+    for event in events:
+        event.available_at = lease_until
+    return [event for event in events if event.pk in held]
+
+
+def retry_delay(attempts):
+    """
+    Seconds before the next attempt: doubled after each failure, capped, with jitter
+    so that events failing together do not all come back at once.
+    """
+    delay = getattr(settings, 'OUTBOX_RETRY_DELAY', 2) * 2 ** (attempts - 1)
+    return min(delay, getattr(settings, 'OUTBOX_MAX_RETRY_DELAY', 600)) * random.uniform(0.5, 1)
+
+
+def process_batch(batch_size):
+    """
+    Claim and dispatch one batch; returns the number of events per outcome.
+    """
+    outcomes = Counter()
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 10)
+    pending, delivered = claim(batch_size), []
+    renewed_at = time.monotonic()
+    while pending:
+        if time.monotonic() - renewed_at > _lease().total_seconds() / 2:
+            _delete(delivered)
+            pending, delivered = renew(pending), []
+            renewed_at = time.monotonic()
+            if not pending:
+                break
+        event = pending.pop(0)
+        try:
+            for handler in handlers_for(event.event_type):
+                handler(event)
+        except Exception as error:
+            last_error = f'{type(error).__name__}: {error}'
+            if event.attempts >= max_attempts:
+                changes = {'failed_at': timezone.now()}
+                outcomes[FAILED] += 1
+                logger.error('Outbox event %s (%s) failed %s times, giving up: %s', event.pk, event.event_type, event.attempts, last_error)
+            else:
+                changes = {'available_at': timezone.now() + timedelta(seconds=retry_delay(event.attempts))}
+                outcomes[RETRIED] += 1
+                logger.warning('Outbox event %s (%s) failed, attempt %s: %s', event.pk, event.event_type, event.attempts, last_error)
+            # A no-op if the lease expired and another worker has the event
+            OutboxEvent.objects.filter(pk=event.pk, attempts=event.attempts, available_at=event.available_at).update(
+                last_error=last_error, **changes,
+            )
+        else:
+            delivered.append(event)
+            outcomes[DELIVERED] += 1
+    _delete(delivered)
+    return outcomes
+
+
+def _delete(events):
+    if not events:
+        return
+    deleted, _ = OutboxEvent.objects.filter(pk__in=[event.pk for event in events], available_at=events[0].available_at).delete()
+    if deleted < len(events):
+        logger.warning('%s outbox events were delivered after their lease expired, they will be delivered again', len(events) - deleted)
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, 'OUTBOX_LEASE_SECONDS', 60))
+
+
+def run_worker(stop, batch_size, poll_interval, until_empty=False, report=None):
+    """
+    Process batches until `stop` (a threading.Event) is set, waiting `poll_interval`
+    seconds whenever nothing is due; or, with `until_empty`, until nothing is.
+    `report(outcomes)` is called after each batch.
+    """
+    totals = Counter()
+    while not stop.is_set():
+        # Long-running: drop connections that are too old or broken, like request_finished does
+        close_old_connections()
+        outcomes = process_batch(batch_size)
+        totals.update(outcomes)
+        if outcomes and report:
+            report(outcomes)
+        if not outcomes:
+            if until_empty:
+                break
+            stop.wait(poll_interval)
+    close_old_connections()
+    return totals
+
+
+def retry_failed():
+    """
+    Make the events that ran out of attempts due again, with new attempts.
+    """
+    return OutboxEvent.objects.exclude(failed_at=None).update(
+        failed_at=None, attempts=0, available_at=timezone.now(), last_error='',
+    )
+
+
+def log_event(event):
+    logger.info('Task event %s: task %s %s', event.event_type, event.task_id, event.payload)
+
+
+def post_webhook(event):
+    """
+    POST the event as JSON to OUTBOX_WEBHOOK_URL; any error or non-2xx status is retried.
+    """
+    body = json.dumps({
+        'id': event.pk, 'type': event.event_type, 'task': event.task_id,
+        'created_at': event.created_at.isoformat(), **event.payload,
+    }).encode()
+    request = urllib.request.Request(
+        settings.OUTBOX_WEBHOOK_URL, data=body, method='POST',
+        headers={'Content-Type': 'application/json', 'Idempotency-Key': f'task-event-{event.pk}'},
+    )
+    with urllib.request.urlopen(request, timeout=getattr(settings, 'OUTBOX_WEBHOOK_TIMEOUT', 5)):
+        pass
@@ -0,0 +1,186 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db import connections
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset):
+    """
+    Row count estimated by the PostgreSQL planner, without scanning the table.
+    Other databases fall back to an exact COUNT(*).
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def keyset_condition(queryset, names, position, ascending=True):
+    """
+    Row-value comparison `(a, b, id) > (x, y, z)`, which both PostgreSQL and SQLite
+    resolve with a single range scan on a matching composite index.
+    """
+    connection = connections[queryset.db]
+    opts = queryset.model._meta
+    table = connection.ops.quote_name(opts.db_table)
+    columns, params = [], []
+    for name, value in zip(names, position):
+        field = opts.get_field(name)
+        columns.append(f'{table}.{connection.ops.quote_name(field.column)}')
+        params.append(field.get_db_prep_value(value, connection))
+    operator = '>' if ascending else '<'
+    placeholders = ', '.join(['%s'] * len(params))
+    sql = f"({', '.join(columns)}) {operator} ({placeholders})"
+    return RawSQL(sql, params, output_field=BooleanField())
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on a full, indexed column tuple.
+
+    Unlike PageNumberPagination it never runs COUNT(*) or OFFSET: each page is a
+    `WHERE (a, b, id) > (...) ORDER BY a, b, id LIMIT n` index range scan, so deep
+    pages cost the same as the first one and rows inserted or updated between two
+    requests never shift the following pages. The tuple must end with a unique
+    column and all its columns must sort in the same direction.
+
+    Subclasses declare the orderings a client may pick with `?ordering=`.
+    Pass `?count=estimate` to add an `approximate_count` to the response.
+    """
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    count_query_param = 'count'
+    orderings = {}
+    default_ordering = None
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = self.get_ordering(request)
+        self.count_queryset = queryset
+
+        position, reverse = self.decode_cursor(request)
+        descending = self.fields[0].startswith('-')
+        names = [field.lstrip('-') for field in self.fields]
+        ascending = descending == reverse
+        if position is not None:
+            queryset = queryset.filter(self.keyset_condition(queryset, names, position, ascending))
+        queryset = queryset.order_by(*[name if ascending else '-' + name for name in names])
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+        if self.request.query_params.get(self.count_query_param) == 'estimate':
+            response['approximate_count'] = estimate_count(self.count_queryset)
+        return Response(response)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, request):
+        name = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        if name not in self.orderings:
+            raise ValidationError({self.ordering_query_param: f"Must be one of: {', '.join(self.orderings)}"})
+        return self.orderings[name]
+
+    def keyset_condition(self, queryset, names, position, ascending):
+        return keyset_condition(queryset, names, position, ascending)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        position = []
+        for field in self.fields:
+            name = field.lstrip('-')
+            # Model instances, or the dicts of a values() queryset (apps.core.serializers.rows)
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            position.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        payload = {'p': position}
+        if reverse:
+            payload['r'] = 1
+        token = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            position = payload['p']
+            if len(position) != len(self.fields):
+                raise ValueError
+            opts = self.count_queryset.model._meta
+            position = [opts.get_field(field.lstrip('-')).to_python(value) for field, value in zip(self.fields, position)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(payload.get('r'))
+
+
+class TaskCursorPagination(KeysetPagination):
+    orderings = {
+        'priority': ('priority', 'created_at', 'id'),
+        '-updated_at': ('-updated_at', '-id'),
+        '-comment_count': ('-comment_count', '-id'),
+    }
+    default_ordering = 'priority'
+
+
+class TaskHistoryCursorPagination(KeysetPagination):
+    orderings = {'changed_at': ('changed_at', 'id')}
+    default_ordering = 'changed_at'
+
+
+class TaskCommentCursorPagination(KeysetPagination):
+    orderings = {'commented_at': ('commented_at', 'id')}
+    default_ordering = 'commented_at'
+
+
+class UserCursorPagination(KeysetPagination):
+    orderings = {'username': ('username',)} # Unique, and indexed by its UNIQUE constraint
+    default_ordering = 'username'
@@ -0,0 +1,72 @@
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def get_query_budget(view_func, method):
+    """
+    Return the query budget declared by a view for the given HTTP method, or None.
+
+    Views declare budgets as a `query_budgets` dict keyed by action name
+    (viewsets) or by lower-case HTTP method (plain API views).
+    """
+    view_class = getattr(view_func, 'cls', None)
+    budgets = getattr(view_class, 'query_budgets', None)
+    if not budgets:
+        return None
+    actions = getattr(view_func, 'actions', None)
+    action = actions.get(method.lower()) if actions else method.lower()
+    return budgets.get(action)
+
+
+@contextmanager
+def query_budget(limit):
+    """
+    Fail with QueryBudgetExceeded if the block runs more than `limit` queries.
+
+        with query_budget(TaskViewSet.query_budgets['list']):
+            client.get('/api/tasks/')
+    """
+    with CaptureQueriesContext(connection) as context:
+        yield context
+    if len(context) > limit:
+        queries = '\n'.join(query['sql'] for query in context.captured_queries)
+        raise QueryBudgetExceeded(f'{len(context)} queries executed, budget is {limit}:\n{queries}')
+
+
+class QueryBudgetMiddleware:
+    """
+    Development middleware that raises QueryBudgetExceeded when a view runs more
+    queries than its declared budget. Enabled with DJANGO_QUERY_BUDGET=1.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = _QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        budget = getattr(request, '_query_budget', None)
+        if budget is not None and counter.count > budget:
+            raise QueryBudgetExceeded(
+                f'{request.method} {request.path} executed {counter.count} queries, budget is {budget}'
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = get_query_budget(view_func, request.method)
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
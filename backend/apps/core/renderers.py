@@ -0,0 +1,47 @@
+try:
+    import orjson
+except ImportError: # Optional: JSONRenderer is used without it
+    orjson = None
+import time
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from apps.core import metrics
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson: the same bytes, several times faster on
+    large responses. Datetimes are encoded natively, like DRF's encoder does
+    (ISO 8601, "Z" for UTC); anything orjson does not know goes through DRF's
+    encoder. Indented output, non-default JSON settings and data orjson rejects
+    fall back to JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        start = time.perf_counter()
+        try:
+            return self._render(data, accepted_media_type, renderer_context)
+        finally:
+            metrics.add_render_time(time.perf_counter() - start)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except TypeError: # e.g. integers over 64 bits, or a default() result orjson cannot encode
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes these two so that the output is also valid JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+_default = JSONEncoder().default
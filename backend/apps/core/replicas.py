@@ -0,0 +1,147 @@
+"""
+Read replicas (DATABASE_REPLICA_HOSTS). ReplicaRouter sends the reads of the
+requests that opt in (ReplicaReadsMixin.replica_actions, and the async task reads)
+to one replica per request, and everything else to the primary, 'default'.
+
+Replicas lag behind the primary, so a user who wrote something reads from the
+primary for REPLICA_STICKY_SECONDS afterwards, and sees their own writes. Writes
+are noticed by the router, whatever the code path (a write also moves the rest of
+its request to the primary), and remembered in the shared cache by
+ReplicaMiddleware once the request is done.
+
+Responses read from a replica are not stored in the response cache: they could
+miss a write that already bumped the version they would be stored under.
+"""
+import contextvars
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+from apps.core.cache import get_cache
+
+STICKY_KEY = 'db:sticky:{}'
+PRIMARY = 'default'
+
+_state = contextvars.ContextVar('replica_state', default=None)
+
+
+class RequestState:
+    __slots__ = ('replica', 'wrote')
+
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+def replica_databases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote:
+            return PRIMARY
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        # Also asked for querysets meant for writing, select_for_update() included
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {PRIMARY, *replica_databases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def read_from_replica(user):
+    """
+    Send the rest of the current request's reads to a replica, unless `user` wrote
+    within REPLICA_STICKY_SECONDS. Returns whether it did.
+    """
+    state = _state.get()
+    databases = replica_databases()
+    if state is None or not databases or state.wrote:
+        return False
+    if user is not None and user.is_authenticated and get_cache().get(STICKY_KEY.format(user.pk)):
+        return False
+    state.replica = random.choice(databases)
+    return True
+
+
+def reading_from_replica():
+    state = _state.get()
+    return state is not None and state.replica is not None and not state.wrote
+
+
+def stick_to_primary(user):
+    get_cache().set(STICKY_KEY.format(user.pk), 1, timeout=getattr(settings, 'REPLICA_STICKY_SECONDS', 5))
+
+
+class ReplicaReadsMixin:
+    """
+    Serve the reads of `replica_actions` from a replica: viewset action names, or
+    lower-case HTTP methods for plain API views (like query_budgets). Only safe
+    methods are ever routed to a replica.
+    """
+    replica_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        action = getattr(self, 'action', None) or request.method.lower()
+        if request.method in SAFE_METHODS and action in self.replica_actions:
+            read_from_replica(request.user)
+
+
+class ReplicaMiddleware:
+    """
+    Tracks the writes of each request, and makes their user read from the primary
+    for REPLICA_STICKY_SECONDS. Installed when REPLICA_DATABASES is set.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = RequestState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            self.stick(request)
+        return response
+
+    async def __acall__(self, request):
+        state = RequestState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            await sync_to_async(self.stick)(request)
+        return response
+
+    @staticmethod
+    def stick(request):
+        # DRF sets request.user on the Django request once it has authenticated the token
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            stick_to_primary(user)
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from django.contrib.auth import get_user_model
 
 from apps.core.models import Task, TaskHistory, TaskComment
 
@@ -8,7 +9,9 @@ class TasksListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Task
-        fields = ['id', 'title','description', 'status','priority', 'created_at', 'updated_at', 'assigned_to_name' , 'assigned_to']
+        fields = ['id', 'title','description', 'status','priority', 'created_at', 'updated_at', 'assigned_to_name' , 'assigned_to', 'version',
+                  'comment_count', 'last_comment_at']
+        read_only_fields = ['version']
 
     def get_assigned_to_name(self, obj):
         return obj.assigned_to.username if obj.assigned_to else None
@@ -18,7 +21,8 @@ class TaskSerializer(serializers.ModelSerializer):
     assigned_to_name = serializers.SerializerMethodField()
     class Meta:
         model = Task
-        fields = ['id', 'title', 'description','created_at', 'created_by', 'assigned_to', 'status', 'priority', 'assigned_to_name']
+        fields = ['id', 'title', 'description','created_at', 'created_by', 'assigned_to', 'status', 'priority', 'assigned_to_name', 'version']
+        read_only_fields = ['version']
 
     def get_assigned_to_name(self, obj):
         return obj.assigned_to.username if obj.assigned_to else None
@@ -26,7 +30,6 @@ class TaskSerializer(serializers.ModelSerializer):
     def validate(self, data):
         if data['title'] == '':
             raise serializers.ValidationError("Title is required.")
-        print("USER:", self.context['request'].user)
         data['created_by'] = self.context['request'].user
         return data
 
@@ -37,7 +40,8 @@ class TaskSerializer(serializers.ModelSerializer):
         instance.title = validated_data.get('title', instance.title)
         instance.description = validated_data.get('description', instance.description)
         instance.priority = validated_data.get('priority', instance.priority)
-        instance.save()
+        # Only the edited fields: the status and assignee are changed by transitions
+        instance.save(update_fields=['title', 'description', 'priority', 'updated_at'])
         return instance
 
     def to_representation(self, instance):
@@ -58,8 +62,39 @@ class TaskHistorySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+HISTORY_COLUMNS = ('id', 'task', 'changed_at', 'changed_by', 'assigned_to', 'previous_status', 'new_status')
+
+
+def compact_history(entries):
+    """
+    History entries in columnar form: one row of HISTORY_COLUMNS values per entry,
+    users as ids, and a table of the usernames they refer to, loaded in one query.
+    Much smaller than TaskHistorySerializer output for long histories.
+    """
+    changed_at = serializers.DateTimeField()
+    rows = [
+        [entry.id, entry.task_id, changed_at.to_representation(entry.changed_at), entry.changed_by_id,
+         entry.assigned_to_id, entry.previous_status, entry.new_status]
+        for entry in entries
+    ]
+    user_ids = {row[3] for row in rows} | {row[4] for row in rows if row[4] is not None}
+    users = get_user_model().objects.filter(pk__in=user_ids).values_list('pk', 'username') if user_ids else []
+    return {'columns': HISTORY_COLUMNS, 'users': {str(pk): username for pk, username in users}, 'rows': rows}
+
+
 class TaskCommentSerializer(serializers.ModelSerializer):
     commented_by = serializers.StringRelatedField(read_only=True)
     class Meta:
         model = TaskComment
         fields = '__all__'
+
+
+class BulkTransitionSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=5000)
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids)) # Drop duplicates, keep the request order
+
+
+class BulkAssignSerializer(BulkTransitionSerializer):
+    assigned_to = serializers.PrimaryKeyRelatedField(queryset=get_user_model().objects.all())
@@ -1,8 +1,36 @@
+import asyncio
+import csv
+import io
+import json
 import pytest
+import threading
+from datetime import timedelta
+from asgiref.sync import async_to_sync
 from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import RefreshToken
-from apps.core.models import Task
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from apps.core.changes import changes_since, current_seq, encode_cursor
+from apps.core import metrics
+from apps.core.cache import get_cache
+from apps.core.counters import repair_comment_counts, wrong_counters
+from apps.core.events import RESYNC_FRAME, InProcessBroker, assignee_channel, get_broker, task_channel, task_event
+from apps.core.models import ArchivedTask, ArchivedTaskComment, ArchivedTaskHistory, OutboxEvent, Task, TaskComment, TaskCounter, TaskHistory
+from apps.core.outbox import claim, process_batch, renew
+from apps.core.query_budget import query_budget
+from apps.core.replicas import STICKY_KEY
+from apps.core.serializers.task import TaskCommentSerializer, TaskHistorySerializer, TaskSerializer, TasksListSerializer
+from apps.core.views import task_async
+from apps.core.views.events import _stream
+from apps.core.views.task import TaskViewSet
+from tasks_managment import serving
 
 @pytest.mark.django_db
 def test_list_tasks_requires_auth():
@@ -166,4 +194,974 @@ def test_create_comment():
     comment_res = client.post(f"/api/tasks/{task_id}/comment/", data={"comment": "This is a comment."}, format='json')
     assert comment_res.status_code == 201
     assert comment_res.data["comment"] == "This is a comment."
-    assert comment_res.data["commented_by"] == user.username
\ No newline at end of file
+    assert comment_res.data["commented_by"] == user.username
+
+@pytest.mark.django_db
+def test_task_endpoints_stay_within_query_budget():
+    users = [User.objects.create_user(username=f"budget{i}", password="pass1234") for i in range(5)]
+    refresh = RefreshToken.for_user(users[0])
+    access = str(refresh.access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    for i in range(20):
+        Task.objects.create(
+            title=f"Task {i}", priority=2, created_by=users[i % 5], assigned_to=users[(i + 1) % 5],
+            assigned_by=users[(i + 2) % 5], closed_by=users[(i + 3) % 5], deleted_by=users[(i + 4) % 5],
+        )
+    task = Task.objects.first()
+    for user in users:
+        task.history_record(changed_by=user, previous_status=Task.Status.OPEN, new_status=Task.Status.ASSIGNED, assigned_to=user)
+        TaskComment.objects.create(task=task, commented_by=user, comment="A comment")
+
+    with query_budget(TaskViewSet.query_budgets["list"]):
+        assert len(client.get("/api/tasks/").data) == 20
+    with query_budget(TaskViewSet.query_budgets["retrieve"]):
+        assert client.get(f"/api/tasks/{task.id}/").status_code == 200
+    with query_budget(TaskViewSet.query_budgets["history"]):
+        assert len(client.get(f"/api/tasks/{task.id}/history/").data) == 5
+    with query_budget(TaskViewSet.query_budgets["history"]):
+        assert len(client.get(f"/api/tasks/{task.id}/history/", {"compact": "true"}).data["rows"]) == 5
+    with query_budget(TaskViewSet.query_budgets["history_index"]):
+        assert len(client.get("/api/tasks/history/", {"compact": "true"}).data["results"]["rows"]) == 5
+    with query_budget(TaskViewSet.query_budgets["comments"]):
+        assert len(client.get(f"/api/tasks/{task.id}/comments/").data) == 5
+
+
+@pytest.mark.django_db
+def test_task_indexes_are_migrated():
+    with connection.cursor() as cursor:
+        task_indexes = connection.introspection.get_constraints(cursor, Task._meta.db_table)
+        history_indexes = connection.introspection.get_constraints(cursor, "core_taskhistory")
+        comment_indexes = connection.introspection.get_constraints(cursor, TaskComment._meta.db_table)
+    for name in ["task_status_priority_idx", "task_assignee_status_idx", "task_live_created_idx",
+                 "task_live_updated_idx", "task_priority_created_idx", "task_updated_id_idx"]:
+        assert name in task_indexes
+    for name in ["taskhistory_task_changed_idx", "taskhistory_user_changed_idx", "taskhistory_changed_idx"]:
+        assert name in history_indexes
+    assert "taskcomment_task_comment_idx" in comment_indexes
+
+@pytest.mark.django_db
+def test_list_tasks_cursor_pagination():
+    user = User.objects.create_user(username="cursor", password="pass1234")
+    refresh = RefreshToken.for_user(user)
+    access = str(refresh.access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    for i in range(7):
+        Task.objects.create(title=f"Task {i}", priority=i % 3, created_by=user)
+    expected = list(Task.objects.order_by("priority", "created_at", "id").values_list("id", flat=True))
+
+    res = client.get("/api/tasks/", {"pagination": "cursor", "page_size": 3, "count": "estimate"})
+    assert res.status_code == 200
+    assert res.data["previous"] is None
+    assert res.data["approximate_count"] == 7
+    seen = [task["id"] for task in res.data["results"]]
+    next_url = res.data["next"]
+    while next_url:
+        res = client.get(next_url)
+        seen += [task["id"] for task in res.data["results"]]
+        next_url = res.data["next"]
+        # A task inserted before the cursor must not shift the remaining pages
+        Task.objects.create(title="Inserted", priority=0, created_by=user)
+    assert seen == expected
+
+    res = client.get(res.data["previous"])
+    assert [task["id"] for task in res.data["results"]] == expected[3:6]
+
+    res = client.get("/api/tasks/", {"pagination": "cursor", "cursor": "not-a-cursor"})
+    assert res.status_code == 404
+
+@pytest.mark.django_db
+def test_task_history_cursor_pagination():
+    user = User.objects.create_user(username="cursor_history", password="pass1234")
+    refresh = RefreshToken.for_user(user)
+    access = str(refresh.access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    task = Task.objects.create(title="Task with history", priority=2, created_by=user)
+    for _ in range(5):
+        task.history_record(changed_by=user, previous_status=Task.Status.OPEN, new_status=Task.Status.ASSIGNED, assigned_to=user)
+
+    res = client.get(f"/api/tasks/{task.id}/history/", {"pagination": "cursor", "page_size": 4})
+    assert len(res.data["results"]) == 4
+    res = client.get(res.data["next"])
+    assert len(res.data["results"]) == 1
+    assert res.data["next"] is None
+
+@pytest.mark.django_db
+def test_compact_and_cross_task_history():
+    user = User.objects.create_user(username="history_user", password="pass1234")
+    other = User.objects.create_user(username="history_other", password="pass1234")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+    first = Task.objects.create(title="First", priority=2, created_by=user)
+    second = Task.objects.create(title="Second", priority=2, created_by=user)
+    for task, changed_by in [(first, user), (second, other), (second, user), (first, other), (second, user)]:
+        task.history_record(changed_by=changed_by, previous_status=Task.Status.OPEN, new_status=Task.Status.ASSIGNED, assigned_to=other)
+
+    full = client.get(f"/api/tasks/{second.id}/history/").data
+    compact = client.get(f"/api/tasks/{second.id}/history/", {"compact": "true"}).data
+    assert compact["users"] == {str(user.id): "history_user", str(other.id): "history_other"}
+    rows = [dict(zip(compact["columns"], row)) for row in compact["rows"]]
+    assert [(row["id"], row["changed_at"], compact["users"][str(row["changed_by"])]) for row in rows] == \
+        [(entry["id"], entry["changed_at"], entry["changed_by"]) for entry in full]
+
+    # Everything a user changed, across tasks, by pages
+    res = client.get("/api/tasks/history/", {"changed_by": user.id, "page_size": 2})
+    assert res.status_code == 200
+    seen = [(entry["task"], entry["changed_by"]) for entry in res.data["results"]]
+    seen += [(entry["task"], entry["changed_by"]) for entry in client.get(res.data["next"]).data["results"]]
+    assert seen == [(first.id, "history_user"), (second.id, "history_user"), (second.id, "history_user")]
+    res = client.get("/api/tasks/history/", {"changed_by": other.id, "task": first.id, "compact": "true"})
+    assert [row[1] for row in res.data["results"]["rows"]] == [first.id]
+    assert client.get("/api/tasks/history/", {"changed_at_after": "not-a-date"}).status_code == 400
+
+@pytest.mark.django_db
+def test_archive_and_restore_tasks():
+    user = User.objects.create_user(username="archiver", password="pass1234")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+    tasks = [Task.objects.create(title=f"Task {i}", priority=2, created_by=user) for i in range(4)]
+    for task in tasks[:3]:
+        assert client.patch(f"/api/tasks/{task.id}/assign/", {"assigned_to": user.id}).status_code == 200
+        TaskComment.objects.create(task=task, commented_by=user, comment="Done")
+    assert client.patch(f"/api/tasks/{tasks[0].id}/close/").status_code == 200
+    assert client.patch(f"/api/tasks/{tasks[1].id}/delete_task/").status_code == 200
+    Task.objects.filter(pk__in=[tasks[0].id, tasks[1].id]).update(updated_at=timezone.now() - timedelta(days=100))
+    before = {path: client.get(f"/api/tasks/{tasks[0].id}/{path}").data for path in ("", "history/", "comments/")}
+
+    call_command("archive_tasks", older_than=90, batch_size=1, pause=0, stdout=io.StringIO())
+    assert set(ArchivedTask.objects.values_list("id", flat=True)) == {tasks[0].id, tasks[1].id}
+    assert ArchivedTaskHistory.objects.count() == 4 and ArchivedTaskComment.objects.count() == 2
+    assert not TaskHistory.objects.filter(task_id__in=[tasks[0].id, tasks[1].id]).exists()
+    assert wrong_counters() == {}
+    assert [task["id"] for task in client.get("/api/tasks/").data] == [tasks[2].id, tasks[3].id]
+    # Reads fall back to the archive, writes need a restore
+    for path, data in before.items():
+        assert client.get(f"/api/tasks/{tasks[0].id}/{path}").data == data
+    assert client.patch(f"/api/tasks/{tasks[0].id}/assign/", {"assigned_to": user.id}).status_code == 404
+    assert client.post(f"/api/tasks/{tasks[2].id}/restore/").status_code == 404
+
+    res = client.post(f"/api/tasks/{tasks[0].id}/restore/")
+    assert res.status_code == 200
+    assert {key: res.data[key] for key in ("id", "status", "version")} == {key: before[""][key] for key in ("id", "status", "version")}
+    for path, data in before.items():
+        assert client.get(f"/api/tasks/{tasks[0].id}/{path}").data == data
+    assert list(ArchivedTask.objects.values_list("id", flat=True)) == [tasks[1].id]
+    assert wrong_counters() == {}
+    assert client.get("/api/tasks/changes/", {"since": encode_cursor(0)}).data["results"][-1]["id"] == tasks[0].id
+
+def test_server_sizing(monkeypatch):
+    for name in ("WEB_CONCURRENCY", "SERVER_THREADS", "DB_POOL_MAX_SIZE"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(serving, "cpu_count", lambda: 4)
+    assert (serving.workers("wsgi"), serving.threads("wsgi"), serving.pool_size("wsgi")) == (9, 4, 4)
+    assert (serving.workers("asgi"), serving.threads("asgi"), serving.pool_size("asgi")) == (4, 1, 10)
+    monkeypatch.setenv("SERVER_THREADS", "8")
+    monkeypatch.setenv("WEB_CONCURRENCY", "2")
+    assert (serving.workers("wsgi"), serving.pool_size("wsgi")) == (2, 8)
+    monkeypatch.setenv("SERVER_MODE", "prod")
+    with pytest.raises(ValueError):
+        serving.mode()
+
+@pytest.mark.django_db
+def test_metrics_endpoint(settings, caplog):
+    metrics.reset()
+    user = User.objects.create_user(username="metrics", password="pass1234")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+    task = Task.objects.create(title="Measured", created_by=user)
+    for _ in range(3):
+        assert client.get("/api/tasks/").status_code == 200
+    assert client.get(f"/api/tasks/{task.id}/history/").status_code == 200
+    assert client.get("/api/tasks/999999/").status_code == 404
+
+    settings.SERVER_MODE = "wsgi" # Production modes only serve the metrics with a token
+    assert APIClient().get("/metrics").status_code == 403
+    settings.METRICS_TOKEN = "scrape-token"
+    assert APIClient().get("/metrics").status_code == 401
+    res = APIClient().get("/metrics", HTTP_AUTHORIZATION="Bearer scrape-token")
+    assert res.status_code == 200 and res["Content-Type"].startswith("text/plain")
+    text = res.content.decode()
+    assert 'http_requests_total{view="task-list",action="list",method="GET",status="200"} 3' in text
+    assert 'http_requests_total{view="task-detail",action="retrieve",method="GET",status="404"} 1' in text
+    assert 'http_request_duration_seconds_count{view="task-history",action="history",method="GET"} 1' in text
+    assert 'http_request_duration_seconds_bucket{view="task-list",action="list",method="GET",le="+Inf"} 3' in text
+    samples = dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+    assert int(samples['http_sql_queries_total{view="task-list",action="list",method="GET"}']) >= 1
+    assert float(samples['http_render_duration_seconds_total{view="task-list",action="list",method="GET"}']) > 0
+    assert int(samples['http_response_bytes_total{view="task-list",action="list",method="GET"}']) == 3 * len(client.get("/api/tasks/").content)
+    assert "task_response_cache_hits_total" in samples and "auth_blacklist_filter_entries" in samples
+
+    # Sampled slow requests are logged with their SQL and the EXPLAIN of their slowest SELECTs
+    settings.SLOW_REQUEST_THRESHOLD_MS = 0.000001
+    settings.SLOW_REQUEST_SAMPLE_RATE = 1.0
+    settings.TASK_RESPONSE_CACHE = False
+    with caplog.at_level("WARNING", logger="apps.core.metrics"):
+        client.get(f"/api/tasks/{task.id}/history/")
+    assert "Slow request: GET /api/tasks/" in caplog.text and "EXPLAIN" in caplog.text and "core_taskhistory" in caplog.text
+    # Only the parameters of the EXPLAINed SELECTs are logged, not those of the writes
+    caplog.clear()
+    with caplog.at_level("WARNING", logger="apps.core.metrics"):
+        APIClient().post("/api/auth/register/", data={
+            "first_name": "slow", "last_name": "writer", "password": "newpass123", "password_confirm": "newpass123",
+        })
+    assert "INSERT INTO" in caplog.text and User.objects.get(username="slow_writer").password not in caplog.text
+
+def test_metrics_of_exited_threads_are_merged():
+    metrics.reset()
+
+    def record():
+        request = RequestFactory().get("/nowhere/")
+        metrics.MetricsMiddleware.finish(request, HttpResponse(b"ok"), metrics.RequestStats(capture=False), 0.001)
+
+    # A server starting a thread per request
+    for _ in range(20):
+        thread = threading.Thread(target=record)
+        thread.start()
+        thread.join()
+    record()
+    assert len(metrics._shards) <= 2
+    assert metrics.snapshot()[("unmatched", "", "GET", 200)][metrics.COUNT] == 21
+
+outbox_deliveries = []
+
+def _record_outbox_event(event):
+    outbox_deliveries.append((event.event_type, event.task_id, event.payload["new_status"]))
+
+def _failing_outbox_handler(event):
+    raise ConnectionError("webhook down")
+
+@pytest.mark.django_db(transaction=True)
+def test_outbox_events_are_delivered_with_retries(settings):
+    outbox_deliveries.clear()
+    settings.OUTBOX_HANDLERS = {"*": [f"{__name__}._record_outbox_event"]}
+    user = User.objects.create_user(username="outbox", password="pass1234")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+    tasks = [Task.objects.create(title=f"Outbox {i}", created_by=user) for i in range(3)]
+
+    # One extra INSERT in the transition's transaction
+    with CaptureQueriesContext(connection) as queries:
+        assert client.patch(f"/api/tasks/{tasks[0].id}/assign/", data={"assigned_to": user.id}).status_code == 200
+    assert len([query for query in queries if query["sql"].startswith('INSERT INTO "core_outboxevent"')]) == 1
+    client.patch("/api/tasks/bulk_delete/", {"ids": [tasks[1].id, tasks[2].id]}, format="json")
+    assert client.patch(f"/api/tasks/{tasks[0].id}/close/").status_code == 200
+    assert client.patch(f"/api/tasks/{tasks[0].id}/close/").status_code == 400 # No event for a refused transition
+    assert OutboxEvent.objects.count() == 4
+
+    out = io.StringIO()
+    workers = 2 if connection.vendor == "postgresql" else 1 # SQLite locks whole tables, SKIP LOCKED needs row locks
+    call_command("run_outbox_worker", once=True, batch_size=3, workers=workers, stdout=out)
+    assert "Done: 4 delivered, 0 retried, 0 failed" in out.getvalue()
+    assert sorted(outbox_deliveries) == sorted([
+        ("task.assigned", tasks[0].id, Task.Status.ASSIGNED), ("task.closed", tasks[0].id, Task.Status.CLOSED),
+        ("task.deleted", tasks[1].id, Task.Status.DELETED), ("task.deleted", tasks[2].id, Task.Status.DELETED),
+    ])
+    assert not OutboxEvent.objects.exists()
+
+    # Failures are retried later, then kept as failed
+    settings.OUTBOX_HANDLERS = {"task.assigned": [f"{__name__}._failing_outbox_handler"]}
+    settings.OUTBOX_MAX_ATTEMPTS = 2
+    task = Task.objects.create(title="Outbox retry", created_by=user)
+    client.patch(f"/api/tasks/{task.id}/assign/", data={"assigned_to": user.id})
+    call_command("run_outbox_worker", once=True, stdout=out)
+    event = OutboxEvent.objects.get()
+    assert (event.attempts, event.failed_at, event.last_error) == (1, None, "ConnectionError: webhook down")
+    assert event.available_at > timezone.now()
+    OutboxEvent.objects.update(available_at=timezone.now())
+    call_command("run_outbox_worker", once=True, stdout=out)
+    assert OutboxEvent.objects.get().failed_at is not None
+    call_command("run_outbox_worker", retry_failed=True, stdout=out)
+    settings.OUTBOX_HANDLERS = {}
+    call_command("run_outbox_worker", once=True, stdout=out)
+    assert not OutboxEvent.objects.exists()
+
+stolen_outbox_events = []
+
+def _stalling_outbox_handler(event):
+    # The worker stalls on its first event past the lease, and another one claims the rest
+    if not stolen_outbox_events:
+        OutboxEvent.objects.exclude(pk=event.pk).update(available_at=timezone.now())
+        stolen_outbox_events.extend(claim(10))
+    elif event.task_id == 2:
+        raise ConnectionError("webhook down")
+
+@pytest.mark.django_db
+def test_outbox_worker_past_its_lease_leaves_the_events_to_their_new_owner(settings):
+    stolen_outbox_events.clear()
+    settings.OUTBOX_HANDLERS = {"*": [f"{__name__}._stalling_outbox_handler"]}
+    OutboxEvent.objects.bulk_create(OutboxEvent(event_type="task.closed", task_id=task_id, payload={}) for task_id in (1, 2, 3))
+
+    # Its delivery of event 3 and failure of event 2 do not touch the other worker's claims
+    assert process_batch(10) == {"delivered": 2, "retried": 1}
+    assert [event.task_id for event in stolen_outbox_events] == [2, 3]
+    assert list(OutboxEvent.objects.order_by("id").values_list("task_id", "attempts", "last_error", "available_at")) == [
+        (event.task_id, 2, "", event.available_at) for event in stolen_outbox_events
+    ]
+
+    # A worker that renews its lease keeps its events
+    settings.OUTBOX_LEASE_SECONDS = 0 # Renewed before every event
+    settings.OUTBOX_HANDLERS = {}
+    OutboxEvent.objects.update(available_at=timezone.now())
+    events = claim(10)
+    assert renew(events) == events and OutboxEvent.objects.filter(available_at=events[0].available_at).count() == 2
+    OutboxEvent.objects.update(available_at=timezone.now())
+    assert process_batch(10) == {"delivered": 2} and not OutboxEvent.objects.exists()
+
+@pytest.mark.django_db(transaction=True)
+def test_reads_go_to_replica_until_the_user_writes(settings):
+    # A second connection to the test database stands in for the replica. It is opened
+    # here: the test case only lets the databases it declares open connections
+    connections.settings["replica"] = connections["default"].settings_dict.copy()
+    connections["replica"].connect()
+    settings.REPLICA_DATABASES = ["replica"]
+    settings.DATABASE_ROUTERS = ["apps.core.replicas.ReplicaRouter"]
+    settings.MIDDLEWARE = ["apps.core.replicas.ReplicaMiddleware", *settings.MIDDLEWARE]
+    settings.TASK_RESPONSE_CACHE = False
+    try:
+        user = User.objects.create_user(username="replicated", password="pass1234")
+        task = Task.objects.create(title="Replicated", created_by=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+
+        def queries(method, path, **kwargs):
+            with CaptureQueriesContext(connections["default"]) as primary, CaptureQueriesContext(connections["replica"]) as replica:
+                assert getattr(client, method)(path, **kwargs).status_code == 200
+            return len(primary), len(replica)
+
+        for path in ("/api/tasks/", f"/api/tasks/{task.id}/", f"/api/tasks/{task.id}/history/", "/api/auth/users/"):
+            assert queries("get", path)[1] >= 1
+        assert queries("get", "/api/tasks/changes/", data={"since": encode_cursor(0)})[1] == 0
+        # Writes, and the rows they lock, stay on the primary; then the user reads their writes there
+        assert queries("patch", f"/api/tasks/{task.id}/assign/", data={"assigned_to": user.id})[1] == 0
+        assert queries("get", f"/api/tasks/{task.id}/")[1] == 0
+        get_cache().delete(STICKY_KEY.format(user.id)) # The window is over
+        assert queries("get", f"/api/tasks/{task.id}/")[1] >= 1
+    finally:
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+
+@pytest.mark.django_db
+def test_seed_tasks_is_deterministic_and_consistent():
+    for _ in range(2):
+        call_command("seed_tasks", tasks=60, users=5, batch_size=25, deep_every=30, deep_length=20, stdout=io.StringIO())
+    rows = list(Task.objects.order_by("id").values_list("title", "status", "priority", "assigned_to__username", "comment_count", "version"))
+    assert rows[:60] == rows[60:]
+    assert User.objects.filter(username__startswith="seed_user_").count() == 5
+    assert {row[1] for row in rows} == set(Task.Status.values)
+    assert TaskHistory.objects.count() > 60 and TaskComment.objects.filter(task_id=Task.objects.order_by("id")[29].id).count() == 20
+    assert wrong_counters() == {}
+    assert repair_comment_counts(verify=True) == {}
+    for task in Task.objects.exclude(status=Task.Status.OPEN).exclude(history=None)[:20]:
+        assert task.history.order_by("changed_at", "id").last().new_status == task.status
+
+@pytest.mark.django_db
+def test_explain_task_queries_seeds_and_explains():
+    out = io.StringIO()
+    try:
+        call_command("explain_task_queries", seed=50, batch_size=20, stdout=out)
+    except CommandError as error:
+        # SQLite may prefer a scan on so few rows; the plans were still produced
+        assert "Expected index not used" in str(error), error
+    assert Task.objects.count() == 50 and wrong_counters() == {}
+    task = Task.objects.latest("id")
+    assert task.comment_count == task.comments.count() == 100
+    assert "Seeded 50/50 tasks" in out.getvalue() and "task history" in out.getvalue()
+
+@pytest.mark.django_db
+def test_benchmark_api_compares_with_baseline(tmp_path):
+    call_command("seed_tasks", tasks=20, users=3, deep_every=10, deep_length=10, stdout=io.StringIO())
+    tasks = Task.objects.count()
+    baseline, output = tmp_path / "baseline.json", tmp_path / "results.json"
+    options = {"repeat": 2, "warmup": 0, "stdout": io.StringIO()}
+    call_command("benchmark_api", baseline=str(baseline), save_baseline=True, output=str(output), **options)
+    results = json.loads(output.read_text())["results"]
+    assert {"list", "history", "assign", "bulk_close", "restore", "import", "auth_login", "auth_logout"} <= set(results)
+    assert results["list"]["queries"] >= 1 and results["list"]["alloc_peak_kb"] > 0
+    assert Task.objects.count() == tasks # Rolled back
+
+    call_command("benchmark_api", only=["list"], baseline=str(baseline), tolerance=100, **options)
+    data = json.loads(baseline.read_text())
+    data["results"]["list"]["queries"] = 0
+    baseline.write_text(json.dumps(data))
+    with pytest.raises(CommandError, match="1 regressions"):
+        call_command("benchmark_api", only=["list"], baseline=str(baseline), tolerance=100, stderr=io.StringIO(), **options)
+
+@pytest.mark.django_db
+def test_fast_list_rendering_matches_serializers(settings):
+    user = User.objects.create_user(username="renderer", password="pass1234")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+    tasks = [
+        Task.objects.create(title="Zürich ☃ \u2028 line", description='"quoted" \\ </script>', created_by=user),
+        Task.objects.create(title="Unassigned", created_by=user),
+    ]
+    client.patch(f"/api/tasks/{tasks[0].id}/assign/", {"assigned_to": user.id})
+    TaskComment.objects.create(task=tasks[0], commented_by=user, comment="ünïcode \u2029")
+    Task.objects.filter(pk=tasks[1].id).update(created_at=timezone.now().replace(microsecond=0))
+
+    def expected(data):
+        return JSONRenderer().render(data)
+
+    settings.TASK_RESPONSE_CACHE = False # Cached responses are shared by all time zones
+    for time_zone in ("UTC", "Europe/Paris"):
+        settings.TIME_ZONE = time_zone
+        with timezone.override(time_zone):
+            live = Task.objects.select_related("assigned_to").order_by("id")
+            assert client.get("/api/tasks/").content == expected(TasksListSerializer(live, many=True).data)
+            history = TaskHistory.objects.filter(task=tasks[0]).select_related("changed_by", "assigned_to").order_by("changed_at", "id")
+            assert client.get(f"/api/tasks/{tasks[0].id}/history/").content == expected(TaskHistorySerializer(history, many=True).data)
+            comments = TaskComment.objects.filter(task=tasks[0]).select_related("commented_by")
+            assert client.get(f"/api/tasks/{tasks[0].id}/comments/").content == expected(TaskCommentSerializer(comments, many=True).data)
+    # Archived tasks are read through the same rows
+    client.patch(f"/api/tasks/{tasks[0].id}/close/")
+    Task.objects.filter(pk=tasks[0].id).update(updated_at=timezone.now() - timedelta(days=100))
+    before = {path: client.get(f"/api/tasks/{tasks[0].id}/{path}").content for path in ("history/", "comments/")}
+    call_command("archive_tasks", older_than=90, pause=0, stdout=io.StringIO())
+    assert ArchivedTask.objects.filter(pk=tasks[0].id).exists()
+    for path, content in before.items():
+        assert client.get(f"/api/tasks/{tasks[0].id}/{path}").content == content
+
+@pytest.mark.django_db
+def test_comment_counts():
+    user = User.objects.create_user(username="commenter", password="pass1234")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+    tasks = [Task.objects.create(title=f"Task {i}", priority=2, created_by=user) for i in range(3)]
+    stale = Task.objects.get(pk=tasks[0].id)
+    for task, count in zip(tasks, (2, 3, 0)):
+        for _ in range(count):
+            assert client.post(f"/api/tasks/{task.id}/comment/", {"comment": "Note"}, format="json").status_code == 201
+
+    stale.title = "Renamed"
+    stale.save() # Loaded before the comments: must not write back a zero count
+    listed = {task["id"]: task for task in client.get("/api/tasks/").data}
+    last = TaskComment.objects.filter(task=tasks[1]).latest("commented_at").commented_at
+    assert [listed[task.id]["comment_count"] for task in tasks] == [2, 3, 0]
+    assert listed[tasks[1].id]["last_comment_at"] == last.isoformat().replace("+00:00", "Z")
+    assert listed[tasks[2].id]["last_comment_at"] is None
+    res = client.get("/api/tasks/", {"pagination": "cursor", "ordering": "-comment_count"})
+    assert [task["id"] for task in res.data["results"]] == [tasks[1].id, tasks[0].id, tasks[2].id]
+
+    TaskComment.objects.filter(task=tasks[1]).latest("commented_at").delete()
+    assert Task.objects.get(pk=tasks[1].id).comment_count == 2
+    res = client.get(f"/api/tasks/{tasks[1].id}/comments/", {"pagination": "cursor", "page_size": 1})
+    assert len(res.data["results"]) == 1 and res.data["next"]
+
+    Task.objects.filter(pk=tasks[0].id).update(comment_count=7)
+    Task.objects.filter(pk=tasks[2].id).update(last_comment_at=timezone.now())
+    with pytest.raises(CommandError):
+        call_command("repair_comment_counts", verify=True, stdout=io.StringIO())
+    call_command("repair_comment_counts", batch_size=2, stdout=io.StringIO())
+    call_command("repair_comment_counts", verify=True, stdout=io.StringIO())
+    assert list(Task.objects.order_by("id").values_list("comment_count", flat=True)) == [2, 2, 0]
+
+@pytest.mark.django_db
+def test_filter_tasks():
+    user = User.objects.create_user(username="filter1", password="pass1234")
+    other = User.objects.create_user(username="filter2", password="pass1234")
+    refresh = RefreshToken.for_user(user)
+    access = str(refresh.access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    login = Task.objects.create(title="Fix login bug", description="Special characters in password", priority=0, created_by=user)
+    Task.objects.create(title="Dark mode", description="Add a dark theme", priority=2, created_by=other,
+                        assigned_to=other, status=Task.Status.ASSIGNED)
+    Task.objects.create(title="Old task", description="Nothing to do", priority=4, created_by=user, status=Task.Status.DELETED)
+
+    def titles(params):
+        res = client.get("/api/tasks/", params)
+        assert res.status_code == 200
+        return sorted(task["title"] for task in res.data)
+
+    assert titles({"status": Task.Status.ASSIGNED}) == ["Dark mode"]
+    assert titles({"status__in": "1,4"}) == ["Fix login bug", "Old task"]
+    assert titles({"priority__in": "0,2"}) == ["Dark mode", "Fix login bug"]
+    assert titles({"assigned_to": other.id}) == ["Dark mode"]
+    assert titles({"unassigned": "true", "created_by": user.id}) == ["Fix login bug", "Old task"]
+    assert titles({"created_at_after": login.created_at.isoformat()}) == ["Dark mode", "Fix login bug", "Old task"]
+    assert titles({"closed_at_after": login.created_at.isoformat()}) == []
+    assert titles({"q": "password login"}) == ["Fix login bug"]
+    assert client.get("/api/tasks/", {"status": "open"}).status_code == 400
+
+@pytest.mark.django_db
+def test_bulk_transitions():
+    user = User.objects.create_user(username="bulk1", password="pass1234")
+    assignee = User.objects.create_user(username="bulk2", password="pass1234")
+    refresh = RefreshToken.for_user(user)
+    access = str(refresh.access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    tasks = [Task.objects.create(title=f"Bulk {i}", priority=2, created_by=user) for i in range(30)]
+    closed = Task.objects.create(title="Closed", priority=2, created_by=user, status=Task.Status.CLOSED)
+    ids = [task.id for task in tasks]
+
+    with query_budget(13):
+        res = client.patch("/api/tasks/bulk_assign/", {"ids": ids + [closed.id, 999999], "assigned_to": assignee.id}, format="json")
+    assert res.status_code == 200
+    assert res.data["results"][:30] == [{"id": task_id, "success": True} for task_id in ids]
+    assert res.data["results"][30] == {"id": closed.id, "success": False, "error": "Cannot assign a closed or deleted task"}
+    assert res.data["results"][31] == {"id": 999999, "success": False, "error": "Task not found"}
+    assert Task.objects.filter(assigned_to=assignee, assigned_by=user, status=Task.Status.ASSIGNED).count() == 30
+    assert TaskHistory.objects.filter(new_status=Task.Status.ASSIGNED, assigned_to=assignee).count() == 30
+
+    res = client.patch("/api/tasks/bulk_close/", {"ids": ids[:10]}, format="json")
+    assert all(result["success"] for result in res.data["results"])
+    res = client.patch("/api/tasks/bulk_unassign/", {"ids": ids[:20]}, format="json")
+    assert [result["success"] for result in res.data["results"]] == [False] * 10 + [True] * 10
+    res = client.patch("/api/tasks/bulk_delete/", {"ids": ids}, format="json")
+    assert all(result["success"] for result in res.data["results"])
+    assert Task.objects.filter(status=Task.Status.DELETED, deleted_by=user).count() == 30
+
+    assert client.patch("/api/tasks/bulk_close/", {"ids": []}, format="json").status_code == 400
+    assert client.patch("/api/tasks/bulk_assign/", {"ids": ids}, format="json").status_code == 400
+
+@pytest.mark.django_db
+def test_import_tasks_ndjson():
+    user = User.objects.create_user(username="import1", password="pass1234")
+    refresh = RefreshToken.for_user(user)
+    access = str(refresh.access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    body = "\n".join([
+        '{"title": "Imported 1", "description": "From the old tracker", "priority": 1}',
+        '{"title": "Imported 2", "assigned_to": %d}' % user.id,
+        '{"description": "No title"}',
+        'not json',
+        '{"title": "Bad priority", "priority": 9}',
+        '',
+    ])
+    res = client.generic("POST", "/api/tasks/import/", body, content_type="application/x-ndjson")
+    assert res.status_code == 201
+    assert res.data["created"] == 2
+    assert res.data["failed"] == 3
+    assert [error["row"] for error in res.data["errors"]] == [3, 4, 5]
+    assert Task.objects.get(title="Imported 1").priority == 1
+    assigned = Task.objects.get(title="Imported 2")
+    assert assigned.status == Task.Status.ASSIGNED
+    assert assigned.assigned_to == user
+
+@pytest.mark.django_db
+def test_import_tasks_csv(tmp_path):
+    user = User.objects.create_user(username="import2", password="pass1234")
+    path = tmp_path / "tasks.csv"
+    path.write_text('title,description,priority\nFirst,"Multi\nline",0\nSecond,,\n,missing title,2\n')
+    call_command("import_tasks", str(path), user="import2", batch_size=2)
+    assert Task.objects.get(title="First").description == "Multi\nline"
+    assert Task.objects.get(title="Second").priority == Task.Priority.MINOR
+    assert Task.objects.filter(created_by=user).count() == 2
+
+    # Rows that are not UTF-8 are reported like malformed ones
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+    body = "title,priority\nCaf\u00e9,1\n".encode() + b"Caf\xe9,2\n"
+    res = client.generic("POST", "/api/tasks/import/", body, content_type="text/csv")
+    assert res.status_code == 201
+    assert (res.data["created"], res.data["errors"]) == (1, [{"row": 2, "errors": {"non_field_errors": ["Invalid row"]}}])
+    assert client.generic("POST", "/api/tasks/import/", b"title\nCaf\xe9\n", content_type="text/csv").status_code == 400
+
+@pytest.mark.django_db
+def test_export_tasks():
+    user = User.objects.create_user(username="export1", password="pass1234")
+    refresh = RefreshToken.for_user(user)
+    access = str(refresh.access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    task = Task.objects.create(title="Export me", description="Line one\nline two", priority=1, created_by=user, assigned_to=user)
+    Task.objects.create(title="Closed", priority=1, created_by=user, status=Task.Status.CLOSED)
+    task.history_record(changed_by=user, previous_status=Task.Status.OPEN, new_status=Task.Status.ASSIGNED, assigned_to=user)
+
+    res = client.get("/api/tasks/export/", {"status": Task.Status.OPEN})
+    assert res.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(b"".join(res.streaming_content).decode())))
+    assert len(rows) == 1
+    assert rows[0]["title"] == "Export me"
+    assert rows[0]["description"] == "Line one\nline two"
+    assert rows[0]["created_by"] == "export1"
+    assert rows[0]["closed_by"] == ""
+
+    res = client.get("/api/tasks/export/", {"resource": "history", "type": "ndjson"})
+    lines = b"".join(res.streaming_content).decode().splitlines()
+    assert [json.loads(line)["changed_by"] for line in lines] == ["export1"]
+    assert client.get("/api/tasks/export/", {"resource": "users"}).status_code == 400
+
+    # Under ASGI the export is streamed through an async iterator instead of being buffered
+    async def export_async():
+        response = await AsyncClient().get("/api/tasks/export/", {"status": Task.Status.OPEN}, headers={"Authorization": f"Bearer {access}"})
+        assert response.status_code == 200 and response.is_async
+        return b"".join([chunk async for chunk in response.streaming_content])
+    assert async_to_sync(export_async)() == b"".join(client.get("/api/tasks/export/", {"status": Task.Status.OPEN}).streaming_content)
+
+@pytest.mark.django_db
+def test_task_counters_follow_transitions():
+    user = User.objects.create_user(username="stats1", password="pass1234")
+    assignee = User.objects.create_user(username="stats2", password="pass1234")
+    refresh = RefreshToken.for_user(user)
+    access = str(refresh.access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    task_ids = [client.post("/api/tasks/", data={"title": f"Task {i}", "priority": i % 2}).data["id"] for i in range(4)]
+    client.patch(f"/api/tasks/{task_ids[0]}/assign/", data={"assigned_to": assignee.id})
+    client.patch(f"/api/tasks/{task_ids[0]}/close/")
+    client.patch("/api/tasks/bulk_assign/", {"ids": task_ids[1:3], "assigned_to": assignee.id}, format="json")
+    client.patch(f"/api/tasks/{task_ids[2]}/unassign/")
+    client.put(f"/api/tasks/{task_ids[2]}/", data={"title": "Task 2", "priority": 3})
+    client.patch("/api/tasks/bulk_delete/", {"ids": [task_ids[3]]}, format="json")
+    client.delete(f"/api/tasks/{task_ids[1]}/")
+    client.post("/api/tasks/import/", '{"title": "Imported", "assigned_to": %d}' % assignee.id, content_type="application/x-ndjson")
+
+    res = client.get("/api/tasks/stats/")
+    assert res.status_code == 200
+    assert res.data["by_status"] == [
+        {"status": Task.Status.OPEN, "count": 1},
+        {"status": Task.Status.ASSIGNED, "count": 1},
+        {"status": Task.Status.CLOSED, "count": 1},
+        {"status": Task.Status.DELETED, "count": 1},
+    ]
+    assert res.data["by_priority"] == [{"priority": 0, "count": 1}, {"priority": 1, "count": 1},
+                                       {"priority": 3, "count": 1}, {"priority": 4, "count": 1}]
+    assert res.data["by_assignee"] == [
+        {"assigned_to": assignee.id, "assigned_to_name": "stats2", "status": Task.Status.ASSIGNED, "count": 1},
+        {"assigned_to": assignee.id, "assigned_to_name": "stats2", "status": Task.Status.CLOSED, "count": 1},
+    ]
+    assert wrong_counters() == {}
+
+    TaskCounter.objects.all().delete()
+    with pytest.raises(CommandError):
+        call_command("rebuild_task_counters", verify=True)
+    call_command("rebuild_task_counters")
+    assert wrong_counters() == {}
+
+@pytest.mark.django_db
+def test_task_counters_survive_edits_interleaved_with_transitions():
+    user = User.objects.create_user(username="stats3", password="pass1234")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+    task = Task.objects.create(title="Raced", priority=2, created_by=user)
+
+    # Copies loaded before a transition, saved or deleted after it
+    def after_assign():
+        stale = Task.objects.get(pk=task.id)
+        assert client.patch(f"/api/tasks/{task.id}/assign/", data={"assigned_to": user.id}).status_code == 200
+        return stale
+
+    stale = after_assign()
+    stale.priority = Task.Priority.HIGH
+    stale.save(update_fields=["priority"])
+    assert Task.objects.filter(pk=task.id, status=Task.Status.ASSIGNED, priority=Task.Priority.HIGH).exists()
+    assert wrong_counters() == {}
+
+    client.patch(f"/api/tasks/{task.id}/unassign/")
+    stale = after_assign()
+    stale.priority = Task.Priority.LOW
+    stale.save() # Writes the whole copy back, status included
+    assert Task.objects.filter(pk=task.id, status=Task.Status.OPEN, priority=Task.Priority.LOW).exists()
+    assert wrong_counters() == {}
+
+    after_assign().delete()
+    assert wrong_counters() == {} and not TaskCounter.objects.exclude(count=0).exists()
+
+@pytest.mark.django_db
+def test_task_responses_are_cached_until_the_task_changes():
+    user = User.objects.create_user(username="cache1", password="pass1234")
+    refresh = RefreshToken.for_user(user)
+    access = str(refresh.access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    task = Task.objects.create(title="Cached", priority=2, created_by=user)
+    other = Task.objects.create(title="Other", priority=2, created_by=user)
+    before = client.get("/api/tasks/cache_stats/").data
+
+    assert client.get(f"/api/tasks/{task.id}/").data["title"] == "Cached"
+    assert len(client.get("/api/tasks/").data) == 2
+    with query_budget(2): # Only the authentication queries
+        assert client.get(f"/api/tasks/{task.id}/").data["title"] == "Cached"
+        assert len(client.get("/api/tasks/").data) == 2
+    assert client.get(f"/api/tasks/{other.id}/history/").data == []
+
+    client.patch(f"/api/tasks/{task.id}/assign/", data={"assigned_to": user.id})
+    assert client.get(f"/api/tasks/{task.id}/").data["status"] == Task.Status.ASSIGNED
+    assert sorted(task["status"] for task in client.get("/api/tasks/").data) == [Task.Status.OPEN, Task.Status.ASSIGNED]
+    client.post(f"/api/tasks/{task.id}/comment/", data={"comment": "Fresh"}, format="json")
+    assert len(client.get(f"/api/tasks/{task.id}/comments/").data) == 1
+
+    after = client.get("/api/tasks/cache_stats/").data
+    assert after["hits"] - before["hits"] == 2
+    assert after["misses"] - before["misses"] == 6
+
+    # Other spellings of the id share the task's version, so they are invalidated with it
+    for path in (f"/api/tasks/0{task.id}/", f"/api/tasks/+{task.id}/"):
+        assert client.get(path).data["title"] == "Cached"
+    client.patch(f"/api/tasks/{task.id}/", data={"title": "Renamed"}, format="json")
+    for path in (f"/api/tasks/0{task.id}/", f"/api/tasks/+{task.id}/"):
+        assert client.get(path).data["title"] == "Renamed"
+    assert client.get("/api/tasks/one/history/").status_code == 404
+
+@pytest.mark.django_db
+def test_task_etag_and_if_match():
+    user = User.objects.create_user(username="etag1", password="pass1234")
+    refresh = RefreshToken.for_user(user)
+    access = str(refresh.access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    task = Task.objects.create(title="Versioned", created_by=user)
+
+    res = client.get(f"/api/tasks/{task.id}/")
+    assert res["ETag"] == '"1"' and res.data["version"] == 1
+
+    res = client.patch(f"/api/tasks/{task.id}/assign/", data={"assigned_to": user.id}, HTTP_IF_MATCH='"1"')
+    assert res.status_code == 200
+    assert res["ETag"] == '"2"'
+    # A client still holding version 1 is refused instead of overwriting the assignment
+    res = client.patch(f"/api/tasks/{task.id}/unassign/", HTTP_IF_MATCH='"1"')
+    assert res.status_code == 412
+    res = client.put(f"/api/tasks/{task.id}/", data={"title": "Stale", "priority": 0}, format="json", HTTP_IF_MATCH='"1"')
+    assert res.status_code == 412
+    res = client.put(f"/api/tasks/{task.id}/", data={"title": "Fresh", "priority": 0}, format="json", HTTP_IF_MATCH='W/"2"')
+    assert res.status_code == 200
+    assert res["ETag"] == '"3"'
+    assert client.get(f"/api/tasks/{task.id}/")["ETag"] == '"3"'
+    assert client.patch(f"/api/tasks/{task.id}/close/", HTTP_IF_MATCH="latest").status_code == 400
+
+    task.refresh_from_db()
+    assert (task.title, task.status, task.version) == ("Fresh", Task.Status.ASSIGNED, 3)
+    assert TaskHistory.objects.filter(task=task).count() == 1
+
+    # An edit of a copy loaded before a transition keeps the transition, and takes a new version
+    stale = Task.objects.get(pk=task.id)
+    assert client.patch(f"/api/tasks/{task.id}/unassign/").status_code == 200
+    request = RequestFactory().patch(f"/api/tasks/{task.id}/")
+    request.user = user
+    serializer = TaskSerializer(stale, data={"title": "Edited"}, partial=True, context={"request": request})
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
+    task.refresh_from_db()
+    assert (task.title, task.status, task.assigned_to, task.version) == ("Edited", Task.Status.OPEN, None, 5)
+
+@pytest.mark.django_db
+def test_optimistic_transitions(settings):
+    settings.TASK_TRANSITION_MODE = "optimistic"
+    user = User.objects.create_user(username="cas1", password="pass1234")
+    refresh = RefreshToken.for_user(user)
+    access = str(refresh.access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    task = Task.objects.create(title="Optimistic", created_by=user)
+
+    with query_budget(14): # No SELECT ... FOR UPDATE, one compare-and-swap UPDATE
+        res = client.patch(f"/api/tasks/{task.id}/assign/", data={"assigned_to": user.id})
+    assert res.status_code == 200
+    assert res.data["status"] == Task.Status.ASSIGNED and res.data["version"] == 2
+    assert client.patch(f"/api/tasks/{task.id}/close/").status_code == 200
+    assert client.patch(f"/api/tasks/{task.id}/close/").data == "Only assigned tasks can be closed"
+    assert client.patch("/api/tasks/999999/close/").status_code == 404
+
+    task.refresh_from_db()
+    assert (task.status, task.closed_by, task.version) == (Task.Status.CLOSED, user, 3)
+    assert TaskHistory.objects.filter(task=task).count() == 2
+    assert wrong_counters() == {}
+
+@pytest.mark.django_db
+def test_task_changes_since_cursor():
+    user = User.objects.create_user(username="sync1", password="pass1234")
+    refresh = RefreshToken.for_user(user)
+    access = str(refresh.access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    untouched = Task.objects.create(title="Untouched", created_by=user)
+    edited = Task.objects.create(title="Edited", created_by=user)
+
+    cursor = client.get("/api/tasks/changes/").data["cursor"]
+    res = client.get("/api/tasks/changes/", {"since": cursor})
+    assert res.data["results"] == [] and res.data["has_more"] is False
+
+    client.patch(f"/api/tasks/{edited.id}/", data={"title": "Edited twice"}, format="json")
+    Task.objects.filter(pk=edited.pk).update(priority=0) # Writes that bypass save() are tracked too
+    Task.objects.bulk_create([Task(title=f"Bulk {i}", created_by=user) for i in range(3)])
+    client.patch("/api/tasks/bulk_delete/", data={"ids": [untouched.id]}, format="json")
+    with query_budget(3): # Authentication, cursor, changes
+        res = client.get("/api/tasks/changes/", {"since": cursor})
+    assert [task["title"] for task in res.data["results"]] == ["Edited twice", "Bulk 0", "Bulk 1", "Bulk 2", "Untouched"]
+    assert res.data["results"][-1]["status"] == Task.Status.DELETED
+
+    cursor = res.data["cursor"]
+    assert client.get("/api/tasks/changes/", {"since": cursor}).data["results"] == []
+    Task.objects.filter(pk__in=[untouched.pk, edited.pk]).update(priority=1)
+    res = client.get("/api/tasks/changes/", {"since": cursor})
+    assert {task["id"] for task in res.data["results"]} == {untouched.id, edited.id}
+    assert client.get("/api/tasks/changes/", {"since": "nope"}).status_code == 400
+
+@pytest.mark.django_db
+def test_task_changes_are_paged():
+    user = User.objects.create_user(username="sync2", password="pass1234")
+    cursor = encode_cursor(current_seq())
+    Task.objects.bulk_create([Task(title=f"Task {i}", created_by=user) for i in range(5)])
+    titles = []
+    while True:
+        tasks, cursor, has_more = changes_since(cursor, limit=2)
+        titles += [task.title for task in tasks]
+        if not has_more:
+            break
+    assert titles == [f"Task {i}" for i in range(5)]
+
+@pytest.mark.django_db
+def test_task_changes_stop_at_a_running_transaction(monkeypatch):
+    user = User.objects.create_user(username="sync3", password="pass1234")
+    cursor = encode_cursor(current_seq())
+    Task.objects.bulk_create([Task(title=f"Task {i}", created_by=user) for i in range(5)])
+    # A transaction that started before these writes is still running
+    floor = Task.objects.order_by("change_seq").values_list("change_seq", flat=True).first()
+    monkeypatch.setattr("apps.core.changes.current_seq", lambda using="default": floor)
+
+    tasks, next_cursor, has_more = changes_since(cursor, limit=2)
+    assert [task.title for task in tasks] == ["Task 0", "Task 1"]
+    assert (next_cursor, has_more) == (encode_cursor(floor), False)
+    # Asking again returns the same page, without has_more
+    assert changes_since(next_cursor, limit=2)[1:] == (next_cursor, False)
+
+def _event_ticket(client):
+    res = client.post("/api/tasks/events/ticket/")
+    assert res.status_code == 200
+    return res.data["ticket"]
+
+@pytest.mark.django_db
+def test_task_events_endpoint_validation():
+    user = User.objects.create_user(username="push1", password="pass1234")
+    client = APIClient()
+    assert client.post("/api/tasks/events/ticket/").status_code == 401
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+    # Under WSGI the stream would never be flushed: refused before anything else
+    assert client.get("/api/tasks/events/", {"task": 1, "ticket": _event_ticket(client)}).status_code == 501
+
+    async_client = AsyncClient()
+    ticket = _event_ticket(client)
+    for params, status_code in [
+        ({"task": 1}, 401),
+        ({"task": 1, "ticket": "garbage"}, 401),
+        ({"ticket": ticket}, 400),
+        ({"task": 1, "ticket": ticket}, 401), # Already used
+        ({"task": "one", "ticket": _event_ticket(client)}, 400),
+    ]:
+        assert async_to_sync(async_client.get)("/api/tasks/events/", params).status_code == status_code
+
+@pytest.mark.django_db
+def test_task_events_stream_through_the_asgi_handler():
+    user = User.objects.create_user(username="push3", password="pass1234")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+    ticket = _event_ticket(client)
+
+    async def subscribe():
+        response = await AsyncClient().get("/api/tasks/events/", {"task": 7, "ticket": ticket})
+        assert response.status_code == 200 and response["Content-Type"] == "text/event-stream"
+        chunks = aiter(response.streaming_content)
+        first = await anext(chunks)
+        get_broker().publish([task_event("task.updated", 7, version=3)])
+        second = await asyncio.wait_for(anext(chunks), 5)
+        await chunks.aclose()
+        return first, second
+    first, second = async_to_sync(subscribe)()
+    assert first.startswith(b"retry:")
+    assert second.startswith(b"event: task.updated\ndata:") and b'"version":3' in second
+    assert get_broker().subscriptions == {}
+
+@pytest.mark.django_db
+def test_task_events_are_pushed(django_capture_on_commit_callbacks):
+    user = User.objects.create_user(username="push2", password="pass1234")
+    access = str(RefreshToken.for_user(user).access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    task = Task.objects.create(title="Pushed", created_by=user)
+    other = Task.objects.create(title="Quiet", created_by=user)
+
+    loop = asyncio.new_event_loop()
+    stream = _stream([task_channel(task.id), assignee_channel(user.id)])
+    assert loop.run_until_complete(stream.__anext__()).startswith("retry:")
+    with django_capture_on_commit_callbacks(execute=True):
+        client.patch(f"/api/tasks/{task.id}/assign/", data={"assigned_to": user.id})
+        client.patch(f"/api/tasks/{other.id}/", data={"title": "Still quiet"}, format="json")
+        client.post(f"/api/tasks/{task.id}/comment/", data={"comment": "Hi"}, format="json")
+        client.patch("/api/tasks/bulk_close/", data={"ids": [task.id]}, format="json")
+    frames = [loop.run_until_complete(stream.__anext__()) for _ in range(3)]
+    assert [frame.split("\n")[0] for frame in frames] == ["event: task.assigned", "event: task.commented", "event: task.closed"]
+    assert json.loads(frames[0].split("data: ")[1]) == {
+        "type": "task.assigned", "task": task.id, "status": Task.Status.ASSIGNED, "assigned_to": user.id, "version": 2,
+    }
+    loop.run_until_complete(stream.aclose())
+    loop.close()
+    assert get_broker().subscriptions == {}
+
+def test_slow_subscriber_is_told_to_resync(settings):
+    settings.TASK_EVENT_BUFFER = 3
+    broker = InProcessBroker()
+    loop = asyncio.new_event_loop()
+
+    async def subscribe():
+        return broker.subscribe(["task:1"])
+    subscription = loop.run_until_complete(subscribe())
+    for version in range(10):
+        broker.publish([task_event("task.updated", 1, version=version)])
+    frames = [loop.run_until_complete(subscription.get(timeout=0.1)) for _ in range(2)]
+    assert frames == [RESYNC_FRAME, None]
+    broker.publish([task_event("task.updated", 1, version=10)])
+    assert '"version":10' in loop.run_until_complete(subscription.get(timeout=0.1))
+    subscription.close()
+    loop.close()
+
+def _async_get(view, path, access, **kwargs):
+    request = RequestFactory().get(path, HTTP_AUTHORIZATION=f"Bearer {access}") if access else RequestFactory().get(path)
+    response = async_to_sync(view)(request, **kwargs)
+    if hasattr(response, "render"): # DRF fallback responses are rendered by the request handler
+        response.render()
+    return response
+
+@pytest.mark.django_db
+def test_async_reads_match_sync_reads(settings):
+    settings.TASK_RESPONSE_CACHE = False # Compare what each path builds, not shared cache entries
+    user = User.objects.create_user(username="async1", password="pass1234")
+    access = str(RefreshToken.for_user(user).access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    task = Task.objects.create(title="Async", description="Read me", created_by=user)
+    Task.objects.create(title="Other", priority=0, created_by=user)
+    client.patch(f"/api/tasks/{task.id}/assign/", data={"assigned_to": user.id})
+    client.post(f"/api/tasks/{task.id}/comment/", data={"comment": "Héllo"}, format="json")
+
+    pk = str(task.id)
+    for path, view, kwargs in [
+        ("/api/tasks/", task_async.task_list, {}),
+        ("/api/tasks/?priority__in=0,4&q=read", task_async.task_list, {}),
+        (f"/api/tasks/{pk}/", task_async.task_detail, {"pk": pk}),
+        (f"/api/tasks/{pk}/history/", task_async.task_history, {"pk": pk}),
+        (f"/api/tasks/{pk}/comments/", task_async.task_comments, {"pk": pk}),
+        ("/api/tasks/999999/", task_async.task_detail, {"pk": "999999"}),
+        ("/api/tasks/999999/history/", task_async.task_history, {"pk": "999999"}),
+        ("/api/tasks/?status=open", task_async.task_list, {}),
+    ]:
+        expected = client.get(path)
+        response = _async_get(view, path, access, **kwargs)
+        assert (response.status_code, response.content) == (expected.status_code, expected.content), path
+    assert _async_get(task_async.task_detail, f"/api/tasks/{pk}/", access, pk=pk)["ETag"] == client.get(f"/api/tasks/{pk}/")["ETag"]
+    assert _async_get(task_async.task_list, "/api/tasks/", None).status_code == 401
+
+@pytest.mark.django_db(transaction=True)
+def test_async_overview_reads_concurrently(settings):
+    settings.TASK_RESPONSE_CACHE = False
+    user = User.objects.create_user(username="async2", password="pass1234")
+    access = str(RefreshToken.for_user(user).access_token)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    task = Task.objects.create(title="Overview", created_by=user)
+    client.patch(f"/api/tasks/{task.id}/assign/", data={"assigned_to": user.id})
+    client.post(f"/api/tasks/{task.id}/comment/", data={"comment": "First"}, format="json")
+    client.post(f"/api/tasks/{task.id}/comment/", data={"comment": "Earlier"}, format="json")
+    # Rows stored out of time order: both paths must sort them the same way
+    TaskComment.objects.filter(comment="Earlier").update(commented_at=timezone.now() - timedelta(days=1))
+
+    expected = client.get(f"/api/tasks/{task.id}/overview/")
+    assert [len(expected.data[key]) for key in ("history", "comments")] == [1, 2]
+    assert [comment["comment"] for comment in expected.data["comments"]] == ["Earlier", "First"]
+    response = _async_get(task_async.task_overview, f"/api/tasks/{task.id}/overview/", access, pk=str(task.id))
+    assert response.content == expected.content
@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404
+from django.utils import timezone
+from rest_framework import status
+
+from apps.core import cache as response_cache
+from apps.core import events
+from apps.core.models import Task, TaskCounter
+
+LOCK = 'lock'
+OPTIMISTIC = 'optimistic'
+OPTIMISTIC_RETRIES = 3
+
+
+class TransitionError(Exception):
+    status_code = status.HTTP_400_BAD_REQUEST
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class VersionConflict(TransitionError):
+    """
+    The task changed since the version the client sent in If-Match.
+    """
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+
+
+class ConcurrentModification(TransitionError):
+    status_code = status.HTTP_409_CONFLICT
+
+
+def transition_fields(new_status, user, assigned_to=None):
+    """
+    Task fields written by each transition, besides the status itself.
+    """
+    now = timezone.now()
+    if new_status == Task.Status.ASSIGNED:
+        return {'assigned_to': assigned_to, 'assigned_by': user, 'assigned_at': now}
+    if new_status == Task.Status.OPEN:
+        return {'assigned_to': None, 'assigned_by': None, 'assigned_at': None}
+    if new_status == Task.Status.CLOSED:
+        return {'closed_by': user, 'closed_at': now}
+    return {'deleted_by': user, 'deleted_at': now}
+
+
+def transition_task(task_id, new_status, user, assigned_to=None, expected_version=None, mode=None):
+    """
+    Move a task to `new_status` and record it in its history.
+
+    In `lock` mode the row is locked with SELECT ... FOR UPDATE for the whole
+    transaction, so concurrent transitions of the same task wait for each other.
+    In `optimistic` mode nothing is locked: the change is a compare-and-swap
+    `UPDATE ... WHERE version = n`, retried on conflict, and concurrent requests
+    never wait on each other. Passing `expected_version` (the client's If-Match)
+    always uses the optimistic path and raises VersionConflict instead of retrying.
+    """
+    mode = mode or getattr(settings, 'TASK_TRANSITION_MODE', LOCK)
+    fields = transition_fields(new_status, user, assigned_to)
+    if mode == OPTIMISTIC or expected_version is not None:
+        return _transition_optimistic(task_id, new_status, user, fields, assigned_to, expected_version)
+    return _transition_locked(task_id, new_status, user, fields, assigned_to)
+
+
+@transaction.atomic
+def _transition_locked(task_id, new_status, user, fields, assigned_to):
+    task = _get_task(Task.objects.select_for_update(), task_id) # Lock the task row for update
+    error = task.transition_error(new_status)
+    if error:
+        raise TransitionError(error)
+    task.history_record(changed_by=user, previous_status=task.status, new_status=new_status, assigned_to=assigned_to)
+    for name, value in fields.items():
+        setattr(task, name, value)
+    task.status = new_status
+    task.save()
+    return task
+
+
+def _transition_optimistic(task_id, new_status, user, fields, assigned_to, expected_version):
+    for _ in range(OPTIMISTIC_RETRIES):
+        task = _get_task(Task.objects.all(), task_id)
+        if expected_version is not None and task.version != expected_version:
+            raise VersionConflict('Task was modified since the version in If-Match')
+        error = task.transition_error(new_status)
+        if error:
+            raise TransitionError(error)
+        now = timezone.now()
+        with transaction.atomic():
+            swapped = Task.objects.filter(pk=task.pk, version=task.version).update(
+                status=new_status, version=F('version') + 1, updated_at=now, **fields
+            )
+            if swapped:
+                previous_key = task.counter_key()
+                task.history_record(changed_by=user, previous_status=task.status, new_status=new_status, assigned_to=assigned_to)
+                for name, value in fields.items():
+                    setattr(task, name, value)
+                task.status = new_status
+                task.updated_at = now
+                task.version += 1
+                key = task.counter_key()
+                TaskCounter.adjust({previous_key: -1, key: 1})
+                response_cache.invalidate([task.pk])
+                events.publish([events.change_event(task.pk, previous_key, key, version=task.version)])
+                return task
+        if expected_version is not None:
+            raise VersionConflict('Task was modified since the version in If-Match')
+    raise ConcurrentModification('Task is being modified concurrently, try again')
+
+
+def _get_task(queryset, task_id):
+    try:
+        return queryset.get(pk=task_id)
+    except (Task.DoesNotExist, ValueError):
+        raise Http404('No Task matches the given query.')
+
+
+def parse_if_match(header):
+    """
+    Version number from an If-Match header ("3" or W/"3"), None when absent.
+    """
+    if not header:
+        return None
+    value = header.strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    value = value.strip('"')
+    if not value.isdigit():
+        raise TransitionError('Invalid If-Match header, expected the ETag of the task')
+    return int(value)
+
+
+def etag(task_version):
+    return f'"{task_version}"'
@@ -1,12 +1,30 @@
-from django.urls import path , include
+from django.conf import settings
+from django.urls import path , include, re_path
 from rest_framework.routers import DefaultRouter
+from apps.core.views import task_async
+from apps.core.views.events import TaskEventTicketView, task_events
 from apps.core.views.task import TaskViewSet 
 
 
 router = DefaultRouter()
 router.register(r'tasks', TaskViewSet, basename="task")
 
+# Async read endpoints (apps.core.views.task_async), served instead of the same
+# TaskViewSet routes under an ASGI server. They hand writes back to TaskViewSet.
+# Ids are numeric so that list actions (tasks/changes/, tasks/history/, ...) reach the router.
+async_read_urlpatterns = [
+    path('tasks/', task_async.task_list, name='task-list-async'),
+    re_path(r'^tasks/(?P<pk>[0-9]+)/$', task_async.task_detail, name='task-detail-async'),
+    re_path(r'^tasks/(?P<pk>[0-9]+)/history/$', task_async.task_history, name='task-history-async'),
+    re_path(r'^tasks/(?P<pk>[0-9]+)/comments/$', task_async.task_comments, name='task-comments-async'),
+    re_path(r'^tasks/(?P<pk>[0-9]+)/overview/$', task_async.task_overview, name='task-overview-async'),
+]
+
 
 urlpatterns = [
+    # Before the router, which would read "events" as a task id
+    path('tasks/events/', task_events, name='task-events'),
+    path('tasks/events/ticket/', TaskEventTicketView.as_view(), name='task-events-ticket'),
+    *(async_read_urlpatterns if settings.TASK_ASYNC_READS else []),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,114 @@
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from apps.authentication.authentication import CachedJWTAuthentication
+from apps.core import cache as response_cache
+from apps.core.renderers import FastJSONRenderer
+from apps.core.replicas import read_from_replica, reading_from_replica
+
+
+async def authenticate(request):
+    """
+    The user of the request's JWT access token, None if missing or invalid.
+    """
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if not raw_token:
+        return None
+    try:
+        token = authentication.get_validated_token(raw_token)
+        return await sync_to_async(authentication.get_user)(token)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def async_read(sync_view, allow, headers=None):
+    """
+    Serve GET requests with the decorated async view, and everything else with the
+    DRF view: other methods, unauthenticated requests, the browsable API, and GETs
+    for which the async view returns None (errors, options it does not implement).
+    The DRF view builds those responses, so both paths answer the same way.
+
+    The async view returns the response data; `headers(data)` adds response headers.
+    Its reads go to a replica, when there are (see apps.core.replicas).
+    """
+    def decorator(async_view):
+        @csrf_exempt
+        @wraps(async_view)
+        async def view(request, *args, **kwargs):
+            if request.method == 'GET' and _plain_json(request):
+                user = await authenticate(request)
+                if user is not None:
+                    request.user = user
+                    await sync_to_async(read_from_replica)(user)
+                    data = await async_view(request, *args, **kwargs)
+                    if data is not None:
+                        response = json_response(data, allow)
+                        for name, value in (headers(data) if headers else {}).items():
+                            response[name] = value
+                        return response
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+        return view
+    return decorator
+
+
+def _plain_json(request):
+    # Anything DRF would negotiate differently: ?format=, the browsable API, indented JSON
+    accept = request.headers.get('Accept', '')
+    return 'format' not in request.GET and 'text/html' not in accept and 'indent' not in accept
+
+
+def json_response(data, allow):
+    """
+    The response DRF gives for `data` with its JSON renderer (FastJSONRenderer).
+    """
+    response = HttpResponse(FastJSONRenderer().render(data), content_type='application/json')
+    response['Vary'] = 'Accept'
+    response['Allow'] = allow
+    return response
+
+
+async def cached(request, action, get_version, build):
+    """
+    Async counterpart of TaskViewSet._cached_response, sharing its cache entries.
+    `build` is a coroutine function returning the response data, or None to fall back.
+    """
+    if not response_cache.is_enabled():
+        return await build()
+
+    def lookup():
+        key = response_cache.response_key(request, action, get_version())
+        return key, response_cache.get_response(key)
+    key, data = await sync_to_async(lookup)()
+    if data is None:
+        data = await build()
+        if data is not None and not reading_from_replica():
+            await sync_to_async(response_cache.set_response)(key, data)
+    return data
+
+
+async def gather_reads(*functions):
+    """
+    Run independent blocking reads at the same time, each in its own thread and so on
+    its own database connection (Django connections are per thread), instead of one
+    after the other on the request's connection.
+    """
+    return await asyncio.gather(*(sync_to_async(_on_own_connection(function), thread_sensitive=False)() for function in functions))
+
+
+def _on_own_connection(function):
+    def run():
+        try:
+            return function()
+        finally:
+            # Pool threads outlive requests: release connections like request_finished does
+            for connection in connections.all(initialized_only=True):
+                connection.close_if_unusable_or_obsolete()
+    return run
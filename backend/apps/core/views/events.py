@@ -0,0 +1,85 @@
+import secrets
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import generics
+from rest_framework.response import Response
+
+from apps.core.cache import get_cache
+from apps.core.events import KEEPALIVE_FRAME, assignee_channel, get_broker, task_channel
+
+MAX_CHANNELS = 100
+TICKET_SALT = 'apps.core.task-events'
+TICKET_USED_KEY = 'tasks:event-ticket:{}'
+
+User = get_user_model()
+
+
+class TaskEventTicketView(generics.GenericAPIView):
+    """
+    POST /api/tasks/events/ticket/: a ticket opening one event stream, valid for
+    TASK_EVENT_TICKET_TTL seconds. EventSource cannot send headers, so the stream
+    is authenticated with ?ticket= rather than the access token, which would end
+    up in access logs.
+    """
+
+    def post(self, request, *args, **kwargs):
+        ticket = signing.dumps({'user': request.user.pk, 'nonce': secrets.token_urlsafe(12)}, salt=TICKET_SALT)
+        return Response({'ticket': ticket, 'expires_in': settings.TASK_EVENT_TICKET_TTL})
+
+
+async def ticket_user(ticket):
+    """
+    The user of a valid ticket seen for the first time, None otherwise.
+    """
+    try:
+        data = signing.loads(ticket, salt=TICKET_SALT, max_age=settings.TASK_EVENT_TICKET_TTL)
+    except signing.BadSignature: # Expired tickets included
+        return None
+    # One use, so a ticket read from a log cannot open another stream
+    if not await get_cache().aadd(TICKET_USED_KEY.format(data['nonce']), 1, timeout=settings.TASK_EVENT_TICKET_TTL):
+        return None
+    return await User.objects.filter(pk=data['user'], is_active=True).afirst()
+
+
+async def task_events(request):
+    """
+    Server-Sent Events stream of task changes:
+
+        GET /api/tasks/events/?ticket=<ticket>&task=<id>&task=<id>&assignee=<user id>
+
+    An async view, so under an ASGI server an idle stream costs a small buffer and
+    no thread. Under WSGI the stream would hold a worker thread forever and never be
+    flushed to the client, so it answers 501 there.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail': 'The event stream needs the ASGI server (SERVER_MODE=asgi).'}, status=501)
+    if not await ticket_user(request.GET.get('ticket', '')):
+        return JsonResponse({'detail': 'A valid ticket from /api/tasks/events/ticket/ is required.'}, status=401)
+    task_ids = request.GET.getlist('task')
+    assignee_ids = request.GET.getlist('assignee')
+    if not all(value.isdigit() for value in task_ids + assignee_ids):
+        return JsonResponse({'detail': 'task and assignee must be ids'}, status=400)
+    channels = [task_channel(task_id) for task_id in task_ids] + [assignee_channel(user_id) for user_id in assignee_ids]
+    if not channels or len(channels) > MAX_CHANNELS:
+        return JsonResponse({'detail': f'Subscribe to between 1 and {MAX_CHANNELS} tasks or assignees'}, status=400)
+    response = StreamingHttpResponse(_stream(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no' # Keep proxies from buffering the stream
+    return response
+
+
+async def _stream(channels):
+    # Subscribing here rather than in the view ties the subscription to the event
+    # loop that consumes the stream
+    subscription = get_broker().subscribe(channels)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            frame = await subscription.get(timeout=settings.TASK_EVENT_HEARTBEAT)
+            yield frame or KEEPALIVE_FRAME
+    finally:
+        subscription.close()
@@ -1,27 +1,105 @@
+from collections import Counter
 from datetime import datetime, timedelta
 from rest_framework.response import Response 
-from rest_framework import viewsets, status
+from rest_framework import generics, viewsets, status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.db import connection
 from django.db.transaction import atomic
-from django.db.models import Max 
+from django.db.models import F, Max
 from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, StreamingHttpResponse
 from rest_framework.decorators import action
 from django.utils import timezone
 
-from apps.core.models import Task, TaskHistory, TaskComment
-from apps.core.serializers.task import TaskSerializer, TaskHistorySerializer, TaskCommentSerializer, TasksListSerializer
+from apps.core import archive
+from apps.core import cache as response_cache
+from apps.core import changes as task_changes
+from apps.core import counters, events, exporters
+from apps.core.filters import TaskFilterSet, TaskHistoryFilterSet
+from apps.core.importers import FORMATS, import_tasks, iter_rows
+from apps.core.models import ArchivedTask, OutboxEvent, Task, TaskHistory, TaskComment, TaskCounter
+from apps.core.pagination import TaskCursorPagination, TaskHistoryCursorPagination, TaskCommentCursorPagination
+from apps.core.replicas import ReplicaReadsMixin, reading_from_replica
+from apps.core.serializers import rows
+from apps.core.transitions import TransitionError, etag, parse_if_match, transition_task
+from apps.core.serializers.task import (
+    TaskSerializer, TaskCommentSerializer, TasksListSerializer, BulkTransitionSerializer, BulkAssignSerializer,
+    compact_history,
+)
 from django.contrib.auth import get_user_model
 User = get_user_model()
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = PageNumberPagination #We can customize pagination if needed
+    # Keyset pagination used instead of pagination_class when the client passes ?pagination=cursor
+    cursor_pagination_classes = {
+        'list': TaskCursorPagination,
+        'history': TaskHistoryCursorPagination,
+        'comments': TaskCommentCursorPagination,
+    }
     filter_backends = [DjangoFilterBackend]
+    filterset_class = TaskFilterSet
+    # Maximum number of SQL queries per action (authentication included), checked by
+    # apps.core.query_budget in the tests and by QueryBudgetMiddleware in development.
+    query_budgets = {
+        'list': 2,
+        'retrieve': 2,
+        'history': 4, # 3, and one more to load the users with ?compact=true
+        'history_index': 3,
+        'comments': 3,
+        'changes': 3,
+        'overview': 4,
+    }
+    # Read actions that fall back to the archive for tasks no longer in the live table
+    archive_actions = ('retrieve', 'history', 'comments', 'overview')
+    # Read actions served from a read replica when there are (apps.core.replicas); changes
+    # is left out, clients use its cursor to resume and must not miss rows a replica lacks
+    replica_actions = ('list', 'retrieve', 'history', 'history_index', 'comments', 'overview', 'stats')
+
+    def get_queryset(self):
+        """
+        Join the users each action serializes, so the query count does not grow
+        with the number of rows. history and comments only need the task id.
+        """
+        queryset = Task.objects.all()
+        if self.action in ('list', 'changes'):
+            return queryset.select_related('assigned_to')
+        if self.action in ('history', 'comments'):
+            return queryset.only('id')
+        return queryset.select_related('created_by', 'assigned_to', 'assigned_by', 'closed_by', 'deleted_by')
+
+    def get_object(self):
+        """
+        The task, or for archive_actions its ArchivedTask, which has the same fields
+        and `history` and `comments` relations, so the serializers handle both.
+        """
+        try:
+            return super().get_object()
+        except Http404:
+            if self.action not in self.archive_actions:
+                raise
+        queryset = ArchivedTask.objects.all()
+        if self.action in ('history', 'comments'):
+            queryset = queryset.only('id')
+        else:
+            queryset = queryset.select_related('created_by', 'assigned_to', 'assigned_by', 'closed_by', 'deleted_by')
+        return generics.get_object_or_404(queryset, pk=self.kwargs['pk'])
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            cursor_class = self.cursor_pagination_classes.get(self.action)
+            if cursor_class and self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = cursor_class()
+            else:
+                self._paginator = self.pagination_class() if self.pagination_class else None
+        return self._paginator
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -31,92 +109,298 @@ class TaskViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
-    @atomic
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(response_cache.list_generation(), self._list, request)
+
+    def _list(self, request):
+        # Same data as TasksListSerializer, read with .values() (see apps.core.serializers.rows)
+        tasks = rows.values(self.filter_queryset(self.get_queryset()), rows.TASK_LIST_COLUMNS)
+        page = self.paginate_queryset(tasks)
+        if page is not None:
+            return self.get_paginated_response(rows.serialize(page, rows.TASK_LIST_COLUMNS))
+        return Response(rows.serialize(tasks, rows.TASK_LIST_COLUMNS))
+
+    def retrieve(self, request, *args, **kwargs):
+        response = self._cached_response(self._task_version(kwargs['pk']), super().retrieve, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag(response.data['version'])
+        return response
+
+    def update(self, request, *args, **kwargs):
+        try:
+            expected_version = parse_if_match(request.headers.get('If-Match'))
+        except TransitionError as error:
+            return Response(error.message, status=error.status_code)
+        with atomic():
+            # The row stays locked until the update is saved, so the task is loaded after any
+            # transition in progress, and two writers sending the same If-Match cannot both succeed
+            task = get_object_or_404(Task.objects.select_for_update().only('id', 'version'), pk=kwargs['pk'])
+            if expected_version is not None and task.version != expected_version:
+                return Response('Task was modified since the version in If-Match', status=status.HTTP_412_PRECONDITION_FAILED)
+            response = super().update(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag(response.data['version'])
+        return response
+
+    def _task_version(self, pk):
+        try:
+            return response_cache.task_version(pk)
+        except ValueError:
+            raise Http404('No Task matches the given query.')
+
+    def _cached_response(self, version, view, *args, **kwargs):
+        """
+        Serve the response from the cache, keyed on the version of the data it shows.
+        Versions are bumped by every Task save/delete and TaskComment save, and by
+        the bulk endpoints (see apps.core.cache.invalidate), so entries never need
+        to expire to be correct. Responses read from a replica are not stored: the
+        replica may not have the writes of the version yet.
+        """
+        if not response_cache.is_enabled():
+            return view(*args, **kwargs)
+        key = response_cache.response_key(self.request, self.action, version)
+        data = response_cache.get_response(key)
+        if data is not None:
+            return Response(data)
+        response = view(*args, **kwargs)
+        if response.status_code == status.HTTP_200_OK and not reading_from_replica():
+            response_cache.set_response(key, response.data)
+        return response
+
     @action(detail=True, methods=['PATCH'])
     def assign(self, request, pk=None):
         """
         Assign a user to a task.
         """
-        task = Task.objects.select_for_update().get(pk=pk) # Lock the task row for update
-        if task.status in [Task.Status.CLOSED, Task.Status.DELETED]: # Cannot assign closed or deleted tasks
-            return Response('Cannot assign a closed or deleted task', status=status.HTTP_400_BAD_REQUEST)
         user_id = request.data.get('assigned_to')
         if not user_id:
             return Response('user to assign is required', status=status.HTTP_400_BAD_REQUEST)
-        user = User.objects.get(pk=user_id) if user_id else None
-        task.history_record( # Log the assignment in task history
-            changed_by=request.user,
-            previous_status=task.status,
-            new_status=Task.Status.ASSIGNED,
-            assigned_to=user
-        )
-        task.assigned_to = user
-        task.assigned_by = request.user
-        task.assigned_at = timezone.now()
-        task.status = Task.Status.ASSIGNED
-        task.save()
-        return Response(TasksListSerializer(task).data)
+        user = get_object_or_404(User, pk=user_id)
+        return self._transition(pk, Task.Status.ASSIGNED, assigned_to=user)
     
-    @atomic
     @action(detail=True, methods=['PATCH'])
     def unassign(self, request, pk=None):
         """
         Unassign a user from a task.
         """
-        task = Task.objects.select_for_update().get(pk=pk) # Lock the task row for update
-        if task.status != Task.Status.ASSIGNED:# Only assigned tasks can be unassigned
-            return Response('Only assigned tasks can be unassigned', status=status.HTTP_400_BAD_REQUEST)
-        task.history_record(
-            changed_by=request.user,
-            previous_status=task.status,
-            new_status=Task.Status.OPEN
-        )
-        task.assigned_to = None
-        task.assigned_by = None
-        task.assigned_at = None
-        task.status = Task.Status.OPEN
-        task.save()
-        return Response(TasksListSerializer(task).data)
+        return self._transition(pk, Task.Status.OPEN)
     
-    @atomic
     @action(detail=True, methods=['PATCH'])
     def close(self, request, pk=None):
         """
         Close a task.
         """
-        task = Task.objects.select_for_update().get(pk=pk) # Lock the task row for update
-        if task.status != Task.Status.ASSIGNED: # Only assigned tasks can be closed
-            return Response('Only assigned tasks can be closed', status=status.HTTP_400_BAD_REQUEST)
-        task.history_record(
-            changed_by=request.user,
-            previous_status=task.status,
-            new_status=Task.Status.CLOSED
-        )
-        task.status = Task.Status.CLOSED
-        task.closed_by = request.user
-        task.closed_at = timezone.now()
-        task.save()
-        return Response(TasksListSerializer(task).data)
+        return self._transition(pk, Task.Status.CLOSED)
     
-    @atomic
     @action(detail=True, methods=['PATCH'])
     def delete_task(self, request, pk=None):
         """
         Delete a task. (Soft delete by changing status to DELETED)
         """
-        task = Task.objects.select_for_update().get(pk=pk)
-        if task.status == Task.Status.DELETED:
-            return Response('Task is already deleted', status=status.HTTP_400_BAD_REQUEST)
-        task.history_record(
-            changed_by=request.user,
-            previous_status=task.status,
-            new_status=Task.Status.DELETED
+        return self._transition(pk, Task.Status.DELETED)
+
+    def _transition(self, pk, new_status, assigned_to=None):
+        """
+        Run a transition (see apps.core.transitions). With an If-Match header the
+        transition only applies to that version of the task, otherwise 412.
+        """
+        try:
+            expected_version = parse_if_match(self.request.headers.get('If-Match'))
+            task = transition_task(pk, new_status, self.request.user, assigned_to=assigned_to, expected_version=expected_version)
+        except TransitionError as error:
+            return Response(error.message, status=error.status_code)
+        response = Response(TasksListSerializer(task).data)
+        response['ETag'] = etag(task.version)
+        return response
+
+    @action(detail=True, methods=['POST'])
+    def restore(self, request, pk=None):
+        """
+        Move an archived task back to the live tables (see apps.core.archive).
+        """
+        task = archive.restore_task(pk) if pk.isdigit() else None
+        if task is None:
+            return Response('Task is not archived', status=status.HTTP_404_NOT_FOUND)
+        response = Response(TaskSerializer(task).data)
+        response['ETag'] = etag(task.version)
+        return response
+
+    @action(detail=False, methods=['PATCH'])
+    def bulk_assign(self, request):
+        """
+        Assign a user to many tasks: {"ids": [...], "assigned_to": <user id>}.
+        """
+        serializer = BulkAssignSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['assigned_to']
+        return self._bulk_transition(serializer.validated_data['ids'], Task.Status.ASSIGNED, assigned_to=user, fields={
+            'assigned_to': user,
+            'assigned_by': request.user,
+            'assigned_at': timezone.now(),
+        })
+
+    @action(detail=False, methods=['PATCH'])
+    def bulk_unassign(self, request):
+        """
+        Unassign many tasks: {"ids": [...]}.
+        """
+        serializer = BulkTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self._bulk_transition(serializer.validated_data['ids'], Task.Status.OPEN, fields={
+            'assigned_to': None,
+            'assigned_by': None,
+            'assigned_at': None,
+        })
+
+    @action(detail=False, methods=['PATCH'])
+    def bulk_close(self, request):
+        """
+        Close many tasks: {"ids": [...]}.
+        """
+        serializer = BulkTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self._bulk_transition(serializer.validated_data['ids'], Task.Status.CLOSED, fields={
+            'closed_by': request.user,
+            'closed_at': timezone.now(),
+        })
+
+    @action(detail=False, methods=['PATCH'])
+    def bulk_delete(self, request):
+        """
+        Soft delete many tasks: {"ids": [...]}.
+        """
+        serializer = BulkTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self._bulk_transition(serializer.validated_data['ids'], Task.Status.DELETED, fields={
+            'deleted_by': request.user,
+            'deleted_at': timezone.now(),
+        })
+
+    @atomic
+    def _bulk_transition(self, ids, new_status, fields, assigned_to=None):
+        """
+        Apply a status transition to many tasks with a fixed number of statements:
+        one SELECT ... FOR UPDATE, one bulk INSERT of the history rows, one of their
+        outbox events and one UPDATE.
+        Rows are locked in primary key order so that concurrent bulk requests cannot
+        deadlock each other. Each id gets its own result.
+        """
+        tasks = Task.objects.select_for_update().filter(pk__in=ids).order_by('pk').only('id', 'status', 'assigned_to', 'priority')
+        tasks = {task.id: task for task in tasks}
+        results, history, counter_deltas, changes = [], [], Counter(), []
+        for task_id in ids:
+            task = tasks.get(task_id)
+            error = task.transition_error(new_status) if task else 'Task not found'
+            if error:
+                results.append({'id': task_id, 'success': False, 'error': error})
+                continue
+            history.append(TaskHistory(
+                task=task,
+                changed_by=self.request.user,
+                previous_status=task.status,
+                new_status=new_status,
+                assigned_to=assigned_to,
+            ))
+            results.append({'id': task_id, 'success': True})
+            if 'assigned_to' in fields:
+                assignee_id = fields['assigned_to'].pk if fields['assigned_to'] else None
+            else:
+                assignee_id = task.assigned_to_id
+            key = (assignee_id or 0, new_status, task.priority)
+            counter_deltas[task.counter_key()] -= 1
+            counter_deltas[key] += 1
+            changes.append(events.change_event(task.id, task.counter_key(), key))
+        TaskHistory.objects.bulk_create(history)
+        OutboxEvent.objects.bulk_create(OutboxEvent(**OutboxEvent.for_history(entry)) for entry in history)
+        TaskCounter.adjust(counter_deltas)
+        changed_ids = [entry.task_id for entry in history]
+        if changed_ids:
+            Task.objects.filter(pk__in=changed_ids).update(
+                status=new_status, version=F('version') + 1, updated_at=timezone.now(), **fields
+            )
+            response_cache.invalidate(changed_ids)
+            events.publish(changes)
+        return Response({'results': results})
+
+    @action(detail=False, methods=['POST'], url_path='import')
+    def import_tasks(self, request):
+        """
+        Create tasks from an NDJSON (default) or CSV request body, streamed and
+        inserted in batches. Use ?type=csv or a text/csv content type for CSV.
+        """
+        format = request.query_params.get('type') or ('csv' if request.content_type.startswith('text/csv') else 'ndjson')
+        if format not in FORMATS:
+            return Response(f"type must be one of: {', '.join(FORMATS)}", status=status.HTTP_400_BAD_REQUEST)
+        lines = request.stream or []
+        result = import_tasks(iter_rows(lines, format), created_by=request.user)
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED if result.created else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['GET'])
+    def export(self, request):
+        """
+        Stream tasks, history or comments as CSV (default) or NDJSON:
+        ?resource=tasks|history|comments&type=csv|ndjson. Task filters apply to resource=tasks.
+        Under ASGI the chunks are streamed through an async iterator, as Django would
+        otherwise buffer the whole export in memory.
+        """
+        resource = request.query_params.get('resource', 'tasks')
+        format = request.query_params.get('type', 'csv')
+        if resource not in exporters.RESOURCES or format not in exporters.FORMATS:
+            return Response(
+                f"resource must be one of: {', '.join(exporters.RESOURCES)}; type must be one of: {', '.join(exporters.FORMATS)}",
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        queryset = self.filter_queryset(Task.objects.all()) if resource == 'tasks' else None
+        chunks = exporters.export_rows(resource, format, queryset=queryset)
+        if isinstance(request._request, ASGIRequest):
+            chunks = exporters.async_chunks(chunks)
+        response = StreamingHttpResponse(
+            chunks,
+            content_type='text/csv' if format == 'csv' else 'application/x-ndjson',
         )
-        task.status = Task.Status.DELETED
-        task.deleted_by = request.user
-        task.deleted_at = timezone.now()
-        task.save()
-        return Response(TasksListSerializer(task).data)
+        response['Content-Disposition'] = f'attachment; filename="{resource}.{format}"'
+        return response
+
+    @action(detail=False, methods=['GET'])
+    def cache_stats(self, request):
+        """
+        Response cache hits and misses of the process serving the request.
+        """
+        return Response(response_cache.stats())
+
+    @action(detail=False, methods=['GET'])
+    def changes(self, request):
+        """
+        Tasks created, updated, transitioned or deleted since ?since=<cursor>, and the
+        cursor for the next poll. Without ?since only the current cursor is returned:
+        take it before loading the full list, then poll with it.
+        """
+        since = request.query_params.get('since')
+        if not since:
+            return Response({'cursor': task_changes.encode_cursor(task_changes.current_seq()), 'has_more': False, 'results': []})
+        try:
+            tasks, cursor, has_more = task_changes.changes_since(since, self.get_queryset())
+        except task_changes.InvalidCursor as error:
+            return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+        return Response({'cursor': cursor, 'has_more': has_more, 'results': TasksListSerializer(tasks, many=True).data})
+
+    @action(detail=False, methods=['GET'])
+    def stats(self, request):
+        """
+        Task counts by status, by priority and by assignee and status, read from the
+        counter table instead of counting tasks. ?assigned_to=<user id> narrows them to one user.
+        """
+        assignee_id = request.query_params.get('assigned_to')
+        if assignee_id is not None and not assignee_id.isdigit():
+            return Response('assigned_to must be a user id', status=status.HTTP_400_BAD_REQUEST)
+        data = counters.summary(int(assignee_id) if assignee_id is not None else None)
+        usernames = dict(User.objects.filter(pk__in={row['assignee_id'] for row in data['by_assignee']}).values_list('pk', 'username'))
+        data['by_assignee'] = [
+            {'assigned_to': row['assignee_id'], 'assigned_to_name': usernames.get(row['assignee_id']),
+             'status': row['status'], 'count': row['count']}
+            for row in data['by_assignee']
+        ]
+        return Response(data)
 
     @action(detail=True, methods=['post'])
     def comment(self, request, pk=None):
@@ -137,17 +421,69 @@ class TaskViewSet(viewsets.ModelViewSet):
         """
         Get the history of a task.
         """
-        task = get_object_or_404(Task, pk=pk)
-        history = task.history.all()
-        serializer = TaskHistorySerializer(history, many=True)
-        return Response(serializer.data)
+        return self._cached_response(self._task_version(pk), self._history, request, pk)
+
+    def _history(self, request, pk):
+        task = self.get_object()
+        history = self._history_entries(request, task.history.order_by('changed_at', 'id'))
+        page = self.paginate_queryset(history)
+        if page is not None:
+            return self.get_paginated_response(self._history_data(request, page))
+        return Response(self._history_data(request, history))
+
+    @action(detail=False, methods=['GET'], url_path='history', url_name='history-index')
+    def history_index(self, request):
+        """
+        History entries of all tasks, by pages ordered by (changed_at, id), e.g. everything
+        a user changed today: ?changed_by=<user id>&changed_at_after=<date>. See TaskHistoryFilterSet.
+        """
+        filterset = TaskHistoryFilterSet(request.query_params, queryset=TaskHistory.objects.all(), request=request)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        paginator = TaskHistoryCursorPagination()
+        page = paginator.paginate_queryset(self._history_entries(request, filterset.qs), request, view=self)
+        return paginator.get_paginated_response(self._history_data(request, page))
+
+    def _history_entries(self, request, queryset):
+        # The compact form loads the users once each, in a separate query, instead of joining them to every row
+        if request.query_params.get('compact') == 'true':
+            return queryset
+        return rows.values(queryset, rows.HISTORY_COLUMNS)
+
+    def _history_data(self, request, entries):
+        """
+        Serialized history entries, in columnar form with ?compact=true (see compact_history).
+        """
+        if request.query_params.get('compact') == 'true':
+            return compact_history(entries)
+        return rows.serialize(entries, rows.HISTORY_COLUMNS)
+
+    @action(detail=True, methods=['get'])
+    def overview(self, request, pk=None):
+        """
+        A task with its history and comments, in one request.
+        """
+        return self._cached_response(self._task_version(pk), self._overview, request, pk)
+
+    def _overview(self, request, pk):
+        task = self.get_object()
+        return Response({
+            'task': TaskSerializer(task).data,
+            'history': rows.serialize(rows.values(task.history.order_by('changed_at', 'id'), rows.HISTORY_COLUMNS), rows.HISTORY_COLUMNS),
+            'comments': rows.serialize(rows.values(task.comments.order_by('commented_at', 'id'), rows.COMMENT_COLUMNS), rows.COMMENT_COLUMNS),
+        })
 
     @action(detail=True, methods=['get'])
     def comments(self, request, pk=None):
         """
         Get all comments for a task.
         """
-        task = get_object_or_404(Task, pk=pk)
-        comments = task.comments.all()
-        serializer = TaskCommentSerializer(comments, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return self._cached_response(self._task_version(pk), self._comments, request, pk)
+
+    def _comments(self, request, pk):
+        task = self.get_object()
+        comments = rows.values(task.comments.order_by('commented_at', 'id'), rows.COMMENT_COLUMNS)
+        page = self.paginate_queryset(comments)
+        if page is not None:
+            return self.get_paginated_response(rows.serialize(page, rows.COMMENT_COLUMNS))
+        return Response(rows.serialize(comments, rows.COMMENT_COLUMNS))
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""
+Async versions of the task read endpoints, for ASGI servers (TASK_ASYNC_READS).
+
+They use the async ORM and return exactly what TaskViewSet returns; anything they
+do not implement (errors, writes, cursor pagination, the browsable API) is handed
+to TaskViewSet, see apps.core.views.asynchronous.async_read.
+"""
+from apps.core import cache as response_cache
+from apps.core.filters import TaskFilterSet
+from apps.core.models import Task, TaskHistory, TaskComment
+from apps.core.serializers import rows
+from apps.core.serializers.task import TaskSerializer
+from apps.core.transitions import etag
+from apps.core.views.asynchronous import async_read, cached, gather_reads
+from apps.core.views.task import TaskViewSet
+
+TASK_DETAIL_RELATED = ('created_by', 'assigned_to', 'assigned_by', 'closed_by', 'deleted_by')
+
+
+@async_read(TaskViewSet.as_view({'get': 'list', 'post': 'create'}), allow='GET, POST, HEAD, OPTIONS')
+async def task_list(request):
+    if request.GET.get('pagination') == 'cursor':
+        return None
+    filterset = TaskFilterSet(request.GET, queryset=Task.objects.all(), request=request)
+    if not filterset.is_valid():
+        return None
+
+    async def build():
+        tasks = [task async for task in rows.values(filterset.qs, rows.TASK_LIST_COLUMNS)]
+        return rows.serialize(tasks, rows.TASK_LIST_COLUMNS)
+    return await cached(request, 'list', response_cache.list_generation, build)
+
+
+@async_read(
+    TaskViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}),
+    allow='GET, PUT, PATCH, DELETE, HEAD, OPTIONS',
+    headers=lambda data: {'ETag': etag(data['version'])},
+)
+async def task_detail(request, pk):
+    async def build():
+        task = await _first(Task.objects.select_related(*TASK_DETAIL_RELATED), pk)
+        return TaskSerializer(task).data if task else None
+    return await cached(request, 'retrieve', lambda: response_cache.task_version(pk), build)
+
+
+@async_read(TaskViewSet.as_view({'get': 'history'}), allow='GET, HEAD, OPTIONS')
+async def task_history(request, pk):
+    if request.GET.get('pagination') == 'cursor' or 'compact' in request.GET:
+        return None
+
+    async def build():
+        if not await _exists(pk):
+            return None
+        history = rows.values(TaskHistory.objects.filter(task_id=pk).order_by('changed_at', 'id'), rows.HISTORY_COLUMNS)
+        return rows.serialize([entry async for entry in history], rows.HISTORY_COLUMNS)
+    return await cached(request, 'history', lambda: response_cache.task_version(pk), build)
+
+
+@async_read(TaskViewSet.as_view({'get': 'comments'}), allow='GET, HEAD, OPTIONS')
+async def task_comments(request, pk):
+    if request.GET.get('pagination') == 'cursor':
+        return None
+
+    async def build():
+        if not await _exists(pk):
+            return None
+        comments = rows.values(TaskComment.objects.filter(task_id=pk).order_by('commented_at', 'id'), rows.COMMENT_COLUMNS)
+        return rows.serialize([comment async for comment in comments], rows.COMMENT_COLUMNS)
+    return await cached(request, 'comments', lambda: response_cache.task_version(pk), build)
+
+
+@async_read(TaskViewSet.as_view({'get': 'overview'}), allow='GET, HEAD, OPTIONS')
+async def task_overview(request, pk):
+    async def build():
+        # The three reads are independent: run them concurrently on separate connections
+        task, history, comments = await gather_reads(
+            lambda: Task.objects.select_related(*TASK_DETAIL_RELATED).filter(pk=pk).first(),
+            lambda: list(rows.values(TaskHistory.objects.filter(task_id=pk).order_by('changed_at', 'id'), rows.HISTORY_COLUMNS)),
+            lambda: list(rows.values(TaskComment.objects.filter(task_id=pk).order_by('commented_at', 'id'), rows.COMMENT_COLUMNS)),
+        )
+        if task is None:
+            return None
+        return {
+            'task': TaskSerializer(task).data,
+            'history': rows.serialize(history, rows.HISTORY_COLUMNS),
+            'comments': rows.serialize(comments, rows.COMMENT_COLUMNS),
+        }
+    if not pk.isdigit():
+        return None
+    return await cached(request, 'overview', lambda: response_cache.task_version(pk), build)
+
+
+async def _first(queryset, pk):
+    if not pk.isdigit():
+        return None
+    return await queryset.filter(pk=pk).afirst()
+
+
+async def _exists(pk):
+    return pk.isdigit() and await Task.objects.filter(pk=pk).aexists()
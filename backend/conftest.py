@@ -6,3 +6,16 @@ def enable_db_access_for_all_tests(db):
     Optional: remove this if you want to explicitly request db with `db` fixture.
     """
     pass
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    Start every test with an empty cache, so responses cached by a previous test are never served.
+    """
+    from django.core.cache import cache
+    from apps.authentication.authentication import local_users
+    from apps.authentication.blacklist import blacklist_filter
+    cache.clear()
+    local_users.clear()
+    blacklist_filter.reset()
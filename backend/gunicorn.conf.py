@@ -0,0 +1,29 @@
+# Production server configuration: `python manage.py serve` with SERVER_MODE=wsgi or asgi,
+# or `gunicorn -c gunicorn.conf.py`. Worker and thread counts follow the CPU count
+# (tasks_managment.serving) unless WEB_CONCURRENCY / SERVER_THREADS are set.
+import os
+
+from tasks_managment import serving
+
+server_mode = serving.mode()
+if server_mode == 'dev':
+    server_mode = 'wsgi'
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+if server_mode == 'asgi':
+    wsgi_app = 'tasks_managment.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'tasks_managment.wsgi:application'
+    worker_class = 'gthread'
+workers = serving.workers(server_mode)
+threads = serving.threads(server_mode)
+# Not preloaded: each worker opens its own database connections and pool after the fork
+preload_app = False
+keepalive = 5
+timeout = 30
+graceful_timeout = 30
+# Recycle workers now and then, staggered, to bound the effect of leaks
+max_requests = 10000
+max_requests_jitter = 1000
+accesslog = '-'
@@ -0,0 +1,45 @@
+"""
+Process sizing of the production servers, shared by gunicorn.conf.py and the
+database pool settings, so that every worker thread can hold a connection.
+"""
+import os
+
+MODES = ('dev', 'wsgi', 'asgi')
+
+
+def mode():
+    """
+    SERVER_MODE: dev (runserver), wsgi (gunicorn, threaded workers) or asgi (gunicorn, uvicorn workers).
+    """
+    value = os.getenv('SERVER_MODE', 'dev')
+    if value not in MODES:
+        raise ValueError(f"SERVER_MODE must be one of: {', '.join(MODES)}")
+    return value
+
+
+def cpu_count():
+    # CPUs this process may run on, which can be fewer than the machine has
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def workers(server_mode):
+    # Threaded WSGI workers spend part of each request waiting on the database; an
+    # event loop does not, so one ASGI worker per CPU is enough
+    default = cpu_count() * 2 + 1 if server_mode == 'wsgi' else cpu_count()
+    return int(os.getenv('WEB_CONCURRENCY', default))
+
+
+def threads(server_mode):
+    return int(os.getenv('SERVER_THREADS', 4 if server_mode == 'wsgi' else 1))
+
+
+def pool_size(server_mode):
+    """
+    Most connections one process holds: one per request thread under WSGI; under
+    ASGI, the thread running sync code plus the gather_reads threads.
+    """
+    default = threads(server_mode) if server_mode == 'wsgi' else 10
+    return int(os.getenv('DB_POOL_MAX_SIZE', default))
@@ -14,8 +14,11 @@ from pathlib import Path
 import os
 from pathlib import Path
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 from datetime import timedelta
 
+from tasks_managment import serving
+
 
 load_dotenv()
 
@@ -26,16 +29,24 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
+# How the server runs: dev (runserver), wsgi or asgi (gunicorn, see gunicorn.conf.py and `manage.py serve`)
+SERVER_MODE = serving.mode()
+
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv("DJANGO_SECRET_KEY", "dev-secret")
 DEBUG = os.getenv("DJANGO_DEBUG", "0") == "1"
-ALLOWED_HOSTS = ["*"]
-SECRET_KEY = 'django-insecure-=13e&ulihr@@k(_^d&d=btj#hfofpg=l&+@sejkxc)tqcv2eee'
+if SERVER_MODE == "dev":
+    SECRET_KEY = 'django-insecure-=13e&ulihr@@k(_^d&d=btj#hfofpg=l&+@sejkxc)tqcv2eee'
 
-# SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+    # SECURITY WARNING: don't run with debug turned on in production!
+    DEBUG = True
 
-ALLOWED_HOSTS = []
+    ALLOWED_HOSTS = []
+else:
+    # Production modes only take them from the environment
+    if not os.getenv("DJANGO_SECRET_KEY"):
+        raise ImproperlyConfigured("DJANGO_SECRET_KEY must be set when SERVER_MODE is not dev")
+    ALLOWED_HOSTS = os.getenv("DJANGO_ALLOWED_HOSTS", "*").split(",") # Host names served, separated by commas
 
 
 # Application definition
@@ -48,6 +59,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'corsheaders',
+    'rest_framework_simplejwt.token_blacklist',
     'apps.core',
     'apps.authentication',
 
@@ -64,6 +76,19 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-endpoint request metrics served at /metrics (apps.core.metrics)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'apps.core.metrics.MetricsMiddleware')
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") # If set, /metrics requires "Authorization: Bearer <token>"; required outside dev mode
+SLOW_REQUEST_THRESHOLD_MS = int(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "0")) # Log requests slower than this with their SQL; 0 is off
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv("SLOW_REQUEST_SAMPLE_RATE", "0.1")) # Share of requests whose SQL is captured for that log
+SLOW_REQUEST_EXPLAIN = int(os.getenv("SLOW_REQUEST_EXPLAIN", "3")) # Slowest SELECTs of a logged request to EXPLAIN
+
+# Fail requests that run more SQL queries than their view's declared budget (development only)
+if os.getenv("DJANGO_QUERY_BUDGET", "0") == "1":
+    MIDDLEWARE.append('apps.core.query_budget.QueryBudgetMiddleware')
+
 ROOT_URLCONF = 'tasks_managment.urls'
 
 TEMPLATES = [
@@ -99,7 +124,90 @@ DATABASES = {
     }
 }
 
-
+# Database connections are reused across requests: a psycopg pool per process (DB_POOL=1,
+# the default under ASGI, where persistent connections cannot be used), or one persistent
+# connection per thread kept for DB_CONN_MAX_AGE seconds. Either way they are checked
+# before use, so a connection the database dropped is replaced instead of failing a request.
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+DB_POOL = os.getenv("DB_POOL", "1" if SERVER_MODE == "asgi" else "0") == "1"
+if DB_POOL:
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            "max_size": serving.pool_size(SERVER_MODE), # Bounded: workers x max_size must fit max_connections
+            "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")), # Seconds to wait for a free connection
+            "max_idle": 300,
+            "max_lifetime": 1800,
+        },
+    }
+else:
+    # runserver starts a thread per request, which would leave a connection behind each time
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.getenv("DB_CONN_MAX_AGE", "0" if SERVER_MODE == "dev" else "60"))
+
+# Read replicas of "default", as "host" or "host:port" (comma-separated), added as replica_1,
+# replica_2... The task and user reads go to one of them, other queries to "default", and a
+# user who wrote reads from "default" for REPLICA_STICKY_SECONDS (apps.core.replicas)
+REPLICA_DATABASES = []
+for index, address in enumerate(filter(None, os.getenv("DATABASE_REPLICA_HOSTS", "").split(",")), start=1):
+    host, _, port = address.strip().partition(":")
+    DATABASES[f"replica_{index}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "OPTIONS": dict(DATABASES["default"].get("OPTIONS", {})), # The pool is per alias
+        "TEST": {"MIRROR": "default"}, # Tests create no replica: it reads the test database
+    }
+    REPLICA_DATABASES.append(f"replica_{index}")
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "5")) # Longer than the replication lag
+if REPLICA_DATABASES:
+    DATABASE_ROUTERS = ["apps.core.replicas.ReplicaRouter"]
+    MIDDLEWARE.insert(MIDDLEWARE.index("corsheaders.middleware.CorsMiddleware"), "apps.core.replicas.ReplicaMiddleware")
+
+
+# Shared cache for the task response cache (apps.core.cache). Without REDIS_URL each
+# process uses its own in-memory cache, which is fine for development and tests.
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+TASK_RESPONSE_CACHE = os.getenv("TASK_RESPONSE_CACHE", "1") == "1"
+TASK_CACHE_TIMEOUT = int(os.getenv("TASK_CACHE_TIMEOUT", "300"))
+# How single-task transitions handle concurrent writers (apps.core.transitions):
+# "lock" (SELECT ... FOR UPDATE) or "optimistic" (compare-and-swap on Task.version)
+TASK_TRANSITION_MODE = os.getenv("TASK_TRANSITION_MODE", "lock")
+# Fan-out of the task event stream (apps.core.events): in-process without Redis,
+# which only reaches clients connected to the process that made the change.
+TASK_EVENT_REDIS_URL = os.getenv("REDIS_URL")
+TASK_EVENT_BROKER = "apps.core.events.RedisBroker" if TASK_EVENT_REDIS_URL else "apps.core.events.InProcessBroker"
+TASK_EVENT_BUFFER = int(os.getenv("TASK_EVENT_BUFFER", "100")) # Frames held per slow client before it is told to resync
+TASK_EVENT_HEARTBEAT = int(os.getenv("TASK_EVENT_HEARTBEAT", "20")) # Seconds between keepalives on idle streams
+TASK_EVENT_TICKET_TTL = int(os.getenv("TASK_EVENT_TICKET_TTL", "30")) # Seconds to open a stream with a ticket
+# Serve the task and user read endpoints with async views (apps.core.views.task_async);
+# only worth it under an ASGI server, under WSGI each request would start an event loop
+TASK_ASYNC_READS = os.getenv("TASK_ASYNC_READS", "0") == "1"
+# Side effects of task transitions, delivered from the outbox by `manage.py run_outbox_worker`
+# (apps.core.outbox): {event type or "*": [dotted paths of handlers called with each OutboxEvent]}
+OUTBOX_WEBHOOK_URL = os.getenv("OUTBOX_WEBHOOK_URL") # POST every event there as JSON
+OUTBOX_WEBHOOK_TIMEOUT = float(os.getenv("OUTBOX_WEBHOOK_TIMEOUT", "5"))
+OUTBOX_HANDLERS = {
+    "*": ["apps.core.outbox.log_event", *(["apps.core.outbox.post_webhook"] if OUTBOX_WEBHOOK_URL else [])],
+}
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10")) # Then the event is kept as failed
+OUTBOX_RETRY_DELAY = float(os.getenv("OUTBOX_RETRY_DELAY", "2")) # Seconds before the first retry, doubled after each
+OUTBOX_MAX_RETRY_DELAY = float(os.getenv("OUTBOX_MAX_RETRY_DELAY", "600"))
+# Claimed events are leased for this long, renewed for the rest of the batch when half of it
+# has gone by: keep it above twice the longest time the handlers take on one event
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
 
 CORS_ALLOWED_ORIGINS = [
   "http://localhost:3000", # React dev server
@@ -125,13 +233,40 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication", # JWT authentication
+        "apps.authentication.authentication.CachedJWTAuthentication", # JWT authentication, users cached
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "apps.core.renderers.FastJSONRenderer", # Same output as JSONRenderer, encoded with orjson
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
 }
 
+# Users resolved by CachedJWTAuthentication: a per-process LRU (short TTL, bounds how long
+# a change made by another process goes unnoticed) in front of the shared cache. Only the
+# id, username and flags are cached, never the password hash. Saves and deletes drop a user;
+# bulk User updates must call apps.authentication.authentication.invalidate_users().
+AUTH_USER_CACHE = os.getenv("AUTH_USER_CACHE", "1") == "1"
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", "300"))
+AUTH_USER_CACHE_LOCAL_TTL = int(os.getenv("AUTH_USER_CACHE_LOCAL_TTL", "5"))
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+
+# Bloom filter of blacklisted refresh tokens (apps.authentication.blacklist)
+AUTH_BLACKLIST_FILTER_CAPACITY = int(os.getenv("AUTH_BLACKLIST_FILTER_CAPACITY", "100000"))
+AUTH_BLACKLIST_FILTER_ERROR_RATE = float(os.getenv("AUTH_BLACKLIST_FILTER_ERROR_RATE", "0.01"))
+AUTH_BLACKLIST_FILTER_REBUILD = int(os.getenv("AUTH_BLACKLIST_FILTER_REBUILD", "3600")) # Seconds
+# Seconds of blacklistings re-read at each sync: keep it above the longest transaction
+# that blacklists a token, plus the clock skew between servers
+AUTH_BLACKLIST_FILTER_SYNC_MARGIN = int(os.getenv("AUTH_BLACKLIST_FILTER_SYNC_MARGIN", "60"))
+
+# User typeahead (/api/auth/users/search/): default and maximum number of results, and
+# how long results are cached (they are also dropped whenever a user changes)
+USER_SEARCH_LIMIT = int(os.getenv("USER_SEARCH_LIMIT", "20"))
+USER_SEARCH_MAX_LIMIT = int(os.getenv("USER_SEARCH_MAX_LIMIT", "50"))
+USER_SEARCH_CACHE_TIMEOUT = int(os.getenv("USER_SEARCH_CACHE_TIMEOUT", "300"))
+
 SIMPLE_JWT = {
      'USER_AUTHENTICATION_RULE': 'rest_framework_simplejwt.authentication.default_user_authentication_rule',
      'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
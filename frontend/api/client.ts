@@ -32,4 +32,35 @@ async function request<T>(path: string, options: RequestInit = {}): Promise<T> {
   return res.json();
 }
 
-export const api = { request };
+// EventSource cannot send an Authorization header: each connection uses a one-time ticket
+// from `${path}ticket/`, so the access token never appears in URLs or logs. A reconnect
+// with a used ticket is refused, so a closed stream is reopened with a new ticket.
+function eventSource(path: string, params: URLSearchParams, listen: (source: EventSource) => void) {
+  let source: EventSource | null = null;
+  let closed = false;
+
+  const connect = async () => {
+    try {
+      const { ticket } = await request<{ ticket: string }>(`${path}ticket/`, { method: "POST" });
+      if (closed) return;
+      params.set("ticket", ticket);
+      source = new EventSource(`${BASE_URL}${path}?${params.toString()}`);
+      source.onerror = () => {
+        if (source?.readyState === EventSource.CLOSED && !closed) setTimeout(connect, 5000);
+      };
+      listen(source);
+    } catch {
+      if (!closed) setTimeout(connect, 5000);
+    }
+  };
+  connect();
+
+  return {
+    close() {
+      closed = true;
+      source?.close();
+    },
+  };
+}
+
+export const api = { request, eventSource };
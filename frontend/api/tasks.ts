@@ -1,8 +1,27 @@
 import { api } from "./client";
-import { Task } from "../types";
+import { Task, TaskChanges, TaskFilters } from "../types";
 
-export function getTasks() {
-  return api.request<Task[]>("/tasks/");
+export function getTasks(filters: TaskFilters = {}) {
+  const params = new URLSearchParams();
+  Object.entries(filters).forEach(([key, value]) => {
+    if (value !== undefined && value !== null && value !== "") params.set(key, String(value));
+  });
+  const query = params.toString();
+  return api.request<Task[]>(`/tasks/${query ? `?${query}` : ""}`);
+}
+
+export function getTaskChanges(since?: string) {
+  return api.request<TaskChanges>(`/tasks/changes/${since ? `?since=${encodeURIComponent(since)}` : ""}`);
+}
+
+export function subscribeTaskEvents(
+  subscription: { tasks?: number[]; assignees?: number[] },
+  listen: (source: EventSource) => void,
+) {
+  const params = new URLSearchParams();
+  subscription.tasks?.forEach((id) => params.append("task", String(id)));
+  subscription.assignees?.forEach((id) => params.append("assignee", String(id)));
+  return api.eventSource("/tasks/events/", params, listen);
 }
 
 export function createTask(payload: Omit<Task, "id" | "createdAt">) {
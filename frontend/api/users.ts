@@ -5,3 +5,9 @@ export function getUsers() {
   return api.request<User[]>("/auth/users/");
 }
 
+
+export function searchUsers(q: string, limit?: number) {
+  const params = new URLSearchParams({ q });
+  if (limit) params.set("limit", String(limit));
+  return api.request<User[]>(`/auth/users/search/?${params}`);
+}
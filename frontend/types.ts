@@ -23,10 +23,35 @@ export interface Task {
   assigned_to: number | null;
   assigned_to_name?: string;
   created_at: string;
+  comment_count?: number;
+  last_comment_at?: string | null;
   comments?: TaskComment[];
   history?: TaskHistory[];
 }
 
+export interface TaskFilters {
+  q?: string;
+  status?: TaskStatus;
+  status__in?: string;
+  priority?: TaskPriority;
+  priority__in?: string;
+  assigned_to?: number;
+  unassigned?: boolean;
+  created_by?: number;
+  created_at_after?: string;
+  created_at_before?: string;
+  updated_at_after?: string;
+  updated_at_before?: string;
+  closed_at_after?: string;
+  closed_at_before?: string;
+}
+
+export interface TaskChanges {
+  cursor: string;
+  has_more: boolean;
+  results: Task[];
+}
+
 export interface User {
   id: number;
   username: string;